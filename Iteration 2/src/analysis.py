@@ -0,0 +1,197 @@
+import re
+from functools import lru_cache
+from typing import Any, Collection, Dict, List, Optional
+
+# Letters kept by the tokenizer (same class the indexer has always used)
+_TOKEN_RE = re.compile(r"[a-zA-ZçğıöşüÇĞİÖŞÜ0-9]+")
+
+# Circumflexed vowels are folded to their plain forms
+_TURKISH_FOLD = str.maketrans({"I": "ı", "İ": "i", "Â": "a", "â": "a", "Î": "i", "î": "i", "Û": "u", "û": "u"})
+
+
+def turkish_lower(text: str) -> str:
+    """
+    Lowercases with Turkish rules: I -> ı and İ -> i. str.lower() turns İ into
+    "i" + U+0307 and I into "i", which splits or merges words.
+    """
+    return text.translate(_TURKISH_FOLD).lower().replace("̇", "")
+
+
+class SurfaceAnalyzer:
+    """
+    Legacy analyzer: str.lower() plus the alphanumeric tokenizer, no stemming.
+    Query terms are looked up exactly as the query writer produced them.
+    """
+
+    NAME: str = "surface"
+
+    def config(self) -> Dict[str, Any]:
+        return {"name": self.NAME}
+
+    def analyze(self, text: str) -> List[str]:
+        return _TOKEN_RE.findall(text.lower())
+
+    def query_terms(self, terms: List[str]) -> List[str]:
+        return list(terms)
+
+    def with_lexicon(self, lexicon: Optional[Collection[str]]) -> "SurfaceAnalyzer":
+        return self
+
+
+class TurkishAnalyzer:
+    """
+    Turkish casefolding, tokenizing and light suffix stripping for index and query terms.
+
+    Inflectional suffixes (plural, possessive, case, copula) are stripped longest first,
+    up to MAX_PASSES times, as long as min_stem_length letters remain. Vowel-initial suffixes
+    only follow a consonant and buffer-consonant ones (s/y/n + vowel) only follow a vowel,
+    so dersinin -> dersi -> ders rather than der. A stem left ending in "ğ" gets its "k"
+    back (yönetmeliğin -> yönetmelik). Tokens with digits (course codes) are never stemmed.
+    Stems are memoized in a bounded LRU cache.
+
+    The rules alone over-stem words that merely end like a suffix (madde -> mad, ofisi -> ofi).
+    With use_lexicon, an analyzer bound to a lexicon by with_lexicon() only stems to a known
+    word: of every form reachable by stripping suffixes (and undoing consonant softening or a
+    dropped vowel: kaydı -> kayd -> kayıt) it keeps the one found in the lexicon after the most
+    strips, then the shortest; a token with no such form is kept as is. The indexer binds the
+    corpus's surface words, queries bind the index's own terms, and both give the same stems
+    for every corpus word.
+    """
+
+    NAME: str = "turkish"
+    MAX_PASSES: int = 4
+    VOWELS: str = "aeıioöuü"
+    PRONOMINAL_N = frozenset({"nı", "ni", "nu", "nü", "na", "ne"})
+    # Final consonants softened before a vowel-initial suffix, mapped back (kitab-ı -> kitap)
+    HARDENED: Dict[str, str] = {"b": "p", "c": "ç", "d": "t", "g": "k", "ğ": "k"}
+    # Narrow vowel dropped before a vowel-initial suffix, by the stem's last vowel (kayd-ı -> kayıt)
+    NARROW_VOWEL: Dict[str, str] = {"a": "ı", "ı": "ı", "e": "i", "i": "i", "o": "u", "u": "u", "ö": "ü", "ü": "ü"}
+
+    SUFFIXES: List[str] = sorted({
+        # plural
+        "lar", "ler", "ları", "leri",
+        # possessive
+        "ımız", "imiz", "umuz", "ümüz", "ınız", "iniz", "unuz", "ünüz",
+        "sı", "si", "su", "sü",
+        # case
+        "ı", "i", "u", "ü", "yı", "yi", "yu", "yü", "nı", "ni", "nu", "nü",
+        "a", "e", "ya", "ye", "na", "ne",
+        "da", "de", "ta", "te", "dan", "den", "tan", "ten",
+        "ın", "in", "un", "ün", "nın", "nin", "nun", "nün",
+        "la", "le", "yla", "yle",
+        # copula
+        "dır", "dir", "dur", "dür", "tır", "tir", "tur", "tür",
+    }, key=len, reverse=True)
+
+    def __init__(self, min_stem_length: int = 3, cache_size: int = 50000, use_lexicon: bool = False,
+                 lexicon: Optional[Collection[str]] = None):
+        self.min_stem_length = min_stem_length
+        self.cache_size = cache_size
+        self.use_lexicon = use_lexicon
+        self.lexicon = lexicon
+        self.stem = lru_cache(maxsize=cache_size)(self._stem)
+
+    def config(self) -> Dict[str, Any]:
+        config: Dict[str, Any] = {"name": self.NAME, "minStemLength": self.min_stem_length}
+        if self.use_lexicon:
+            config["lexicon"] = True
+        return config
+
+    def with_lexicon(self, lexicon: Optional[Collection[str]]) -> "TurkishAnalyzer":
+        """A copy that stems to words of lexicon; analyzers without use_lexicon are returned unchanged."""
+        if not self.use_lexicon or lexicon is None:
+            return self
+        return TurkishAnalyzer(self.min_stem_length, self.cache_size, True, lexicon)
+
+    def tokenize(self, text: str) -> List[str]:
+        return _TOKEN_RE.findall(turkish_lower(text))
+
+    def analyze(self, text: str) -> List[str]:
+        return [self.stem(token) for token in self.tokenize(text)]
+
+    def query_terms(self, terms: List[str]) -> List[str]:
+        """Stems every query term; multi-word synonyms become several terms."""
+        analyzed: List[str] = []
+        for term in terms:
+            analyzed.extend(self.analyze(term))
+        return analyzed
+
+    def _attaches(self, stem: str, suffix: str) -> bool:
+        stem_ends_in_vowel = stem[-1] in self.VOWELS
+        if suffix[0] in self.VOWELS:
+            return not stem_ends_in_vowel
+        if suffix in self.PRONOMINAL_N:
+            # Accusative/dative "n" only follows the 3rd person possessive (sınavı-na)
+            return stem[-1] in "ıiuü"
+        if suffix[0] in "syn" and len(suffix) > 1 and suffix[1] in self.VOWELS:
+            return stem_ends_in_vowel
+        return True
+
+    def _stem(self, token: str) -> str:
+        if any(ch.isdigit() for ch in token):
+            return token
+        if self.lexicon is not None:
+            return self._lexicon_stem(token)
+        word = token
+        for _ in range(self.MAX_PASSES):
+            for suffix in self.SUFFIXES:
+                if word.endswith(suffix) and len(word) - len(suffix) >= self.min_stem_length \
+                        and self._attaches(word[:-len(suffix)], suffix):
+                    word = word[:-len(suffix)]
+                    break
+            else:
+                break
+        if word != token and word.endswith("ğ") and len(word) > self.min_stem_length:
+            word = word[:-1] + "k"
+        return word
+
+    def _lexicon_stem(self, token: str) -> str:
+        depths: Dict[str, int] = {}
+        self._reach(token, 0, depths)
+        known = [(-depth, len(form), form) for form, depth in depths.items() if form in self.lexicon]
+        return min(known)[2] if known else token
+
+    def _reach(self, word: str, depth: int, depths: Dict[str, int]) -> None:
+        """Records every form reachable from word by stripping suffixes, with its largest strip count."""
+        if depths.get(word, -1) >= depth:
+            return
+        depths[word] = depth
+        for suffix in self.SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= self.min_stem_length:
+                stem = word[:-len(suffix)]
+                if self._attaches(stem, suffix):
+                    for form in self._restorations(stem, suffix):
+                        self._reach(form, depth + 1, depths)
+
+    def _restorations(self, stem: str, suffix: str) -> List[str]:
+        """stem plus the forms it may have had before a vowel-initial suffix softened or shortened it."""
+        forms = [stem]
+        if suffix[0] not in self.VOWELS:
+            return forms
+        if stem[-1] in self.HARDENED:
+            forms.append(stem[:-1] + self.HARDENED[stem[-1]])
+        vowels = [ch for ch in stem if ch in self.VOWELS]
+        if vowels and stem[-2] not in self.VOWELS:
+            narrow = self.NARROW_VOWEL[vowels[-1]]
+            forms.extend([f[:-1] + narrow + f[-1] for f in forms])
+        return forms
+
+
+_ANALYZERS: Dict[Any, Any] = {}
+
+
+def get_analyzer(config: Optional[Dict[str, Any]] = None):
+    """
+    Returns the shared analyzer for an index's "analyzer" setting (None = surface).
+    Instances are reused so their stem caches are shared by indexing and querying.
+    """
+    config = config or {"name": SurfaceAnalyzer.NAME}
+    key = tuple(sorted(config.items()))
+    if key not in _ANALYZERS:
+        if config.get("name") == TurkishAnalyzer.NAME:
+            _ANALYZERS[key] = TurkishAnalyzer(config.get("minStemLength", 3), use_lexicon=config.get("lexicon", False))
+        elif config.get("name", SurfaceAnalyzer.NAME) == SurfaceAnalyzer.NAME:
+            _ANALYZERS[key] = SurfaceAnalyzer()
+        else:
+            raise ValueError(f"Unknown analyzer '{config.get('name')}'")
+    return _ANALYZERS[key]
@@ -0,0 +1,140 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class IvfIndex:
+    """
+    IVF-flat approximate nearest-neighbour index over the chunk embedding matrix.
+
+    Chunks are clustered with spherical k-means; each list holds the ordinals of the
+    chunks nearest to one centroid. A query scores the centroids, visits the n_probe
+    closest lists and computes exact cosine similarity only for their members.
+    n_probe is the recall/latency knob: n_probe == n_lists is exact brute force.
+
+    Vectors are not copied into the index; search() reads the rows it needs from the
+    (memory-mapped) embeddings.npy matrix, using the row norms stored at build time.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_ordinals: np.ndarray,
+                 row_norms: np.ndarray, n_probe: int = 8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ordinals = list_ordinals
+        self.row_norms = row_norms
+        self.n_probe = n_probe
+
+    def __repr__(self) -> str:
+        return f"IvfIndex(lists={self.n_lists}, vectors={len(self.row_norms)}, n_probe={self.n_probe})"
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    # --- Build ---
+
+    @staticmethod
+    def default_lists(n_vectors: int) -> int:
+        """Roughly sqrt(N) lists, the usual IVF trade-off between list count and list length."""
+        return max(1, min(n_vectors, int(round(np.sqrt(n_vectors)))))
+
+    @staticmethod
+    def build(vectors: np.ndarray, n_lists: Optional[int] = None, iterations: int = 10,
+              sample_size: int = 256, seed: int = 0, batch_rows: int = 8192) -> "IvfIndex":
+        """
+        Trains centroids on a sample (sample_size points per list) and assigns every row.
+        Rows are processed in batches of batch_rows so a memory-mapped matrix is never fully loaded.
+        """
+        n_vectors = len(vectors)
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        if n_vectors == 0:
+            return IvfIndex(np.zeros((0, dim), dtype=np.float32), np.zeros(1, dtype=np.int64),
+                            np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+
+        n_lists = min(n_vectors, n_lists or IvfIndex.default_lists(n_vectors))
+        row_norms = np.concatenate([
+            np.linalg.norm(np.asarray(vectors[i:i + batch_rows], dtype=np.float32), axis=1)
+            for i in range(0, n_vectors, batch_rows)
+        ]).astype(np.float32)
+
+        rng = np.random.default_rng(seed)
+        nonzero = np.flatnonzero(row_norms > 0)
+        pool = nonzero if len(nonzero) >= n_lists else np.arange(n_vectors)
+        sample_ids = np.sort(rng.choice(pool, size=min(len(pool), n_lists * sample_size), replace=False))
+        sample = IvfIndex._normalized(np.asarray(vectors[sample_ids], dtype=np.float32))
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            # Empty lists keep their previous centroid instead of collapsing to zero
+            filled = counts > 0
+            centroids[filled] = IvfIndex._normalized(sums[filled])
+
+        assign = np.concatenate([
+            np.argmax(IvfIndex._normalized(np.asarray(vectors[i:i + batch_rows], dtype=np.float32)) @ centroids.T, axis=1)
+            for i in range(0, n_vectors, batch_rows)
+        ])
+        list_ordinals = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists)))).astype(np.int64)
+        return IvfIndex(centroids.astype(np.float32), list_offsets, list_ordinals, row_norms)
+
+    @staticmethod
+    def _normalized(rows: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return rows / norms
+
+    # --- Search ---
+
+    def search(self, query: np.ndarray, vectors: np.ndarray, k: int, n_probe: Optional[int] = None,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (ordinals, cosine scores) of up to k nearest chunks, best first
+        (ties broken by ordinal). Zero-norm rows and queries never match, nor do
+        rows outside the optional boolean mask.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        query = np.asarray(query, dtype=np.float32).ravel()
+        q_norm = float(np.linalg.norm(query))
+        if k <= 0 or self.n_lists == 0 or q_norm == 0:
+            return empty
+
+        n_probe = max(1, min(self.n_lists, n_probe or self.n_probe))
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        candidates = np.concatenate([
+            self.list_ordinals[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probed
+        ])
+        keep = self.row_norms[candidates] > 0
+        if mask is not None:
+            keep &= mask[candidates]
+        candidates = candidates[keep]
+        if len(candidates) == 0:
+            return empty
+
+        # Sorted ordinals keep reads from the memory-mapped matrix sequential
+        candidates.sort()
+        scores = (np.asarray(vectors[candidates], dtype=np.float32) @ query) / (self.row_norms[candidates] * q_norm)
+        if k < len(candidates):
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets,
+                     list_ordinals=self.list_ordinals, row_norms=self.row_norms)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str, n_probe: int = 8) -> "IvfIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return IvfIndex(data["centroids"], data["list_offsets"], data["list_ordinals"], data["row_norms"], n_probe)
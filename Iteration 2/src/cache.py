@@ -1,60 +1,783 @@
+import atexit
 import json
 import os
-from typing import Optional, Dict, Any
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 
 from src.models import Answer, Citation
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Lock files of the cache logs this process owns, by path; a forked child starts over
+_log_locks: Dict[str, Any] = {}
+_log_locks_pid: int = os.getpid()
+_log_locks_guard = threading.Lock()
+
+
+def _lock_log(path: str) -> bool:
+    """Takes an exclusive lock on path for this process, or reports that another process holds it."""
+    global _log_locks, _log_locks_pid
+    path = os.path.abspath(path)
+    with _log_locks_guard:
+        if _log_locks_pid != os.getpid():
+            # The inherited lock files share the parent's locks, so the child opens its own
+            _log_locks, _log_locks_pid = {}, os.getpid()
+        if path in _log_locks:
+            return True
+        try:
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            lock_file = open(path, "a+")
+        except OSError:
+            return False
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            return False
+        _log_locks[path] = lock_file
+        return True
+
+
+class AppendLogStore:
+    """
+    Persists cache entries as an append-only JSON-lines log.
+
+    Every put appends one {"key", "cited", "entry"} record and every delete a {"key", "deleted"}
+    tombstone; later records win. Records are queued and written in batches by a background
+    thread (every flush_interval seconds, or as soon as batch_size records are waiting), so a
+    cache miss never pays for rewriting the whole cache.
+
+    The log is read lazily: open() scans it once and keeps only an index of the byte offset of
+    each key's latest record, decoding just the key at the start of every line. get() decodes
+    one record when it is looked up. The store is bounded by max_entries: past that (plus a
+    tenth of slack) the least recently written keys are dropped. The log is rewritten from the
+    indexed records, copied byte for byte, once it holds more than compact_ratio records per
+    live entry or after keys were dropped.
+
+    The log belongs to one process, since compaction rewrites it from that process's index and
+    a second writer's records would be lost. The first process to use it takes an exclusive lock
+    on path + ".lock"; any other process can still read the log but writes nothing and is told
+    to use a SqliteStore instead.
+    """
+
+    shared = False  # QueryCache deletes expired and stale entries, since no other process reads the log
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, path: str = "data/query_cache.jsonl", flush_interval: float = 0.5, batch_size: int = 64,
+                 compact_ratio: float = 2.0, min_compact_records: int = 256, max_entries: int = 100000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        self.max_entries = max_entries
+        self.records = 0  # records in the log file, live or superseded
+        # key -> (offset, length, cited) of its latest record, least recently written first;
+        # cited is None for records written before the flag existed
+        self._index: "OrderedDict[str, Tuple[int, int, Optional[bool]]]" = OrderedDict()
+        self._opened = False
+        # (key, line, cited, entry) of queued records; cited and entry are None for a tombstone
+        self._pending: List[Tuple[str, str, Optional[bool], Optional[Dict[str, Any]]]] = []
+        self._pending_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._torn_tail = False
+        self._closed = False
+        self._owner_pid: Optional[int] = None
+        self._owner = False
+        self._exit_hook = False  # close() is registered with atexit only while records may be queued
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def owns_log(self) -> bool:
+        """Takes the log's lock on first use in each process; False if another process holds it."""
+        if self._owner_pid == os.getpid():
+            return self._owner
+        self._owner_pid = os.getpid()
+        self._owner = _lock_log(self.path + ".lock")
+        if not self._owner:
+            print(f"⚠️ Cache log {self.path} is in use by another process; this one will not write to it. "
+                  f"Set cache.backend to \"sqlite\" to share the cache between processes.")
+        return self._owner
+
+    # --- Reading ---
+
+    def open(self) -> None:
+        """Indexes the log (once). A torn last line (crash mid-write) is skipped."""
+        self.owns_log()
+        with self._io_lock:
+            self._open_locked()
+
+    def _open_locked(self) -> None:
+        if self._opened:
+            return
+        self._opened = True
+        self._index.clear()
+        self.records = 0
+        if not self.exists():
+            return
+        try:
+            with open(self.path, "rb") as f:
+                offset = 0
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        self._torn_tail = True
+                        break
+                    head = self._parse_head(raw)
+                    if head is not None:
+                        key, deleted, cited = head
+                        self.records += 1
+                        self._index.pop(key, None)
+                        if not deleted:
+                            self._index[key] = (offset, len(raw), cited)
+                    offset += len(raw)
+        except IOError as e:
+            print(f"Warning: Failed to load cache from {self.path}. Error: {e}")
+
+    @classmethod
+    def _parse_head(cls, raw: bytes) -> Optional[Tuple[str, bool, Optional[bool]]]:
+        """(key, deleted, cited) of a record line, decoding only its key when it has the layout this store writes."""
+        try:
+            line = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+        if line.startswith('{"key":"'):
+            try:
+                key, end = cls._decoder.raw_decode(line, 7)
+            except ValueError:
+                return None
+            rest = line[end:end + 16]
+            if rest.startswith(',"deleted":true'):
+                return key, True, None
+            if rest.startswith(',"cited":true,'):
+                return key, False, True
+            if rest.startswith(',"cited":false,'):
+                return key, False, False
+        # Any other layout (such as records from before the cited flag) is decoded in full
+        try:
+            record: Any = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(record, dict) or not isinstance(record.get("key"), str):
+            return None
+        if record.get("deleted"):
+            return record["key"], True, None
+        if isinstance(record.get("entry"), dict):
+            return record["key"], False, record.get("cited")
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The latest entry of key, queued or on disk, decoding only its own record."""
+        with self._io_lock:
+            self._open_locked()
+            with self._pending_lock:
+                for pending_key, _, _, entry in reversed(self._pending):
+                    if pending_key == key:
+                        return entry
+            ref = self._index.get(key)
+            if ref is None:
+                return None
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(ref[0])
+                    raw = f.read(ref[1])
+                record: Any = json.loads(raw.decode("utf-8"))
+            except (IOError, UnicodeDecodeError, json.JSONDecodeError) as e:
+                print(f"Warning: Failed to read cache entry from {self.path}. Error: {e}")
+                return None
+        # The owner may have compacted the log under a reader in another process
+        if not isinstance(record, dict) or record.get("key") != key or not isinstance(record.get("entry"), dict):
+            return None
+        return record["entry"]
+
+    def cited_keys(self) -> List[str]:
+        """Keys whose entry has citations (or was written before that was recorded), for the semantic tier."""
+        with self._io_lock:
+            self._open_locked()
+            keys = {key: None for key, (_, _, cited) in self._index.items() if cited is not False}
+            with self._pending_lock:
+                for key, _, cited, _ in self._pending:
+                    if cited:
+                        keys[key] = None
+                    else:
+                        keys.pop(key, None)
+        return list(keys)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Every live entry, decoded; QueryCache itself reads entries one at a time with get()."""
+        self.open()
+        entries: Dict[str, Dict[str, Any]] = {}
+        with self._io_lock:
+            keys = list(self._index)
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    # --- Writing ---
+
+    def append(self, key: str, entry: Dict[str, Any]) -> None:
+        cited = bool(entry.get("citations"))
+        self._enqueue(key, {"key": key, "cited": cited, "entry": entry}, cited, entry)
+
+    def delete(self, key: str) -> None:
+        self._enqueue(key, {"key": key, "deleted": True}, None, None)
+
+    def _enqueue(self, key: str, record: Dict[str, Any], cited: Optional[bool],
+                 entry: Optional[Dict[str, Any]]) -> None:
+        if not self.owns_log():
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._pending_lock:
+            self._pending.append((key, line, cited, entry))
+            waiting = len(self._pending)
+            if not self._closed:
+                self._start_worker()
+        if self._closed:
+            self.flush()
+            return
+        if waiting >= self.batch_size:
+            self._wakeup.set()
+
+    def _start_worker(self) -> None:
+        """Starts the writer thread if it is not running; called with _pending_lock held."""
+        # A forked child does not inherit the thread, so it is restarted on demand
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="query-cache-writer", daemon=True)
+            self._worker.start()
+        if not self._exit_hook:
+            atexit.register(self.close)
+            self._exit_hook = True
+
+    def _run(self) -> None:
+        # The thread exits once a whole interval passes without records, so an idle store
+        # holds no thread and no atexit entry and can be garbage-collected
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            with self._pending_lock:
+                if self._closed or not self._pending:
+                    self._worker = None
+                    self._release_exit_hook()
+                    return
+            self.flush()
+
+    def _release_exit_hook(self) -> None:
+        if self._exit_hook:
+            atexit.unregister(self.close)
+            self._exit_hook = False
+
+    def flush(self) -> None:
+        """Writes all queued records now, then bounds and compacts the log when needed."""
+        with self._io_lock:
+            self._open_locked()
+            with self._pending_lock:
+                batch = self._pending
+            if not batch:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    if self._torn_tail:
+                        f.write(b"\n")
+                        offset += 1
+                        self._torn_tail = False
+                    data = [(line + "\n").encode("utf-8") for _, line, _, _ in batch]
+                    f.write(b"".join(data))
+            except IOError as e:
+                print(f"Error: Could not save cache to {self.path}. Error: {e}")
+                return
+            finally:
+                # Queued records stay readable through get() until the index points at them
+                with self._pending_lock:
+                    self._pending = self._pending[len(batch):]
+
+            for (key, _, cited, _), raw in zip(batch, data):
+                self._index.pop(key, None)
+                if cited is not None:
+                    self._index[key] = (offset, len(raw), cited)
+                offset += len(raw)
+            self.records += len(batch)
+
+            trimmed = len(self._index) > self.max_entries + self.max_entries // 10
+            while len(self._index) > self.max_entries:
+                self._index.popitem(last=False)
+            if trimmed or (self.records >= self.min_compact_records
+                           and self.records > self.compact_ratio * max(1, len(self._index))):
+                self._rewrite()
+
+    def compact(self, entries: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Rewrites the log with one record per live entry, or with entries (used to import the legacy file)."""
+        if not self.owns_log():
+            return
+        with self._io_lock:
+            if entries is None:
+                self._open_locked()
+                self._rewrite()
+                return
+            self._opened = True
+            lines = [json.dumps({"key": key, "cited": bool(entry.get("citations")), "entry": entry},
+                                ensure_ascii=False, separators=(",", ":")) + "\n"
+                     for key, entry in entries.items()]
+            self._replace([line.encode("utf-8") for line in lines], list(entries),
+                          [bool(entry.get("citations")) for entry in entries.values()])
+
+    def _rewrite(self) -> None:
+        # Records queued meanwhile are still pending and get appended to the new file
+        keys = list(self._index)
+        try:
+            with open(self.path, "rb") as f:
+                data = []
+                for key in keys:
+                    offset, length, _ = self._index[key]
+                    f.seek(offset)
+                    data.append(f.read(length))
+        except IOError as e:
+            print(f"Error: Could not compact cache file {self.path}. Error: {e}")
+            return
+        self._replace(data, keys, [self._index[key][2] for key in keys])
+
+    def _replace(self, data: List[bytes], keys: List[str], cited: List[Optional[bool]]) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(b"".join(data))
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print(f"Error: Could not compact cache file {self.path}. Error: {e}")
+            return
+        self._index.clear()
+        offset = 0
+        for key, raw, flag in zip(keys, data, cited):
+            self._index[key] = (offset, len(raw), flag)
+            offset += len(raw)
+        self.records = len(keys)
+        self._torn_tail = False
+
+    def close(self) -> None:
+        """Stops the writer thread and flushes what is still queued."""
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+        with self._pending_lock:
+            self._release_exit_hook()
+
+
+class SqliteStore:
+    """
+    Persists cache entries in a SQLite database that several processes can share.
+
+    The database runs in WAL mode, so readers never wait for a writer and see a consistent
+    snapshot. Every put or delete is one short transaction; SQLite's file locks order the
+    writers of all processes, and busy_timeout makes a writer wait for a competing one
+    instead of failing. Nothing is read up front: get() is an indexed lookup of one row, so
+    one worker also serves the answers another has cached since it started.
+
+    The database is bounded by its own policy, not by any worker's memory bounds: every
+    prune_interval writes, a worker deletes the expired rows and then the least recently
+    written ones beyond max_rows.
+
+    Each thread (and each forked process) opens its own connection.
+    """
+
+    shared = True  # QueryCache evicts from memory only; other workers may still serve the rows
+
+    def __init__(self, path: str = "data/query_cache.sqlite", busy_timeout: float = 5.0,
+                 max_rows: int = 100000, prune_interval: int = 256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.max_rows = max_rows
+        self.prune_interval = max(1, prune_interval)
+        self._writes = 0
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                     "(key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires_at REAL, cited INTEGER)")
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(entries)")]
+        # cited stays NULL (unknown) for rows written before the column existed
+        for column, kind in (("expires_at", "REAL"), ("cited", "INTEGER")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE entries ADD COLUMN {column} {kind}")
+        conn.commit()
+        self._local.conn, self._local.pid = conn, os.getpid()
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def open(self) -> None:
+        """Opens this thread's connection (creating the schema); no row is read."""
+        try:
+            self._connection()
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to open cache database {self.path}. Error: {e}")
+
+    def cited_keys(self) -> List[str]:
+        """Keys whose entry has citations (or was written before that was recorded), for the semantic tier."""
+        try:
+            return [key for (key,) in self._connection().execute(
+                "SELECT key FROM entries WHERE cited IS NOT 0 ORDER BY rowid")]
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to load cache keys from {self.path}. Error: {e}")
+            return []
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """All stored entries in insertion order (QueryCache reads them one at a time with get())."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            for key, raw in self._connection().execute("SELECT key, entry FROM entries ORDER BY rowid"):
+                entry = self._decode(raw)
+                if entry is not None:
+                    entries[key] = entry
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to load cache from {self.path}. Error: {e}")
+        return entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._connection().execute("SELECT entry FROM entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Warning: Failed to read cache entry from {self.path}. Error: {e}")
+            return None
+        return self._decode(row[0]) if row else None
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            entry: Any = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def append(self, key: str, entry: Dict[str, Any]) -> None:
+        # REPLACE deletes the old row, so the rowid orders rows by their last write
+        self._write("INSERT OR REPLACE INTO entries (key, entry, expires_at, cited) VALUES (?, ?, ?, ?)",
+                    [self._row(key, entry)])
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self.prune()
+
+    @staticmethod
+    def _row(key: str, entry: Dict[str, Any]) -> Tuple[Any, ...]:
+        return (key, json.dumps(entry, ensure_ascii=False, separators=(",", ":")), entry.get("expiresAt"),
+                int(bool(entry.get("citations"))))
+
+    def prune(self) -> None:
+        """Deletes expired rows, then the least recently written rows beyond max_rows."""
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+                conn.execute("DELETE FROM entries WHERE rowid IN "
+                             "(SELECT rowid FROM entries ORDER BY rowid DESC LIMIT -1 OFFSET ?)", (self.max_rows,))
+        except sqlite3.Error as e:
+            print(f"Error: Could not prune cache database {self.path}. Error: {e}")
+
+    def delete(self, key: str) -> None:
+        self._write("DELETE FROM entries WHERE key = ?", [(key,)])
+
+    def compact(self, entries: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """Replaces the stored entries with entries in one transaction (used to import the legacy file)."""
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM entries")
+                conn.executemany("INSERT INTO entries (key, entry, expires_at, cited) VALUES (?, ?, ?, ?)",
+                                 [self._row(key, entry) for key, entry in (entries or {}).items()])
+        except sqlite3.Error as e:
+            print(f"Error: Could not rewrite cache database {self.path}. Error: {e}")
+
+    def _write(self, sql: str, rows: List[Tuple[Any, ...]]) -> None:
+        conn = self._connection()
+        try:
+            with conn:
+                conn.executemany(sql, rows)
+        except sqlite3.Error as e:
+            print(f"Error: Could not save cache to {self.path}. Error: {e}")
+
+    def flush(self) -> None:
+        """Every write is committed when it is made."""
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+class LruOrder:
+    """Eviction order for policy "lru": least recently used key first."""
+
+    def __init__(self):
+        self._keys: "OrderedDict[str, None]" = OrderedDict()
+
+    def touch(self, key: str) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        self._keys.pop(key, None)
+
+    def victim(self) -> str:
+        return next(iter(self._keys))
+
+
+class LfuOrder:
+    """
+    Eviction order for policy "lfu": fewest uses first, least recently used among equal counts.
+    Keys are kept in one insertion-ordered bucket per use count, so every operation is O(1).
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = {}
+        self._min_count = 0
+
+    def touch(self, key: str) -> None:
+        count = self._counts.get(key, 0)
+        if count:
+            self._unlink(key, count)
+            if self._min_count == count and count not in self._buckets:
+                self._min_count = count + 1
+        else:
+            self._min_count = 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+
+    def remove(self, key: str) -> None:
+        count = self._counts.pop(key, None)
+        if count is not None:
+            self._unlink(key, count)
+
+    def victim(self) -> str:
+        if self._min_count not in self._buckets:
+            self._min_count = min(self._buckets)
+        return next(iter(self._buckets[self._min_count]))
+
+    def _unlink(self, key: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+
+class IndexGeneration:
+    """
+    Generation ID and docId -> version map of an index build, read from the indexer's manifest.
+
+    stamp is the build the pipeline loaded at startup; new cache entries record the versions
+    of the documents they cite from it. live() re-reads the manifest when its modification
+    time changes (checked at most every check_interval seconds), so a rebuild by another
+    process invalidates cached answers without restarting the pipeline. Without a manifest
+    (or one written before builds were versioned) the generation is None.
+    """
+
+    def __init__(self, manifest_path: str = "data/manifest.json", check_interval: float = 1.0):
+        self.manifest_path = manifest_path
+        self.check_interval = check_interval
+        self._mtime: Optional[int] = None
+        self._checked: float = 0.0
+        self._live: Tuple[Optional[str], Dict[str, str]] = (None, {})
+        self._refresh()
+        self.stamp: Tuple[Optional[str], Dict[str, str]] = self._live
+
+    def live(self) -> Tuple[Optional[str], Dict[str, str]]:
+        """(generation, versions) of the build currently on disk."""
+        if time.monotonic() - self._checked >= self.check_interval:
+            self._refresh()
+        return self._live
+
+    def _refresh(self) -> None:
+        self._checked = time.monotonic()
+        try:
+            mtime: Optional[int] = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            self._live = (None, {})
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._live = (manifest.get("generation"), dict(manifest.get("documents") or {}))
+        except (json.JSONDecodeError, IOError, AttributeError) as e:
+            print(f"⚠️ WARNING: Could not read index generation from {self.manifest_path}. {e}")
+            self._mtime = None  # retried at the next check
+
+
+class CacheStripe:
+    """
+    One shard of QueryCache: the entries whose keys hash to it, their sizes and eviction
+    order, its share of the bounds and its counters, all guarded by its own lock.
+
+    Changes for the semantic tier are queued here under the lock and applied after it is
+    released; semantic_sync keeps them in queue order without blocking the stripe.
+    """
+
+    COUNTERS: Tuple[str, ...] = ("hits", "misses", "semanticHits", "evictions", "expirations", "invalidations")
+
+    def __init__(self, policy: str, max_entries: int, max_bytes: int):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.order = LruOrder() if policy == "lru" else LfuOrder()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.counters: Dict[str, int] = dict.fromkeys(self.COUNTERS, 0)
+        self.semantic_changes: List[Tuple[str, bool]] = []  # (key, added) for the semantic tier
+        self.semantic_sync = threading.Lock()
+
 
 class QueryCache:
     """
     Handles persistent caching of query results to improve performance
     and reduce redundant pipeline executions.
+
+    Entries are persisted through a store: an AppendLogStore for one process, or a SqliteStore
+    shared by several worker processes. Memory holds the entries looked up or put since
+    startup; any other entry is read from the store, one at a time, on its first lookup, so
+    opening the cache never decodes the whole store. A cache saved in the legacy single-JSON
+    format (legacy_file) is imported the first time the store does not exist.
+
+    Entries are split over stripes by key hash, each with its own lock, so threads only
+    contend when their keys share a stripe; a lookup never takes a cache-wide lock. The
+    semantic tier is never touched while a stripe lock is held: stripes queue its changes
+    and apply them once the lock is released, and it embeds outside its own lock.
+
+    Memory is bounded by max_entries and max_bytes (serialized entry size, both split evenly
+    over the stripes) and evicts by policy "lru" or "lfu" within a stripe; an evicted entry
+    stays in the store, which is bounded by its own policy. Entries expire after ttl_seconds
+    (None = never); answers without citations, such as "Bilgi bulunamadı.", expire after
+    negative_ttl_seconds so a later index can answer them. Expired and stale entries are
+    deleted from a store owned by this process; a shared store (SqliteStore) prunes its rows
+    itself, so one worker never deletes rows the others still serve.
+
+    With a semantic tier (SemanticCache), get_similar() also serves paraphrases of cached
+    questions; only answers with citations are offered to it. It is seeded with the store's
+    keys (not its entries) when the cache opens, and only when it is enabled.
+
+    With versions (IndexGeneration), each entry records the generation it was answered on
+    and the version of every document it cites. An entry is served only while those documents
+    still have the same version in the live manifest; answers without citations depend on
+    the whole index and are kept for one generation only. Stale entries are dropped lazily
+    when they are looked up, so a rebuild keeps the answers of unchanged documents.
     """
 
-    def __init__(self, cache_file: str = "data/query_cache.json") -> None:
+    def __init__(self, cache_file: str = "data/query_cache.jsonl", legacy_file: Optional[str] = "data/query_cache.json",
+                 store=None, max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024,
+                 policy: str = "lru", ttl_seconds: Optional[float] = None, negative_ttl_seconds: float = 300.0,
+                 semantic=None, versions: Optional[IndexGeneration] = None, stripes: int = 1) -> None:
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache eviction policy '{policy}'")
         self.cache_file: str = cache_file
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.load()
+        self.legacy_file: Optional[str] = legacy_file
+        self.store = store or AppendLogStore(cache_file)
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.policy: str = policy
+        self.ttl_seconds: Optional[float] = ttl_seconds
+        self.negative_ttl_seconds: float = negative_ttl_seconds
+        self.semantic = semantic
+        self.versions: Optional[IndexGeneration] = versions
+        self.stripes: int = max(1, stripes)
+        self._stripes: List[CacheStripe] = self._new_stripes()
+        self._load_lock = threading.Lock()
+        self._loaded: bool = False
+
+    def _new_stripes(self) -> List[CacheStripe]:
+        return [CacheStripe(self.policy, -(-self.max_entries // self.stripes), -(-self.max_bytes // self.stripes))
+                for _ in range(self.stripes)]
+
+    def _stripe(self, key: str) -> CacheStripe:
+        return self._stripes[hash(key) % len(self._stripes)]
 
     def load(self) -> None:
         """
-        Loads the cache from a JSON file.
+        Opens the store (importing the legacy JSON file if there is no store yet) and seeds
+        the semantic tier with the keys of the cached answers that have citations.
 
-        If the file does not exist or is corrupted, an empty cache
-        is initialized to ensure system robustness.
+        Entries themselves are read on their first lookup. If the files do not exist or
+        are corrupted, the cache starts empty to ensure system robustness.
         """
-        if not os.path.exists(self.cache_file):
-            self.cache = {}
-            return
+        if not self.store.exists() and self.legacy_file and os.path.exists(self.legacy_file):
+            entries = self._load_legacy()
+            if entries:
+                self.store.compact(entries)
+        self.store.open()
 
+        self._stripes = self._new_stripes()
+        if self.semantic is not None:
+            self.semantic.clear()
+            for key in self.store.cited_keys():
+                self.semantic.add(key)
+        self._loaded = True
+
+    def _load_legacy(self) -> Dict[str, Dict[str, Any]]:
         try:
-            with open(self.cache_file, "r", encoding="utf-8") as f:
+            with open(self.legacy_file, "r", encoding="utf-8") as f:
                 loaded: Any = json.load(f)
                 if isinstance(loaded, dict):
-                    self.cache = loaded
-                else:
-                    # Unexpected JSON structure
-                    print(f"Warning: Cache file format invalid. Resetting cache.")
-                    self.cache = {}
+                    return loaded
+                # Unexpected JSON structure
+                print(f"Warning: Cache file format invalid. Resetting cache.")
         except (json.JSONDecodeError, IOError) as e:
-            print(f"Warning: Failed to load cache from {self.cache_file}. Error: {e}")
-            self.cache = {}
+            print(f"Warning: Failed to load cache from {self.legacy_file}. Error: {e}")
+        return {}
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load()
 
     def save(self) -> None:
         """
-        Saves the current cache state to disk.
-
-        Automatically creates the target directory if it does not exist.
+        Writes every queued entry to disk now instead of waiting for the background flush.
         """
-        try:
-            directory: str = os.path.dirname(self.cache_file)
-            if directory:
-                os.makedirs(directory, exist_ok=True)
-
-            with open(self.cache_file, "w", encoding="utf-8") as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"Error: Could not save cache to {self.cache_file}. Error: {e}")
+        self.store.flush()
 
     def get(self, question: str) -> Optional[Answer]:
         """
@@ -63,9 +786,56 @@ class QueryCache:
         Returns:
             Answer if present and valid, otherwise None.
         """
+        self._ensure_loaded()
         key: str = question.strip().lower()
-        data: Optional[Dict[str, Any]] = self.cache.get(key)
+        stripe = self._stripe(key)
+        answer = self._answer(stripe, key)
+        with stripe.lock:
+            stripe.counters["misses" if answer is None else "hits"] += 1
+        return answer
+
+    def get_similar(self, question: str) -> Optional[Tuple[Answer, str, float]]:
+        """
+        Looks a question up in the semantic tier.
+
+        Returns:
+            (Answer, cached question, cosine) for the best paraphrase, otherwise None.
+        """
+        if self.semantic is None:
+            return None
+        self._ensure_loaded()
+        match = self.semantic.lookup(question.strip().lower())
+        if match is None:
+            return None
+        key, score = match
+        stripe = self._stripe(key)
+        answer = self._answer(stripe, key, semantic_match=True)
+        if answer is None or not answer.citations:
+            return None
+        with stripe.lock:
+            stripe.counters["semanticHits"] += 1
+        return answer, key, score
 
+    def _answer(self, stripe: CacheStripe, key: str, semantic_match: bool = False) -> Optional[Answer]:
+        with stripe.lock:
+            data = self._live_entry(stripe, key)
+        if data is None:
+            # Not looked up since startup, evicted from memory, or cached since by another worker
+            stored = self.store.get(key)
+            with stripe.lock:
+                if stored is None:
+                    if semantic_match and key not in stripe.entries:
+                        # Pruned from the store (or never had citations): forget it in the semantic tier
+                        stripe.semantic_changes.append((key, False))
+                else:
+                    if key not in stripe.entries:
+                        self._insert(stripe, key, stored)
+                    # Checked before evicting, which may pick the entry just read (LFU, oversized)
+                    data = self._live_entry(stripe, key)
+                    self._evict(stripe)
+                if semantic_match and data is not None and not data.get("citations"):
+                    stripe.semantic_changes.append((key, False))
+        self._sync_semantic(stripe)
         if data is None:
             return None
 
@@ -83,18 +853,175 @@ class QueryCache:
             print(f"Error: Malformed cache entry for key '{key}'. Error: {e}")
             return None
 
+    def _live_entry(self, stripe: CacheStripe, key: str) -> Optional[Dict[str, Any]]:
+        """The entry of key if it is still valid, dropping it when expired or stale. Caller holds stripe.lock."""
+        data: Optional[Dict[str, Any]] = stripe.entries.get(key)
+        if data is None:
+            return None
+        if self._expired(data, time.time()):
+            self._drop(stripe, key)
+            stripe.counters["expirations"] += 1
+            return None
+        if not self._current(data):
+            self._drop(stripe, key)
+            stripe.counters["invalidations"] += 1
+            return None
+        stripe.order.touch(key)
+        return data
+
     def put(self, question: str, answer: Answer) -> None:
         """
-        Stores an Answer object in the cache and persists it to disk.
+        Stores an Answer object in the cache and writes it to the store.
         """
+        self._ensure_loaded()
         key: str = question.strip().lower()
 
         try:
-            self.cache[key] = {
+            entry = {
                 "finalText": answer.finalText,
                 "citations": [c.__dict__ for c in answer.citations]
             }
-            self.save()
+            ttl = self.ttl_seconds if answer.citations else self.negative_ttl_seconds
+            if ttl is not None:
+                entry["expiresAt"] = time.time() + ttl
+            if self.versions is not None and self.versions.stamp[0] is not None:
+                generation, versions = self.versions.stamp
+                entry["generation"] = generation
+                entry["docs"] = {c.docId: versions.get(c.docId) for c in answer.citations}
         except AttributeError as e:
             # Defensive programming: Answer object is not well-formed
             print(f"Error: Failed to cache answer for key '{key}'. Error: {e}")
+            return
+
+        stripe = self._stripe(key)
+        with stripe.lock:
+            if key in stripe.entries:
+                self._discard(stripe, key)
+            # Writing under the stripe lock keeps the store's order of writes to a key
+            self.store.append(key, entry)
+            if self.semantic is not None:
+                stripe.semantic_changes.append((key, bool(answer.citations)))
+            if self._entry_bytes(key, entry) <= stripe.max_bytes:
+                self._insert(stripe, key, entry)
+                self._evict(stripe)
+        self._sync_semantic(stripe)
+
+    # --- Bounds and eviction ---
+
+    @staticmethod
+    def _entry_bytes(key: str, entry: Dict[str, Any]) -> int:
+        return len(key.encode("utf-8")) + len(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def _expired(entry: Dict[str, Any], now: float) -> bool:
+        expires_at = entry.get("expiresAt")
+        return expires_at is not None and expires_at <= now
+
+    def _current(self, entry: Dict[str, Any]) -> bool:
+        """False when a document the entry depends on has changed since it was cached."""
+        if self.versions is None:
+            return True
+        generation, versions = self.versions.live()
+        if generation is None:
+            return True
+        docs = entry.get("docs")
+        if docs is None:
+            # Cached before builds were versioned: nothing says which index answered it
+            return False
+        if not docs:
+            return entry.get("generation") == generation
+        return all(versions.get(doc_id) == version for doc_id, version in docs.items())
+
+    # The helpers below are called with stripe.lock held
+
+    def _insert(self, stripe: CacheStripe, key: str, entry: Dict[str, Any]) -> None:
+        size = self._entry_bytes(key, entry)
+        stripe.entries[key] = entry
+        stripe.sizes[key] = size
+        stripe.bytes += size
+        stripe.order.touch(key)
+
+    def _discard(self, stripe: CacheStripe, key: str) -> None:
+        """Drops a key from memory only; the store and the semantic tier keep it."""
+        stripe.entries.pop(key, None)
+        stripe.bytes -= stripe.sizes.pop(key, 0)
+        stripe.order.remove(key)
+
+    def _drop(self, stripe: CacheStripe, key: str) -> None:
+        """Forgets an expired or stale entry; a shared store prunes its row itself."""
+        self._discard(stripe, key)
+        if self.semantic is not None:
+            stripe.semantic_changes.append((key, False))
+        if not self.store.shared:
+            self.store.delete(key)
+
+    def _evict(self, stripe: CacheStripe) -> None:
+        while stripe.entries and (len(stripe.entries) > stripe.max_entries or stripe.bytes > stripe.max_bytes):
+            self._discard(stripe, stripe.order.victim())
+            stripe.counters["evictions"] += 1
+
+    def _sync_semantic(self, stripe: CacheStripe) -> None:
+        """Applies the stripe's queued semantic-tier changes; called without stripe.lock held."""
+        if self.semantic is None:
+            return
+        with stripe.semantic_sync:
+            with stripe.lock:
+                changes, stripe.semantic_changes = stripe.semantic_changes, []
+            for key, added in changes:
+                if added:
+                    self.semantic.add(key)
+                else:
+                    self.semantic.remove(key)
+
+    # --- Metrics ---
+
+    @property
+    def cache(self) -> Dict[str, Dict[str, Any]]:
+        """A copy of the entries of every stripe."""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for stripe in self._stripes:
+            merged.update(stripe.entries)
+        return merged
+
+    @property
+    def bytes(self) -> int:
+        return sum(stripe.bytes for stripe in self._stripes)
+
+    def _count(self, name: str) -> int:
+        return sum(stripe.counters[name] for stripe in self._stripes)
+
+    @property
+    def hits(self) -> int:
+        return self._count("hits")
+
+    @property
+    def misses(self) -> int:
+        return self._count("misses")
+
+    @property
+    def semantic_hits(self) -> int:
+        return self._count("semanticHits")
+
+    @property
+    def evictions(self) -> int:
+        return self._count("evictions")
+
+    @property
+    def expirations(self) -> int:
+        return self._count("expirations")
+
+    @property
+    def invalidations(self) -> int:
+        return self._count("invalidations")
+
+    def stats(self) -> Dict[str, int]:
+        counts = {name: self._count(name) for name in CacheStripe.COUNTERS}
+        counts.update(entries=sum(len(stripe.entries) for stripe in self._stripes), bytes=self.bytes)
+        return counts
+
+    def summary(self) -> str:
+        """Counters as reported in CACHE trace events."""
+        return " ".join(f"{name}={value}" for name, value in self.stats().items())
+
+    def close(self) -> None:
+        self.store.close()
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
+import numpy as np
 from .models import Intent, Hit, KeywordIndex, Answer
 
 class IntentDetector(ABC):
@@ -14,7 +15,12 @@ class QueryWriter(ABC):
 
 class Retriever(ABC):
     @abstractmethod
-    def retrieve(self, query_terms: List[str], index: KeywordIndex) -> List[Hit]:
+    def retrieve(self, query_terms: List[str], index: KeywordIndex, top_k: Optional[int] = None,
+                 chunk_mask: Optional[np.ndarray] = None) -> List[Hit]:
+        """
+        Returns hits sorted best-first; at most top_k of them when top_k is given.
+        chunk_mask (bool per chunk ordinal) restricts the candidates to the chunks it marks.
+        """
         pass
 
 class Reranker(ABC):
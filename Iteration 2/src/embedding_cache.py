@@ -0,0 +1,180 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of sentence embeddings: an in-memory LRU tier in front of SQLite.
+
+    Keys are SHA-256 digests of the model name plus the normalized text (the exact string
+    the model would encode), so a cached vector is only ever reused for the same model.
+    Vectors are stored as float32 blobs. The disk tier holds at most max_entries rows;
+    when it grows past that, the least recently used rows are evicted.
+
+    One connection is shared by the pipeline threads (guarded by a lock); indexer worker
+    processes open their own, and SQLite's file locking serializes their writes.
+    """
+
+    DEFAULT_PATH: str = "data/embedding_cache.sqlite"
+
+    def __init__(self, path: str = DEFAULT_PATH, model_name: str = "", memory_items: int = 4096,
+                 max_entries: int = 50000):
+        self.path = path
+        self.model_name = model_name
+        self.memory_items = memory_items
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = -1
+        self._rows = 0  # disk row count, refreshed from SQLite before evicting
+
+    # --- Keys ---
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Same cleanup get_embedding applies before encoding."""
+        return text.replace("\n", " ").strip()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{self.normalize(text)}".encode("utf-8")).digest()
+
+    # --- Lookups ---
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        return self.get_many([text]).get(0)
+
+    def get_many(self, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Returns {position in texts: vector} for every text already cached."""
+        found: Dict[int, np.ndarray] = {}
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            missing: Dict[bytes, List[int]] = {}
+            for i, key in enumerate(keys):
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vec
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                rows = self._select(list(missing))
+                for key, vec in rows.items():
+                    self._remember(key, vec)
+                    for i in missing[key]:
+                        found[i] = vec
+                    self.disk_hits += len(missing[key])
+                self.misses += sum(len(v) for k, v in missing.items() if k not in rows)
+        return found
+
+    def put_many(self, texts: List[str], vectors: List[np.ndarray]) -> None:
+        rows = []
+        with self._lock:
+            for text, vec in zip(texts, vectors):
+                key = self.key(text)
+                arr = np.asarray(vec, dtype=np.float32)
+                self._remember(key, arr)
+                rows.append((key, arr.tobytes()))
+            self._insert(rows)
+
+    def put(self, text: str, vector: np.ndarray) -> None:
+        self.put_many([text], [vector])
+
+    def stats(self) -> Dict[str, int]:
+        return {"memoryHits": self.memory_hits, "diskHits": self.disk_hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+    def _remember(self, key: bytes, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # --- SQLite tier ---
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        # A connection must not cross a fork, so worker processes reopen the file
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                         "(key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            conn.commit()
+            (self._rows,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ WARNING: Embedding cache disabled, could not open {self.path}. {e}")
+            self.path = ""
+            return None
+        self._conn, self._pid = conn, os.getpid()
+        return conn
+
+    def _select(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        conn = self._connection() if self.path else None
+        if conn is None:
+            return {}
+        rows: Dict[bytes, np.ndarray] = {}
+        try:
+            # Chunked to stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for key, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch):
+                    rows[bytes(key)] = np.frombuffer(blob, dtype=np.float32)
+            if rows:
+                conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                 [(time.time(), key) for key in rows])
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ WARNING: Embedding cache read failed. {e}")
+        return rows
+
+    def _insert(self, rows: List[tuple]) -> None:
+        conn = self._connection() if self.path else None
+        if conn is None or not rows:
+            return
+        try:
+            now = time.time()
+            # Only rows that did not exist yet grow the table; existing ones are refreshed in place
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                             [(key, blob, now) for key, blob in rows])
+            self._rows += conn.total_changes - before
+            conn.executemany("UPDATE embeddings SET vector = ?, last_used = ? WHERE key = ?",
+                             [(blob, now, key) for key, blob in rows])
+            if self._rows > self.max_entries:
+                (self._rows,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if self._rows > self.max_entries:
+                # Evict a little below the cap so a full cache does not evict on every insert
+                excess = self._rows - self.max_entries + self.max_entries // 10
+                deleted = conn.execute("DELETE FROM embeddings WHERE key IN "
+                                       "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)).rowcount
+                self.evictions += deleted
+                self._rows -= deleted
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ WARNING: Embedding cache write failed. {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -1,15 +1,26 @@
 import json
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
-from src.models import Chunk, IndexEntry, KeywordIndex
+import numpy as np
+
+from src.models import Chunk, KeywordIndex, SelectionLimits, RetrievalScopes
+from src.core import Retriever
 from src.pipeline import RagOrchestrator
-from src.cache import QueryCache
+from src.cache import QueryCache, AppendLogStore, SqliteStore, IndexGeneration
+from src.semantic_cache import SemanticCache
+from src.index_store import CompactIndex, load_json_index
+from src.ann import IvfIndex
+from src.indexer import IndexerMain
+from src.facts import FactTables
 
 from src.impl import (
     ConfigurableIntentDetector,
     HeuristicQueryWriter,
     KeywordRetriever,
+    BM25Retriever,
+    DenseRetriever,
+    HybridRetriever,
     SimpleReranker,
     CosineReranker,
     KeywordAnswerAgent,
@@ -36,10 +47,7 @@ class PipelineFactory:
         Creates and wires all pipeline components.
         """
         chunks: List[Chunk] = PipelineFactory._load_chunks()
-        index: KeywordIndex = PipelineFactory._load_index()
-
-        # Persistent cache for query results
-        query_cache: QueryCache = QueryCache()
+        index: KeywordIndex = PipelineFactory._load_index(chunks)
 
         intent_rules = config.get("pipeline", {}).get(
             "intent_rules", PipelineFactory.DEFAULT_INTENT_RULES
@@ -49,15 +57,40 @@ class PipelineFactory:
         reranker_config: Dict[str, Any] = config.get("pipeline", {}).get("reranker", {})
         reranker_type: str = reranker_config.get("type", "simple").lower()
 
-        if reranker_type == "cosine":
-            reranker = CosineReranker(chunks)
-            answer_agent = VectorAnswerAgent()
+        # "hybrid" pairs hybrid retrieval with semantic reranking
+        if reranker_type in ("cosine", "hybrid"):
+            reranker = CosineReranker(chunks, PipelineFactory._load_vectors(chunks))
+            answer_agent = VectorAnswerAgent(chunks)
         else:
-            reranker = SimpleReranker(chunks)
+            reranker = SimpleReranker(chunks, index)
             answer_agent = KeywordAnswerAgent()
 
         query_writer = HeuristicQueryWriter()
-        retriever = KeywordRetriever()
+
+        retriever_config: Dict[str, Any] = config.get("pipeline", {}).get("retriever", {})
+        retriever = PipelineFactory._create_retriever(chunks, retriever_config, reranker_type)
+
+        # Intent-scoped retrieval over the index's document-class bitmaps
+        if isinstance(index, CompactIndex) and not index.has_class_bitmaps:
+            index.set_doc_classes(IndexerMain.doc_classes(index.doc_table))
+        default_scopes = RetrievalScopes()
+        scopes = RetrievalScopes(
+            classes_by_intent=retriever_config.get("scopes_by_intent", default_scopes.classes_by_intent),
+            min_hits=retriever_config.get("scope_min_hits", default_scopes.min_hits),
+        )
+
+        # Exact course-code / staff-name questions are answered from the indexer's fact tables
+        facts = PipelineFactory._load_facts(chunks) if config.get("pipeline", {}).get("fact_lookup", True) else None
+
+        # Persistent cache for query results (the semantic tier matches entities against the fact tables)
+        query_cache: QueryCache = PipelineFactory._create_cache(config.get("cache", {}), facts)
+
+        limits = SelectionLimits(
+            top_k=retriever_config.get("top_k"),
+            top_n=reranker_config.get("top_n"),
+            top_k_by_intent=retriever_config.get("top_k_by_intent", {}),
+            top_n_by_intent=reranker_config.get("top_n_by_intent", {}),
+        )
 
         return RagOrchestrator(
             intent_detector,
@@ -67,14 +100,135 @@ class PipelineFactory:
             answer_agent,
             index,
             query_cache,
+            limits,
+            scopes,
+            facts,
+        )
+
+    @staticmethod
+    def _create_cache(cache_config: Dict[str, Any], facts: Optional[FactTables] = None) -> QueryCache:
+        """
+        Bounded, lock-striped query cache with a semantic tier for paraphrased questions unless
+        cache.semantic.enabled is false. cache.backend "log" keeps it in an append-only log
+        written in background batches, owned by one process; "sqlite" shares one database
+        between worker processes and is the default when cache.shared is true. max_entries and
+        max_bytes bound the entries held in memory; max_rows bounds the store itself.
+        Entries are invalidated per cited document against the index manifest's versions.
+        """
+        semantic_config: Dict[str, Any] = cache_config.get("semantic", {})
+        semantic = (SemanticCache(semantic_config.get("threshold", 0.9), facts)
+                    if semantic_config.get("enabled", True) else None)
+        backend: str = cache_config.get("backend", "sqlite" if cache_config.get("shared") else "log").lower()
+        if backend == "sqlite":
+            store = SqliteStore(cache_config.get("path", "data/query_cache.sqlite"),
+                                busy_timeout=cache_config.get("busy_timeout", 5.0),
+                                max_rows=cache_config.get("max_rows", 100000))
+        else:
+            store = AppendLogStore(
+                cache_config.get("path", "data/query_cache.jsonl"),
+                flush_interval=cache_config.get("flush_interval", 0.5),
+                batch_size=cache_config.get("batch_size", 64),
+                compact_ratio=cache_config.get("compact_ratio", 2.0),
+                max_entries=cache_config.get("max_rows", 100000),
+            )
+        return QueryCache(
+            store.path,
+            cache_config.get("legacy_path", "data/query_cache.json"),
+            store,
+            max_entries=cache_config.get("max_entries", 10000),
+            max_bytes=cache_config.get("max_bytes", 32 * 1024 * 1024),
+            policy=cache_config.get("policy", "lru"),
+            ttl_seconds=cache_config.get("ttl_seconds"),
+            negative_ttl_seconds=cache_config.get("negative_ttl_seconds", 300.0),
+            semantic=semantic,
+            versions=IndexGeneration(cache_config.get("manifest_path", "data/manifest.json"),
+                                     check_interval=cache_config.get("manifest_check_interval", 1.0)),
+            stripes=cache_config.get("stripes", 8),
         )
 
     @staticmethod
-    def _load_chunks() -> List[Chunk]:
+    def _create_retriever(chunks: List[Chunk], retriever_config: Dict[str, Any], reranker_type: str) -> Retriever:
+        """
+        Builds the configured retriever ("keyword", "bm25", "dense" or "hybrid"). A hybrid
+        retriever, or a hybrid reranker, fuses a keyword leg (retriever.keyword_leg, by default
+        the retriever type's own) with a dense leg; a dense retriever is reused as that leg.
+        """
+        retriever_type: str = retriever_config.get("type", "keyword").lower()
+        hybrid = retriever_type == "hybrid" or reranker_type == "hybrid"
+        keyword_type: str = retriever_config.get("keyword_leg", retriever_type) if hybrid else retriever_type
+
+        if retriever_type == "dense":
+            retriever = PipelineFactory._create_dense_retriever(chunks, retriever_config)
+        else:
+            retriever = PipelineFactory._create_keyword_retriever(keyword_type, retriever_config)
+        if not hybrid:
+            return retriever
+
+        if isinstance(retriever, DenseRetriever):
+            keyword_leg, dense_leg = PipelineFactory._create_keyword_retriever(keyword_type, retriever_config), retriever
+        else:
+            keyword_leg, dense_leg = retriever, PipelineFactory._create_dense_retriever(chunks, retriever_config)
+        return HybridRetriever(
+            keyword_leg,
+            dense_leg,
+            fusion=retriever_config.get("fusion", "rrf"),
+            rrf_k=retriever_config.get("rrf_k", 60),
+            keyword_weight=retriever_config.get("keyword_weight", 1.0),
+            dense_weight=retriever_config.get("dense_weight", 1.0),
+            leg_budget_ms=retriever_config.get("leg_budget_ms"),
+        )
+
+    @staticmethod
+    def _create_keyword_retriever(keyword_type: str, retriever_config: Dict[str, Any]) -> Retriever:
+        """BM25 for "bm25", the index-lookup keyword retriever otherwise."""
+        if keyword_type.lower() == "bm25":
+            return BM25Retriever(retriever_config.get("k1", 1.2), retriever_config.get("b", 0.75))
+        return KeywordRetriever()
+
+    @staticmethod
+    def _create_dense_retriever(chunks: List[Chunk], retriever_config: Dict[str, Any],
+                                embeddings_path: str = "data/embeddings.npy",
+                                ann_path: str = "data/ann_ivf.npz") -> DenseRetriever:
+        """
+        Opens the embedding matrix and its IVF index. n_probe (lists visited per query)
+        is the recall/latency knob; an index missing on disk is rebuilt in memory.
+        """
+        n_probe: int = retriever_config.get("n_probe", 8)
+        vectors = PipelineFactory._load_vectors(chunks, embeddings_path)
+        if vectors is None:
+            vectors = np.zeros((len(chunks), 0), dtype=np.float32)
+
+        ann_index = None
+        if os.path.exists(ann_path):
+            try:
+                ann_index = IvfIndex.load(ann_path, n_probe)
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Warning: Could not load ANN index {ann_path}. Rebuilding it in memory. Error: {e}")
+        if ann_index is None or len(ann_index.row_norms) != len(vectors):
+            ann_index = IvfIndex.build(vectors, retriever_config.get("n_lists"))
+            ann_index.n_probe = n_probe
+
+        return DenseRetriever(chunks, vectors, ann_index, n_probe)
+
+    @staticmethod
+    def _load_vectors(chunks: List[Chunk], embeddings_path: str = "data/embeddings.npy") -> Optional[np.ndarray]:
+        """Memory-maps the embedding matrix; None when it is missing or not row-aligned with the chunks."""
+        if not os.path.exists(embeddings_path):
+            return None
+        try:
+            matrix = np.load(embeddings_path, mmap_mode="r")
+        except (IOError, ValueError):
+            return None
+        return matrix if matrix.ndim == 2 and matrix.shape[0] == len(chunks) else None
+
+    @staticmethod
+    def _load_chunks(path: str = "data/chunks.json",
+                     embeddings_path: str = "data/embeddings.npy",
+                     line_embeddings_path: Optional[str] = None) -> List[Chunk]:
         """
-        Loads document chunks from disk.
+        Loads document chunks from disk and attaches their embedding rows.
+        Line embeddings are read from line_embeddings.npy next to the chunk embeddings by default.
         """
-        path: str = "data/chunks.json"
         if not os.path.exists(path):
             return []
 
@@ -83,36 +237,90 @@ class PipelineFactory:
                 data: Any = json.load(f)
                 if not isinstance(data, list):
                     return []
-                return [Chunk(**c) for c in data if isinstance(c, dict)]
+                chunks = [Chunk(**c) for c in data if isinstance(c, dict)]
         except (json.JSONDecodeError, IOError, TypeError):
             return []
 
+        PipelineFactory._attach_embeddings(chunks, embeddings_path)
+        if line_embeddings_path is None:
+            line_embeddings_path = os.path.join(os.path.dirname(embeddings_path), "line_embeddings.npy")
+        PipelineFactory._attach_line_embeddings(chunks, line_embeddings_path)
+        return chunks
+
     @staticmethod
-    def _load_index() -> KeywordIndex:
+    def _attach_embeddings(chunks: List[Chunk], embeddings_path: str) -> None:
         """
-        Loads keyword index structure from disk.
+        Memory-maps the indexer's embedding matrix and gives every chunk a
+        read-only view of its row, so nothing is re-encoded or copied into lists.
         """
-        path: str = "data/index.json"
-        if not os.path.exists(path):
-            return KeywordIndex({})
+        if not os.path.exists(embeddings_path):
+            return
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data: Any = json.load(f)
-                source_data: Any = data.get("indexMap", data)
+            matrix = np.load(embeddings_path, mmap_mode="r")
+        except (IOError, ValueError) as e:
+            print(f"Warning: Could not load embeddings from {embeddings_path}. Error: {e}")
+            return
 
-                if not isinstance(source_data, dict):
-                    return KeywordIndex({})
+        if matrix.ndim != 2 or matrix.shape[0] != len(chunks):
+            print(f"Warning: {embeddings_path} has shape {matrix.shape} but there are {len(chunks)} chunks. Ignoring it.")
+            return
 
-                index_map: Dict[str, List[IndexEntry]] = {}
-                for term, entries in source_data.items():
-                    if not isinstance(entries, list):
-                        continue
-                    index_map[term] = [
-                        IndexEntry(**e) for e in entries if isinstance(e, dict)
-                    ]
+        for row, chunk in enumerate(chunks):
+            chunk.embedding = matrix[row]
 
-                return KeywordIndex(index_map)
+    @staticmethod
+    def _attach_line_embeddings(chunks: List[Chunk], line_embeddings_path: str) -> None:
+        """
+        Gives every chunk a read-only view of its line rows, so the answer agent scores
+        precomputed lines instead of encoding them per query. Chunks from builds without
+        line spans are left as they are.
+        """
+        if not os.path.exists(line_embeddings_path) or any(c.lineSpans is None for c in chunks):
+            return
 
-        except (json.JSONDecodeError, IOError, TypeError):
+        try:
+            matrix = np.load(line_embeddings_path, mmap_mode="r")
+        except (IOError, ValueError) as e:
+            print(f"Warning: Could not load line embeddings from {line_embeddings_path}. Error: {e}")
+            return
+
+        expected = sum(len(c.lineSpans) for c in chunks)
+        if matrix.ndim != 2 or matrix.shape[0] != expected:
+            print(f"Warning: {line_embeddings_path} has shape {matrix.shape} but chunks.json lists {expected} lines. Ignoring it.")
+            return
+
+        start = 0
+        for chunk in chunks:
+            chunk.lineEmbeddings = matrix[start:start + len(chunk.lineSpans)]
+            start += len(chunk.lineSpans)
+
+    @staticmethod
+    def _load_facts(chunks: List[Chunk], path: str = "data/facts.json") -> FactTables:
+        """Loads the fact tables, or extracts them from the chunks when the build predates them."""
+        facts = FactTables.load(path)
+        return facts if facts is not None else IndexerMain.build_fact_tables(chunks)
+
+    @staticmethod
+    def _load_index(chunks: Optional[List[Chunk]] = None, path: str = "data/index.json",
+                    binary_path: str = "data/index.bin") -> KeywordIndex:
+        """
+        Loads keyword index structure from disk.
+        The memory-mapped binary index is preferred; the JSON export is the fallback.
+        A JSON index is numbered in the row order of chunks, so its ordinals (and the class
+        masks built over them) line up with the embedding rows the dense retriever masks.
+        """
+        if os.path.exists(binary_path):
+            try:
+                return CompactIndex.load(binary_path)
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Warning: Could not load binary index {binary_path}. Falling back to JSON. Error: {e}")
+
+        if not os.path.exists(path):
+            return KeywordIndex({})
+
+        try:
+            # Converted once at startup so retrievers always work on integer ordinals
+            return CompactIndex.from_index(load_json_index(path), chunks)
+        except (json.JSONDecodeError, IOError, TypeError, AttributeError):
             return KeywordIndex({})
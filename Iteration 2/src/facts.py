@@ -0,0 +1,193 @@
+import json
+import os
+import re
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from src.analysis import turkish_lower
+from src.models import Answer, Chunk, Citation, CourseFact, Intent, StaffFact
+
+
+def _lines(text: str) -> Iterator[Tuple[str, int, int]]:
+    """(stripped line, start, end) for every non-empty line of text."""
+    pos = 0
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped:
+            start = pos + len(line) - len(line.lstrip())
+            yield stripped, start, start + len(stripped)
+        pos += len(line) + 1
+
+
+class FactTables:
+    """
+    Exact-match lookup tables extracted at index time from COURSE and STAFF chunks:
+    normalized course code -> CourseFact and normalized person name -> StaffFact.
+
+    answer() serves questions that name exactly one known course code (COURSE_INFO) or
+    person (STAFF_LOOKUP) straight from the tables, with a citation to the source lines.
+    Anything else returns None and goes through retrieval as before.
+    """
+
+    COURSE_LINE_RE = re.compile(r"^(?:[A-Z]{1,4}:\s*)?([A-Z]{2,4})\s?(\d{3,4})(?!\d)")
+    QUESTION_CODE_RE = re.compile(r"(?<![A-Z0-9])([A-Z]{2,4})\s?(\d{3,4})(?!\d)")
+    ECTS_RE = re.compile(r"\((?:ECTS|AKTS)\s*=\s*(\d+)\)", re.IGNORECASE)
+    PREREQUISITE_RE = re.compile(r"Önkoşul:\s*(.+)$")
+
+    TITLE_RE = re.compile(r"^(?:(?:Prof|Doç|Dr|Öğr|Arş|Res|Gör|Üyesi|Asst)\.?\s+)+")
+    ROLE_RE = re.compile(r"\s*\(.*?\)\s*$")
+    NAME_TOKEN_RE = re.compile(r"[a-zçğıöşü]+")
+    OFFICE_RE = re.compile(r"^(?:Ofis|Office|Oda)\s*:\s*(.+)$", re.IGNORECASE)
+    EMAIL_RE = re.compile(r"^(?:E-posta|E-mail|Email)\s*:\s*(.+)$", re.IGNORECASE)
+
+    # Same question cues VectorAnswerAgent uses to pick the office or the e-mail line
+    OFFICE_WORDS: List[str] = ["nerede", "ofis", "oda"]
+    EMAIL_WORDS: List[str] = ["mail", "e-posta", "iletişim"]
+
+    def __init__(self):
+        self.courses: Dict[str, CourseFact] = {}
+        self.staff: Dict[str, StaffFact] = {}
+        self._name_lengths: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.courses) + len(self.staff)
+
+    # --- Extraction ---
+
+    def add_chunk(self, chunk: Chunk, strategy: str) -> None:
+        """Extracts the facts of one chunk; strategy is the indexer's chunking strategy of its file."""
+        if strategy == "COURSE":
+            self._add_courses(chunk)
+        elif strategy == "STAFF":
+            self._add_staff(chunk)
+
+    def _add_courses(self, chunk: Chunk) -> None:
+        for line, start, end in _lines(chunk.rawText):
+            match = self.COURSE_LINE_RE.match(line)
+            if not match:
+                continue
+            code = match.group(1) + match.group(2)
+            # The first line of a code wins; overlapping sub-chunks repeat lines
+            if code in self.courses:
+                continue
+            ects = self.ECTS_RE.search(line)
+            prerequisite = self.PREREQUISITE_RE.search(line)
+            self.courses[code] = CourseFact(code, line, int(ects.group(1)) if ects else None,
+                                            prerequisite.group(1).strip() if prerequisite else None,
+                                            chunk.docId, chunk.chunkId, start, end)
+
+    def _add_staff(self, chunk: Chunk) -> None:
+        fact: Optional[StaffFact] = None
+        for line, start, end in _lines(chunk.rawText):
+            if self.TITLE_RE.match(line):
+                self._add_person(fact)
+                name = self.normalize_name(line)
+                fact = StaffFact(name, line, None, None, chunk.docId, chunk.chunkId, start, end) if name else None
+                continue
+            if fact is None:
+                continue
+            office = self.OFFICE_RE.match(line)
+            email = self.EMAIL_RE.match(line)
+            if office and fact.office is None:
+                fact.office, fact.endOffset = office.group(1).strip(), end
+            elif email and fact.email is None:
+                fact.email, fact.endOffset = email.group(1).strip(), end
+        self._add_person(fact)
+
+    def _add_person(self, fact: Optional[StaffFact]) -> None:
+        if fact is None or (fact.office is None and fact.email is None) or fact.name in self.staff:
+            return
+        self.staff[fact.name] = fact
+        n_tokens = fact.name.count(" ") + 1
+        if n_tokens not in self._name_lengths:
+            self._name_lengths.append(n_tokens)
+
+    @staticmethod
+    def normalize_name(line: str) -> str:
+        """Drops titles and the trailing role: Dr. Öğr. Üyesi Betül Demiröz BOZ (...) -> betül demiröz boz."""
+        line = FactTables.TITLE_RE.sub("", FactTables.ROLE_RE.sub("", line))
+        tokens = FactTables.NAME_TOKEN_RE.findall(turkish_lower(line))
+        return " ".join(tokens) if len(tokens) >= 2 else ""
+
+    # --- Lookup ---
+
+    @staticmethod
+    def course_codes(question: str) -> Set[str]:
+        """Every course-code-shaped token of the question, normalized (cse 3063 -> CSE3063)."""
+        return {letters + digits for letters, digits in FactTables.QUESTION_CODE_RE.findall(question.upper())}
+
+    def staff_names(self, question: str) -> Set[str]:
+        """The normalized full names of known staff that occur in the question."""
+        tokens = self.NAME_TOKEN_RE.findall(turkish_lower(question))
+        return {
+            " ".join(tokens[i:i + n])
+            for n in self._name_lengths
+            for i in range(len(tokens) - n + 1)
+            if " ".join(tokens[i:i + n]) in self.staff
+        }
+
+    def find_course(self, question: str) -> Optional[CourseFact]:
+        """The course whose code the question names, if it names exactly one code."""
+        codes = self.course_codes(question)
+        if len(codes) != 1:
+            return None
+        return self.courses.get(codes.pop())
+
+    def find_staff(self, question: str) -> Optional[StaffFact]:
+        """The person whose full name occurs in the question, if exactly one does."""
+        found = self.staff_names(question)
+        return self.staff[found.pop()] if len(found) == 1 else None
+
+    def answer(self, question: str, intent: Intent) -> Optional[Answer]:
+        """Answers an exact-code or exact-name question from the tables; None when it is not one."""
+        if intent == Intent.COURSE_INFO:
+            course = self.find_course(question)
+            if course is not None:
+                return Answer(course.line, [Citation(course.docId, f"Chunk{course.chunkId}",
+                                                     course.startOffset, course.endOffset)])
+        elif intent == Intent.STAFF_LOOKUP:
+            person = self.find_staff(question)
+            if person is not None:
+                return Answer(self._staff_text(person, question),
+                              [Citation(person.docId, f"Chunk{person.chunkId}", person.startOffset, person.endOffset)])
+        return None
+
+    def _staff_text(self, person: StaffFact, question: str) -> str:
+        q_lower = turkish_lower(question)
+        office = f"Ofis: {person.office}" if person.office else None
+        email = f"E-posta: {person.email}" if person.email else None
+        if office and any(k in q_lower for k in self.OFFICE_WORDS):
+            details = [office]
+        elif email and any(k in q_lower for k in self.EMAIL_WORDS):
+            details = [email]
+        else:
+            details = [line for line in (office, email) if line]
+        return "\n".join([person.line] + details)
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"courses": [asdict(c) for c in self.courses.values()],
+                       "staff": [asdict(s) for s in self.staff.values()]}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> Optional["FactTables"]:
+        """Reads the indexer's fact tables; None when the file is missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            tables = FactTables()
+            for c in data.get("courses", []):
+                course = CourseFact(**c)
+                tables.courses[course.code] = course
+            for s in data.get("staff", []):
+                tables._add_person(StaffFact(**s))
+            return tables
+        except (json.JSONDecodeError, IOError, TypeError, AttributeError) as e:
+            print(f"⚠️ WARNING: Could not load fact tables from {path}. {e}")
+            return None
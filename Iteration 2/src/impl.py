@@ -1,9 +1,20 @@
 import re
 import copy
-from typing import List, Dict, Set, Any, Optional
+import math
+import heapq
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Any, Optional, Tuple
 from src.core import IntentDetector, QueryWriter, Retriever, Reranker, AnswerAgent
 from src.models import Intent, Hit, KeywordIndex, Answer, Citation, Chunk
 from src.utils import get_embedding, cosine_similarity
+from src.index_store import CompactIndex
+from src.pruning import PrunableTerm, max_score_search
+from src.ann import IvfIndex
+from src.analysis import turkish_lower
+from src.matcher import TermMatcher
+from src.tracing import TraceBus
 
 # --- 1. INTENT DETECTOR ---
 class ConfigurableIntentDetector(IntentDetector):
@@ -13,7 +24,7 @@ class ConfigurableIntentDetector(IntentDetector):
     def detect(self, question: str) -> Intent:
         try:
             if not question: return Intent.UNKNOWN
-            q = question.lower()
+            q = turkish_lower(question)
             for intent_name, keywords in self.rules.items():
                 if any(k in q for k in keywords):
                     try:
@@ -52,7 +63,7 @@ class HeuristicQueryWriter(QueryWriter):
     def write(self, question: str, intent: Intent) -> List[str]:
         terms = []
         try:
-            q_lower = question.lower()
+            q_lower = turkish_lower(question)
             normalized = re.sub(r'[^\w\s]', ' ', q_lower)
             tokens = normalized.split()
             
@@ -69,80 +80,321 @@ class HeuristicQueryWriter(QueryWriter):
         return terms
 
 # --- 3. RETRIEVER ---
+
+def select_top_hits(compact: CompactIndex, ordinals: np.ndarray, scores: np.ndarray,
+                    top_k: Optional[int] = None) -> List[Hit]:
+    """
+    Turns scored chunk ordinals into sorted Hits, keeping only the best top_k.
+    A partition finds the k-th best score, Hits are built just for candidates at or
+    above it (ties included), and a heap picks the final k in Hit order
+    (score DESC, docId ASC, chunkId ASC).
+    """
+    if top_k is not None and 0 < top_k < len(ordinals):
+        threshold = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        keep = scores >= threshold
+        ordinals, scores = ordinals[keep], scores[keep]
+        hits = [Hit(compact.doc_id(o), compact.chunk_id(o), float(sc), None) for o, sc in zip(ordinals, scores)]
+        return heapq.nsmallest(top_k, hits)
+
+    hits = [Hit(compact.doc_id(o), compact.chunk_id(o), float(sc), None) for o, sc in zip(ordinals, scores)]
+    hits.sort()
+    return hits
+
+def mask_postings(ordinals: np.ndarray, tfs: np.ndarray,
+                  chunk_mask: Optional[np.ndarray]) -> tuple:
+    """Keeps the postings of chunks set in chunk_mask; scoring then never touches the others."""
+    if chunk_mask is None:
+        return ordinals, tfs
+    keep = chunk_mask[ordinals]
+    return ordinals[keep], tfs[keep]
+
 class KeywordRetriever(Retriever):
-    def retrieve(self, query_terms: List[str], index: KeywordIndex) -> List[Hit]:
+    """
+    Scores chunks by distinct matched terms (x1000) plus summed term frequency.
+    Accumulates over integer chunk ordinals with NumPy instead of per-posting string keys.
+    With a top_k, MaxScore pruning skips chunks that cannot enter the top-k.
+    """
+
+    def __init__(self, top_k: Optional[int] = None, pruning: bool = True):
+        self.top_k = top_k
+        self.pruning = pruning
+
+    def retrieve(self, query_terms: List[str], index: KeywordIndex, top_k: Optional[int] = None,
+                 chunk_mask: Optional[np.ndarray] = None) -> List[Hit]:
         hits = []
         try:
-            score_map: Dict[str, float] = {}
-            match_counts: Dict[str, Set[str]] = {}
-            
-            for term in query_terms:
-                if term in index.indexMap:
-                    entries = index.indexMap[term]
-                    for entry in entries:
-                        key = f"{entry.docId}::{entry.chunkId}"
-                        score_map[key] = score_map.get(key, 0.0) + entry.tf
-                        if key not in match_counts: match_counts[key] = set()
-                        match_counts[key].add(term)
-            
-            for key, tf_score in score_map.items():
-                try:
-                    doc_id, chunk_id_str = key.split("::")
-                    chunk_id = int(chunk_id_str)
-                    distinct_matches = len(match_counts[key])
-                    final_score = (distinct_matches * 1000.0) + tf_score
-                    hits.append(Hit(doc_id, chunk_id, final_score, None))
-                except (ValueError, KeyError, IndexError): 
-                    continue
-                    
+            compact = CompactIndex.from_index(index)
+            n_chunks = compact.num_chunks
+            k = top_k or self.top_k
+            # Query terms go through the analyzer the index was built with (stems for a Turkish index)
+            query_terms = compact.query_analyzer().query_terms(query_terms)
+
+            # Repeated query terms add their tf again but count once as a distinct match
+            term_ids = [compact.term_id(t) for t in query_terms]
+            term_ids = [tid for tid in term_ids if tid >= 0]
+            if not term_ids or n_chunks == 0: return hits
+
+            multiplicity = {tid: term_ids.count(tid) for tid in term_ids}
+            postings = {tid: mask_postings(*compact.postings_by_id(tid), chunk_mask) for tid in multiplicity}
+
+            if k and self.pruning:
+                terms = []
+                for tid, m in multiplicity.items():
+                    ordinals, tfs = postings[tid]
+                    max_tf, _ = compact.term_bounds(tid)
+                    terms.append(PrunableTerm(ordinals, tfs, 1000.0 + m * max_tf,
+                                              lambda o, tf, m=m: 1000.0 + m * tf.astype(np.float64)))
+                survivors, survivor_scores = max_score_search(terms, k)
+                return select_top_hits(compact, survivors, survivor_scores, k)
+
+            all_ordinals = np.concatenate([postings[tid][0] for tid in term_ids])
+            all_tfs = np.concatenate([postings[tid][1] for tid in term_ids])
+            distinct_ordinals = np.concatenate([ordinals for ordinals, _ in postings.values()])
+
+            tf_scores = np.bincount(all_ordinals, weights=all_tfs, minlength=n_chunks)
+            match_counts = np.bincount(distinct_ordinals, minlength=n_chunks)
+            scores = match_counts * 1000.0 + tf_scores
+
+            survivors = np.flatnonzero(match_counts)
+            hits = select_top_hits(compact, survivors, scores[survivors], k)
+        except Exception:
+            pass
+        return hits
+
+class BM25Retriever(Retriever):
+    """
+    Okapi BM25 ranking from the statistics stored in the index
+    (term frequencies, document frequencies, chunk lengths); never reads chunk text.
+    With a top_k, MaxScore pruning skips chunks that cannot enter the top-k.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, top_k: Optional[int] = None, pruning: bool = True):
+        self.k1 = k1
+        self.b = b
+        self.top_k = top_k
+        self.pruning = pruning
+
+    def _term_score(self, compact: CompactIndex, idf: float, avg_len: float,
+                    ordinals: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        lengths = compact.chunk_lengths[ordinals]
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_len)
+        return idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+    def _upper_bound(self, idf: float, avg_len: float, max_tf: int, min_len: int) -> float:
+        # BM25 grows with tf and shrinks with chunk length, so (max tf, min length) bounds every posting
+        norm = self.k1 * (1.0 - self.b + self.b * min_len / avg_len)
+        return idf * max_tf * (self.k1 + 1.0) / (max_tf + norm)
+
+    def retrieve(self, query_terms: List[str], index: KeywordIndex, top_k: Optional[int] = None,
+                 chunk_mask: Optional[np.ndarray] = None) -> List[Hit]:
+        hits = []
+        try:
+            compact = CompactIndex.from_index(index)
+            n_chunks = compact.num_chunks
+            if n_chunks == 0: return hits
+            avg_len = compact.avg_chunk_length or 1.0
+            k = top_k or self.top_k
+            query_terms = compact.query_analyzer().query_terms(query_terms)
+
+            # Each distinct term contributes once, as in the distinct-match logic of KeywordRetriever
+            terms = []
+            for term in dict.fromkeys(query_terms):
+                term_id = compact.term_id(term)
+                if term_id < 0: continue
+                # idf stays a whole-corpus statistic; the mask only removes candidates
+                ordinals, tfs = mask_postings(*compact.postings_by_id(term_id), chunk_mask)
+                df = compact.doc_freq(term_id)
+                idf = math.log(1.0 + (n_chunks - df + 0.5) / (df + 0.5))
+                max_tf, min_len = compact.term_bounds(term_id)
+                terms.append(PrunableTerm(
+                    ordinals, tfs, self._upper_bound(idf, avg_len, max_tf, min_len),
+                    lambda o, tf, idf=idf: self._term_score(compact, idf, avg_len, o, tf)))
+
+            if k and self.pruning:
+                survivors, survivor_scores = max_score_search(terms, k)
+                return select_top_hits(compact, survivors, survivor_scores, k)
+
+            scores = np.zeros(n_chunks, dtype=np.float64)
+            matched = np.zeros(n_chunks, dtype=bool)
+            for t in terms:
+                scores[t.ordinals] += t.score_fn(t.ordinals, t.tfs)
+                matched[t.ordinals] = True
+
+            survivors = np.flatnonzero(matched)
+            hits = select_top_hits(compact, survivors, scores[survivors], k)
+        except Exception:
+            pass
+        return hits
+
+class DenseRetriever(Retriever):
+    """
+    Semantic candidate generation: embeds the query terms and searches the IVF
+    index over the chunk embedding matrix, so paraphrases without a shared keyword
+    are still found. Scores are cosine similarities; n_probe trades recall for latency.
+    Row i of `vectors` belongs to all_chunks[i]; the keyword index is not used.
+    """
+
+    DEFAULT_TOP_K: int = 50
+
+    def __init__(self, all_chunks: List[Chunk], vectors: np.ndarray, ann_index: IvfIndex,
+                 n_probe: Optional[int] = None, top_k: Optional[int] = None):
+        self.all_chunks = all_chunks
+        self.vectors = vectors
+        self.ann_index = ann_index
+        self.n_probe = n_probe
+        self.top_k = top_k
+
+    def retrieve(self, query_terms: List[str], index: KeywordIndex, top_k: Optional[int] = None,
+                 chunk_mask: Optional[np.ndarray] = None) -> List[Hit]:
+        hits = []
+        try:
+            if not query_terms: return hits
+            k = top_k or self.top_k or self.DEFAULT_TOP_K
+
+            query_vec = get_embedding(" ".join(query_terms))
+            ordinals, scores = self.ann_index.search(query_vec, self.vectors, k, self.n_probe, chunk_mask)
+            for ordinal, score in zip(ordinals, scores):
+                c = self.all_chunks[ordinal]
+                hits.append(Hit(c.docId, c.chunkId, float(score), None, embedding=self.vectors[ordinal]))
             hits.sort()
         except Exception:
             pass
         return hits
 
+class HybridRetriever(Retriever):
+    """
+    Runs a keyword leg and a dense leg concurrently and fuses their rankings.
+
+    fusion="rrf": reciprocal rank fusion, score = sum(weight / (rrf_k + rank)).
+    fusion="weighted": each leg's scores are min-max normalized, then weighted and summed.
+
+    Each leg has a latency budget (leg_budget_ms, counted from submission); a leg that
+    misses it is dropped from this query's fusion and the other leg's results are
+    returned on their own. The legs share one long-lived thread pool.
+    """
+
+    def __init__(self, keyword_retriever: Retriever, dense_retriever: Retriever, fusion: str = "rrf",
+                 rrf_k: int = 60, keyword_weight: float = 1.0, dense_weight: float = 1.0,
+                 leg_budget_ms: Optional[float] = None, leg_top_k: int = 50, top_k: Optional[int] = None,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        self.legs = [("keyword", keyword_retriever, keyword_weight), ("dense", dense_retriever, dense_weight)]
+        self.fusion = fusion
+        self.rrf_k = rrf_k
+        self.leg_budget_ms = leg_budget_ms
+        self.leg_top_k = leg_top_k
+        self.top_k = top_k
+        # Spare workers so a leg still running past its deadline does not block the next query
+        self.executor = executor or ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-leg")
+
+    def retrieve(self, query_terms: List[str], index: KeywordIndex, top_k: Optional[int] = None,
+                 chunk_mask: Optional[np.ndarray] = None) -> List[Hit]:
+        hits = []
+        try:
+            k = top_k or self.top_k
+            depth = max(k or 0, self.leg_top_k)
+            start = time.time()
+            scope = {"chunk_mask": chunk_mask} if chunk_mask is not None else {}
+            futures = [(name, self.executor.submit(retriever.retrieve, query_terms, index, depth, **scope), weight)
+                       for name, retriever, weight in self.legs]
+
+            results = []
+            for name, future, weight in futures:
+                try:
+                    timeout = None
+                    if self.leg_budget_ms is not None:
+                        timeout = max(0.0, self.leg_budget_ms / 1000.0 - (time.time() - start))
+                    results.append((future.result(timeout=timeout), weight))
+                except FutureTimeout:
+                    TraceBus.push_full("HYBRID", str(query_terms), f"{name} leg missed its {self.leg_budget_ms}ms budget",
+                                       int((time.time() - start) * 1000), "timeout")
+                except Exception as e:
+                    TraceBus.push_full("HYBRID", str(query_terms), f"{name} leg failed", 0, str(e))
+
+            hits = self.fuse(results)
+            if k is not None:
+                hits = hits[:k]
+        except Exception:
+            pass
+        return hits
+
+    def fuse(self, results: List[Any]) -> List[Hit]:
+        """Merges [(hits, weight), ...] into one ranking; a chunk keeps the first leg's Hit (and any embedding)."""
+        fused: Dict[Any, Hit] = {}
+        scores: Dict[Any, float] = {}
+        for leg_hits, weight in results:
+            if not leg_hits: continue
+            top, bottom = leg_hits[0].score, leg_hits[-1].score
+            for rank, hit in enumerate(leg_hits, start=1):
+                key = (hit.docId, hit.chunkId)
+                if self.fusion == "weighted":
+                    contribution = weight * ((hit.score - bottom) / (top - bottom) if top > bottom else 1.0)
+                else:
+                    contribution = weight / (self.rrf_k + rank)
+                scores[key] = scores.get(key, 0.0) + contribution
+                if key not in fused:
+                    fused[key] = hit
+                elif fused[key].embedding is None and hit.embedding is not None:
+                    fused[key].embedding = hit.embedding
+
+        merged = []
+        for key, hit in fused.items():
+            merged.append(Hit(hit.docId, hit.chunkId, scores[key], hit.chunkText, hit.embedding))
+        merged.sort()
+        return merged
+
 # --- 4. RERANKERS ---
 
 class SimpleReranker(Reranker):
-    def __init__(self, all_chunks: List[Chunk]):
+    """
+    Scores hits by query-term frequency, proximity, title match and numeric "silver bullet" terms.
+    Given a positional CompactIndex, tf, proximity windows and phrase matches come from the
+    stored token positions (query terms analyzed like the index terms); otherwise the chunk text is scanned.
+
+    Both paths use the same proximity window, PROXIMITY_CHARS characters. The positional path
+    converts it into tokens per chunk, using that chunk's characters per indexed token, so
+    building the index with --positions does not change which chunks earn the bonus.
+    """
+
+    PROXIMITY_CHARS: int = 15  # max distance between two different query terms
+
+    def __init__(self, all_chunks: List[Chunk], index: Optional[KeywordIndex] = None):
         self.chunk_map = {f"{c.docId}_{c.chunkId}": c for c in all_chunks}
+        self.index = index if isinstance(index, CompactIndex) and index.has_positions else None
+        self.ordinal_map: Dict[str, int] = {}
+        self.analyzer = None
+        if self.index is not None:
+            self.analyzer = self.index.query_analyzer()
+            self.ordinal_map = {f"{self.index.doc_id(o)}_{self.index.chunk_id(o)}": o
+                                for o in range(self.index.num_chunks)}
 
     def rerank(self, query_terms: List[str], hits: List[Hit]) -> List[Hit]:
         try:
-            for hit in hits:
+            terms = [t.lower() for t in query_terms]
+            if self.analyzer is not None:
+                terms = self.analyzer.query_terms(terms)
+            positional = self._hit_positions(terms, hits) if self.index is not None else {}
+            numeric_terms = [t for t in terms if any(ch.isdigit() for ch in t)]
+            # One matcher per query serves the text scan and the title check of every hit
+            matcher = TermMatcher(query_terms)
+            for i, hit in enumerate(hits):
                 try:
                     key = f"{hit.docId}_{hit.chunkId}"
                     chunk = self.chunk_map.get(key)
                     if not chunk: continue
 
                     hit.chunkText = chunk.rawText
-                    text = hit.chunkText.lower()
 
-                    tf_sum = sum(text.count(t.lower()) for t in query_terms)
-
-                    positions = []
-                    for term in query_terms:
-                        idx = text.find(term.lower())
-                        if idx != -1: positions.append(idx)
-
-                    proximity_bonus = 0
-                    if len(positions) >= 2:
-                        positions.sort()
-                        for i in range(len(positions) - 1):
-                            if abs(positions[i] - positions[i+1]) <= 15:
-                                proximity_bonus = 5
-                                break
+                    if i in positional:
+                        tf_sum, proximity_bonus, silver_bullet = self._positional_features(
+                            terms, numeric_terms, positional[i], self._token_window(key, chunk))
+                    else:
+                        tf_sum, proximity_bonus, silver_bullet = self._text_features(query_terms, hit.chunkText.lower(),
+                                                                                     matcher)
 
                     title_boost = 0
-                    if any(t.lower() in hit.docId.lower() for t in query_terms):
+                    if matcher.any_in(hit.docId):
                         title_boost = 3
 
-                    silver_bullet = 0
-                    for t in query_terms:
-                        if any(char.isdigit() for char in t):  
-                            if t.lower() in text:              
-                                silver_bullet = 200            
-                                break
-
                     hit.score = (tf_sum * 10) + proximity_bonus + title_boost + silver_bullet
                     hit.sort_index = (-hit.score, hit.docId, hit.chunkId)
                 except Exception:
@@ -152,16 +404,136 @@ class SimpleReranker(Reranker):
             pass
         return hits
 
+    @staticmethod
+    def _text_features(query_terms: List[str], text: str, matcher: Optional[TermMatcher] = None):
+        """tf sum, proximity bonus and silver bullet from the lowercased chunk text (repeated terms count again)."""
+        found = (matcher or TermMatcher(query_terms)).scan(text, lowered=True)
+        stats = [found.get(t.lower()) for t in query_terms]
+        tf_sum = sum(s[0] for s in stats if s)
+
+        positions = [s[1] for s in stats if s]
+
+        proximity_bonus = 0
+        if len(positions) >= 2:
+            positions.sort()
+            for i in range(len(positions) - 1):
+                if abs(positions[i] - positions[i+1]) <= SimpleReranker.PROXIMITY_CHARS:
+                    proximity_bonus = 5
+                    break
+
+        silver_bullet = 0
+        if any(t.lower() in found for t in query_terms if any(char.isdigit() for char in t)):
+            silver_bullet = 200
+        return tf_sum, proximity_bonus, silver_bullet
+
+    def _hit_positions(self, terms: List[str], hits: List[Hit]) -> Dict[int, Dict[str, List[int]]]:
+        """
+        hit index -> {term: token positions} from the positional postings (terms already analyzed).
+        Each query term's postings are decoded once and searched for all hit ordinals together.
+        """
+        rows = [i for i, h in enumerate(hits) if f"{h.docId}_{h.chunkId}" in self.ordinal_map]
+        if not rows: return {}
+        hit_ordinals = np.asarray([self.ordinal_map[f"{hits[i].docId}_{hits[i].chunkId}"] for i in rows])
+
+        result: Dict[int, Dict[str, List[int]]] = {i: {} for i in rows}
+        for t in dict.fromkeys(terms):
+            term_id = self.index.term_id(t)
+            if term_id < 0: continue
+            ordinals, _ = self.index.postings_by_id(term_id)
+            ranks = np.minimum(np.searchsorted(ordinals, hit_ordinals), len(ordinals) - 1)
+            for row, rank in zip(np.asarray(rows)[ordinals[ranks] == hit_ordinals],
+                                 ranks[ordinals[ranks] == hit_ordinals]):
+                result[int(row)][t] = self.index.posting_positions(term_id, int(rank)).tolist()
+        return result
+
+    def _token_window(self, key: str, chunk: Chunk) -> int:
+        """PROXIMITY_CHARS in this chunk's tokens: the largest token distance spanning at most that many characters."""
+        tokens = int(self.index.chunk_lengths[self.ordinal_map[key]])
+        return int(self.PROXIMITY_CHARS * tokens / max(1, len(chunk.rawText)))
+
+    @staticmethod
+    def _positional_features(terms: List[str], numeric_terms: List[str], term_positions: Dict[str, List[int]],
+                             window: int):
+        """tf sum, proximity/phrase bonus and silver bullet from one chunk's token positions (terms analyzed)."""
+        tf_sum = sum(len(term_positions[t]) for t in terms if t in term_positions)
+
+        proximity_bonus = 0
+        if len(term_positions) >= 2:
+            # Merge all positions; two neighbours from different terms inside the window count
+            merged = sorted((p, t) for t, positions in term_positions.items() for p in positions)
+            for (pos_a, term_a), (pos_b, term_b) in zip(merged, merged[1:]):
+                if pos_b - pos_a <= window and term_a != term_b:
+                    proximity_bonus = 5
+                    break
+            # A phrase match (consecutive query terms at adjacent positions) earns the bonus again
+            for a, b in zip(terms, terms[1:]):
+                if a != b and a in term_positions and b in term_positions:
+                    if set(p + 1 for p in term_positions[a]) & set(term_positions[b]):
+                        proximity_bonus += 5
+                        break
+
+        silver_bullet = 0
+        if any(t in term_positions for t in numeric_terms):
+            silver_bullet = 200
+        return tf_sum, proximity_bonus, silver_bullet
+
 class CosineReranker(Reranker):
-    def __init__(self, all_chunks: List[Chunk]):
+    """
+    Semantic reranking plus course-code and document-name boosts.
+
+    Chunk embeddings are kept as one pre-normalized float32 matrix (row = chunk ordinal),
+    so all candidates are scored with a single gather and one matrix-vector product.
+    vectors is the embeddings.npy matrix when available; otherwise the chunks' own
+    embeddings are stacked. Chunks without an embedding are encoded on first use.
+    """
+
+    def __init__(self, all_chunks: List[Chunk], vectors: Optional[np.ndarray] = None):
         self.chunk_map = {f"{c.docId}_{c.chunkId}": c for c in all_chunks}
+        self.row_of = {f"{c.docId}_{c.chunkId}": row for row, c in enumerate(all_chunks)}
+        self.all_chunks = all_chunks
+        if vectors is None or len(vectors) != len(all_chunks):
+            dim = max((len(c.embedding) for c in all_chunks if c.embedding is not None), default=0)
+            vectors = np.zeros((len(all_chunks), dim), dtype=np.float32)
+            for row, c in enumerate(all_chunks):
+                if c.embedding is not None and len(c.embedding) == dim:
+                    vectors[row] = c.embedding
+        self.matrix = self._normalized(np.asarray(vectors, dtype=np.float32))
+        # Rows with no stored embedding are encoded from the chunk text the first time they are ranked
+        self.unencoded = ~self.matrix.any(axis=1)
+
+    @staticmethod
+    def _normalized(rows: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (rows / norms).astype(np.float32)
+
+    def _similarities(self, query_vec: np.ndarray, hits: List[Hit]) -> np.ndarray:
+        """Cosine similarity of every hit with the query: one gather + one matvec over the matrix."""
+        rows = np.asarray([self.row_of.get(f"{h.docId}_{h.chunkId}", -1) for h in hits], dtype=np.int64)
+        known = rows >= 0
+        stale = np.unique(rows[known][self.unencoded[rows[known]]])
+        for row in stale:
+            self.matrix[row] = self._normalized(np.asarray(get_embedding(self.all_chunks[row].rawText), dtype=np.float32))
+            self.unencoded[row] = False
+
+        sims = np.zeros(len(hits), dtype=np.float32)
+        if known.any() and self.matrix.shape[1] == len(query_vec):
+            sims[known] = self.matrix[rows[known]] @ query_vec
+        # Hits for chunks outside the matrix fall back to their own embeddings
+        for i in np.flatnonzero(~known):
+            vec = hits[i].embedding
+            if vec is not None and len(vec) == len(query_vec):
+                sims[i] = float(self._normalized(np.asarray(vec, dtype=np.float32)) @ query_vec)
+        return sims
 
     def rerank(self, query_tokens: List[str], hits: List[Hit]) -> List[Hit]:
         try:
             query_str = " ".join(query_tokens)
-            query_vec = get_embedding(query_str)
+            query_vec = self._normalized(np.asarray(get_embedding(query_str), dtype=np.float32))
+            sims = self._similarities(query_vec, hits) * 100.0
             
             critical_terms = [t.lower() for t in query_tokens if len(t) > 3 or any(c.isdigit() for c in t)]
+            critical_matcher = TermMatcher(critical_terms)
 
             target_course_code = None
             code_match = re.search(r"\b([A-Z]{3,4}\s?\d{3,4})\b", query_str.upper())
@@ -172,21 +544,17 @@ class CosineReranker(Reranker):
             is_cap = "çap" in query_str.lower() or "çift anadal" in query_str.lower()
             is_yatay_gecis = "yatay geçiş" in query_str.lower()
 
-            for hit in hits:
+            for hit, base_score in zip(hits, sims.tolist()):
                 try:
-                    vec = hit.embedding
-                    c = self.chunk_map.get(f"{hit.docId}_{hit.chunkId}")
-                    
-                    if not vec and c:
-                        vec = c.embedding if c.embedding else get_embedding(c.rawText)
+                    key = f"{hit.docId}_{hit.chunkId}"
+                    c = self.chunk_map.get(key)
+
+                    # Embeddings may be NumPy rows, so avoid truth-testing them
+                    if (hit.embedding is None or len(hit.embedding) == 0) and c:
                         hit.chunkText = c.rawText
-                        hit.embedding = vec 
+                        hit.embedding = self.matrix[self.row_of[key]]  # zero-copy view of the normalized row
                     elif c and not hit.chunkText:
                         hit.chunkText = c.rawText
-                    
-                    base_score = 0.0
-                    if vec and query_vec:
-                        base_score = cosine_similarity(query_vec, vec) * 100.0
 
                     boost = 0
                     if hit.chunkText:
@@ -196,10 +564,11 @@ class CosineReranker(Reranker):
                         if target_course_code and text_upper.startswith(target_course_code):
                             boost += 300.0 
                         
-                        if any(t in doc_id for t in critical_terms):
+                        if critical_matcher.any_in(doc_id, lowered=True):
                             boost += 50.0 
 
-                        matches = sum(1 for term in critical_terms if term in hit.chunkText.lower())
+                        present = critical_matcher.present(hit.chunkText)
+                        matches = sum(1 for term in critical_terms if term in present)
                         boost += (matches * 10.0)
 
                         if is_tek_ders:
@@ -222,6 +591,8 @@ class CosineReranker(Reranker):
 # --- 5. ANSWER AGENTS ---
 
 class KeywordAnswerAgent(AnswerAgent):
+    CONTACT_MATCHER = TermMatcher(["ofis", "office", "m2", "bina", "e-posta", "@", "tel:", "bs:", "ms:", "phd:"])
+
     def answer(self, question: str, top_hits: List[Hit]) -> Answer:
         try:
             if not top_hits: return Answer("Bilgi bulunamadı.", [])
@@ -245,7 +616,7 @@ class KeywordAnswerAgent(AnswerAgent):
                     info_lines = [name_line]
                     for line in lines:
                         if line == name_line: continue
-                        if any(x in line.lower() for x in ["ofis", "office", "m2", "bina", "e-posta", "@", "tel:", "bs:", "ms:", "phd:"]):
+                        if self.CONTACT_MATCHER.any_in(line):
                             info_lines.append(line)
                     return Answer("\n".join(info_lines), [Citation(best_hit.docId, f"Chunk{best_hit.chunkId}", 0, 0)])
 
@@ -254,12 +625,42 @@ class KeywordAnswerAgent(AnswerAgent):
             return Answer("Cevap oluşturulurken bir hata oluştu.", [])
 
 class VectorAnswerAgent(AnswerAgent):
+    OFFICE_MATCHER = TermMatcher(["ofis", "office", "m2", "bina"])
+
+    def __init__(self, all_chunks: Optional[List[Chunk]] = None):
+        # Chunks whose answer lines were split and encoded by the indexer
+        self.line_chunks: Dict[Tuple[str, int], Chunk] = {
+            (c.docId, c.chunkId): c for c in (all_chunks or [])
+            if c.lineSpans is not None and c.lineEmbeddings is not None
+        }
+
+    def _stored_lines(self, hit: Hit) -> Optional[Tuple[List[str], np.ndarray]]:
+        """The hit's precomputed lines and line embeddings, or None to split and encode them per query."""
+        chunk = self.line_chunks.get((hit.docId, hit.chunkId))
+        if chunk is None or chunk.rawText != hit.chunkText or len(chunk.lineEmbeddings) != len(chunk.lineSpans):
+            return None
+        return [chunk.rawText[start:end] for start, end in chunk.lineSpans], np.asarray(chunk.lineEmbeddings, dtype=np.float32)
+
+    @staticmethod
+    def _best_line(q_vec: List[float], line_rows: np.ndarray) -> int:
+        """Index of the line most similar to the question: one matrix-vector product over the stored rows."""
+        query = np.asarray(q_vec, dtype=np.float32)
+        norms = np.linalg.norm(line_rows, axis=1) * np.linalg.norm(query)
+        dots = line_rows @ query
+        # Zero-norm rows score 0, as cosine_similarity does
+        sims = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+        return int(np.argmax(sims))
+
     def answer(self, question: str, top_hits: List[Hit]) -> Answer:
         try:
             if not top_hits: return Answer("Bilgi bulunamadı.", [])
             best_hit = top_hits[0]
             chunk_text = best_hit.chunkText or ""
-            lines = [l.strip() for l in chunk_text.split("\n") if len(l.strip()) > 2]
+            stored = self._stored_lines(best_hit)
+            if stored is not None:
+                lines, line_rows = stored
+            else:
+                lines = [l.strip() for l in chunk_text.split("\n") if len(l.strip()) > 2]
             
             if not lines: return Answer(chunk_text, [Citation(best_hit.docId, f"Chunk{best_hit.chunkId}", 0, 0)])
 
@@ -281,15 +682,17 @@ class VectorAnswerAgent(AnswerAgent):
 
             if not found_strict_match and ("akademik" in doc_id or "kadro" in doc_id):
                 titles = ["prof", "doç", "dr.", "öğr", "arş", "gör"]
+                slug_matcher = TermMatcher(s for s in question.lower().split() if len(s) > 3)
                 for i, line in enumerate(lines):
                     if any(line.lower().startswith(t) for t in titles):
-                        q_slugs = question.lower().split()
-                        if sum(1 for s in q_slugs if s in line.lower() and len(s)>3) >= 1:
+                        if slug_matcher.any_in(line):
                             best_idx = i
                             found_strict_match = True 
                             break
             
-            if not found_strict_match:
+            if not found_strict_match and stored is not None:
+                best_idx = self._best_line(q_vec, line_rows)
+            elif not found_strict_match:
                 for i, line in enumerate(lines):
                     try:
                         s = cosine_similarity(q_vec, get_embedding(line))
@@ -312,7 +715,7 @@ class VectorAnswerAgent(AnswerAgent):
                 found_spec = False
                 if any(k in q_lower for k in ["nerede", "ofis", "oda"]):
                     for l in context_lines:
-                        if any(x in l.lower() for x in ["ofis", "office", "m2", "bina"]):
+                        if self.OFFICE_MATCHER.any_in(l):
                             filtered_academic.append(l); found_spec = True
                 elif any(k in q_lower for k in ["mail", "e-posta", "iletişim"]):
                     for l in context_lines:
@@ -0,0 +1,637 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from typing import Dict, List, Optional, Tuple, Iterator, Any, Mapping, Callable
+
+import numpy as np
+
+from src.analysis import get_analyzer
+from src.models import Chunk, IndexEntry, KeywordIndex
+
+
+class _LazyPostingsMap(Mapping):
+    """
+    Read-only Dict[str, List[IndexEntry]] view over a CompactIndex.
+    Postings are decoded only for the terms that are actually looked up.
+    """
+
+    def __init__(self, index: "CompactIndex"):
+        self._index = index
+
+    def __getitem__(self, term: str) -> List[IndexEntry]:
+        term_id = self._index.term_id(term)
+        if term_id < 0:
+            raise KeyError(term)
+        return self._index.entries(term_id)
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self._index.term_id(term) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for term_id in range(self._index.num_terms):
+            yield self._index.term(term_id)
+
+    def __len__(self) -> int:
+        return self._index.num_terms
+
+
+class CompactIndex(KeywordIndex):
+    """
+    Keyword index stored as flat arrays instead of one object per posting.
+
+    Layout (all arrays, memory-mappable):
+      - sorted term dictionary: UTF-8 blob + offsets
+      - postings: chunk ordinals, delta-encoded per term, plus term frequencies
+      - chunk table: ordinal -> (doc index, chunkId, token count) with a doc-id string table
+
+    Document frequencies are the posting-list lengths; the average chunk length is kept in meta.
+    Per-term score bounds (max tf, min chunk length over the term's postings) let
+    retrievers skip chunks that cannot reach the top-k; indexes written before
+    those sections existed get them computed on first use.
+    Positional indexes add the token offsets of every posting (position_offsets + positions).
+    Document-class bitmaps (one packed bit row per class in meta["docClasses"]) mark the
+    chunks of each class so retrieval can be restricted to e.g. the staff directory.
+
+    A chunk ordinal is the chunk's row in chunks.json (and in embeddings.npy).
+    It still satisfies the KeywordIndex interface through a lazy indexMap.
+    """
+
+    MAGIC: bytes = b"G13KIDX1"
+    VERSION: int = 2
+    ALIGN: int = 8
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Optional[Dict[str, Any]] = None):
+        self.arrays = arrays
+        self.meta: Dict[str, Any] = meta or {}
+        self.term_blob: np.ndarray = arrays["term_blob"]
+        self.term_offsets: np.ndarray = arrays["term_offsets"]
+        self.posting_offsets: np.ndarray = arrays["posting_offsets"]
+        self.posting_deltas: np.ndarray = arrays["posting_deltas"]
+        self.posting_tfs: np.ndarray = arrays["posting_tfs"]
+        self.doc_blob: np.ndarray = arrays["doc_blob"]
+        self.doc_offsets: np.ndarray = arrays["doc_offsets"]
+        self.chunk_docs: np.ndarray = arrays["chunk_docs"]
+        self.chunk_ids: np.ndarray = arrays["chunk_ids"]
+        self.chunk_lengths: np.ndarray = arrays["chunk_lengths"]
+        self._term_max_tfs: Optional[np.ndarray] = arrays.get("term_max_tfs")
+        self._term_min_lengths: Optional[np.ndarray] = arrays.get("term_min_lengths")
+        self.position_offsets: Optional[np.ndarray] = arrays.get("position_offsets")
+        self.positions_blob: Optional[np.ndarray] = arrays.get("positions")
+        self._class_masks: Dict[Tuple[str, ...], np.ndarray] = {}
+        self._query_analyzer = None
+        self.num_terms: int = len(self.term_offsets) - 1
+        self.num_chunks: int = len(self.chunk_ids)
+        self.doc_table: List[str] = [
+            bytes(self.doc_blob[self.doc_offsets[i]:self.doc_offsets[i + 1]]).decode("utf-8")
+            for i in range(len(self.doc_offsets) - 1)
+        ]
+
+    def __repr__(self) -> str:
+        return f"CompactIndex(terms={self.num_terms}, chunks={self.num_chunks}, postings={len(self.posting_tfs)})"
+
+    # --- KeywordIndex compatibility ---
+
+    @property
+    def indexMap(self) -> Mapping:
+        return _LazyPostingsMap(self)
+
+    @property
+    def chunkLengths(self) -> Dict[str, List[int]]:
+        lengths: Dict[str, List[int]] = {}
+        for ordinal in range(self.num_chunks):
+            doc_lengths = lengths.setdefault(self.doc_id(ordinal), [])
+            chunk_id = int(self.chunk_ids[ordinal])
+            doc_lengths.extend([0] * (chunk_id + 1 - len(doc_lengths)))
+            doc_lengths[chunk_id] = int(self.chunk_lengths[ordinal])
+        return lengths
+
+    def query_analyzer(self):
+        """
+        The analyzer the index was built with, for query terms. An analyzer that stems to known
+        words is bound to this index's terms, which give the same stems the corpus lexicon gave.
+        """
+        if self._query_analyzer is None:
+            self._query_analyzer = get_analyzer(self.meta.get("analyzer")).with_lexicon(self.indexMap)
+        return self._query_analyzer
+
+    # --- Statistics ---
+
+    @property
+    def avg_chunk_length(self) -> float:
+        if "avgChunkLength" in self.meta:
+            return float(self.meta["avgChunkLength"])
+        return float(self.chunk_lengths.mean()) if self.num_chunks else 0.0
+
+    def doc_freq(self, term_id: int) -> int:
+        """Number of chunks containing the term (length of its posting list)."""
+        return int(self.posting_offsets[term_id + 1] - self.posting_offsets[term_id])
+
+    def term_bounds(self, term_id: int) -> Tuple[int, int]:
+        """(max tf, min chunk length) over the term's postings, the inputs of its score upper bound."""
+        if self._term_max_tfs is None or self._term_min_lengths is None:
+            self._term_max_tfs, self._term_min_lengths = _term_bound_arrays(
+                self.posting_offsets, self.posting_deltas, self.posting_tfs, self.chunk_lengths)
+        return int(self._term_max_tfs[term_id]), int(self._term_min_lengths[term_id])
+
+    # --- Lookups ---
+
+    def _term_bytes(self, term_id: int) -> bytes:
+        return bytes(self.term_blob[self.term_offsets[term_id]:self.term_offsets[term_id + 1]])
+
+    def term(self, term_id: int) -> str:
+        return self._term_bytes(term_id).decode("utf-8")
+
+    def term_id(self, term: str) -> int:
+        """Binary search in the sorted term dictionary. Returns -1 when the term is absent."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._term_bytes(lo) == key:
+            return lo
+        return -1
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (chunk ordinals, term frequencies) for a term; empty arrays when absent."""
+        term_id = self.term_id(term)
+        if term_id < 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return self.postings_by_id(term_id)
+
+    @property
+    def has_positions(self) -> bool:
+        return self.position_offsets is not None and self.positions_blob is not None
+
+    def posting_positions(self, term_id: int, rank: int) -> np.ndarray:
+        """Token offsets of the term's rank-th posting (positional indexes only)."""
+        p = int(self.posting_offsets[term_id]) + rank
+        return np.asarray(self.positions_blob[self.position_offsets[p]:self.position_offsets[p + 1]], dtype=np.int64)
+
+    @property
+    def has_class_bitmaps(self) -> bool:
+        return "class_bitmaps" in self.arrays and "docClasses" in self.meta
+
+    def class_mask(self, classes: List[str]) -> Optional[np.ndarray]:
+        """
+        Boolean chunk mask (by ordinal) of the union of the given document classes.
+        None when the index has no class bitmaps. Masks are cached per class set.
+        """
+        if not self.has_class_bitmaps:
+            return None
+        key = tuple(sorted(set(classes)))
+        if key not in self._class_masks:
+            names: List[str] = self.meta["docClasses"]
+            rows = self.arrays["class_bitmaps"].reshape(len(names), (self.num_chunks + 7) // 8)
+            packed = np.zeros(rows.shape[1], dtype=np.uint8)
+            for name in key:
+                if name in names:
+                    packed |= rows[names.index(name)]
+            self._class_masks[key] = np.unpackbits(packed, count=self.num_chunks).astype(bool)
+        return self._class_masks[key]
+
+    def set_doc_classes(self, doc_classes: Mapping[str, str]) -> None:
+        """Builds the class bitmaps from a docId -> class mapping (for indexes written without them)."""
+        names, bitmaps = _class_bitmaps(self.chunk_docs, self.doc_table, doc_classes)
+        self.arrays["class_bitmaps"] = bitmaps
+        self.meta["docClasses"] = names
+        self._class_masks = {}
+
+    def postings_by_id(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = int(self.posting_offsets[term_id]), int(self.posting_offsets[term_id + 1])
+        ordinals = np.cumsum(self.posting_deltas[start:end], dtype=np.int64)
+        return ordinals, np.asarray(self.posting_tfs[start:end], dtype=np.int64)
+
+    def entries(self, term_id: int) -> List[IndexEntry]:
+        ordinals, tfs = self.postings_by_id(term_id)
+        if self.has_positions:
+            return [IndexEntry(self.doc_id(o), int(self.chunk_ids[o]), int(tf), self.posting_positions(term_id, r).tolist())
+                    for r, (o, tf) in enumerate(zip(ordinals, tfs))]
+        return [IndexEntry(self.doc_id(o), int(self.chunk_ids[o]), int(tf)) for o, tf in zip(ordinals, tfs)]
+
+    def doc_id(self, ordinal: int) -> str:
+        return self.doc_table[self.chunk_docs[ordinal]]
+
+    def chunk_id(self, ordinal: int) -> int:
+        return int(self.chunk_ids[ordinal])
+
+    # --- Construction ---
+
+    @staticmethod
+    def from_index(index: KeywordIndex, chunks: Optional[List[Chunk]] = None) -> "CompactIndex":
+        """Converts any KeywordIndex (e.g. one loaded from JSON) into a CompactIndex."""
+        if isinstance(index, CompactIndex):
+            return index
+        meta = {"analyzer": index.analyzer} if index.analyzer else None
+        return CompactIndex.from_map(index.indexMap, chunks, meta, chunk_lengths=index.chunkLengths or None)
+
+    @staticmethod
+    def from_map(index_map: Mapping, chunks: Optional[List[Chunk]] = None,
+                 meta: Optional[Dict[str, Any]] = None,
+                 chunk_lengths: Optional[Dict[str, List[int]]] = None,
+                 doc_classes: Optional[Mapping[str, str]] = None) -> "CompactIndex":
+        """
+        Builds a CompactIndex from a Dict[str, List[IndexEntry]].
+        Ordinals follow the order of `chunks` when given, otherwise first appearance in the postings.
+        A chunk listed twice under one term becomes one posting with the summed tf.
+        Chunk lengths default to the sum of each chunk's term frequencies.
+        doc_classes (docId -> class) adds the document-class bitmaps.
+        """
+        ordinal_of: Dict[Tuple[str, int], int] = {}
+        chunk_keys: List[Tuple[str, int]] = []
+
+        def ordinal(doc_id: str, chunk_id: int) -> int:
+            key = (doc_id, chunk_id)
+            if key not in ordinal_of:
+                ordinal_of[key] = len(chunk_keys)
+                chunk_keys.append(key)
+            return ordinal_of[key]
+
+        for c in chunks or []:
+            ordinal(c.docId, c.chunkId)
+
+        builder = _ArrayBuilder()
+        for term in sorted(index_map.keys(), key=lambda t: t.encode("utf-8")):
+            postings = _merge_duplicates(sorted(((ordinal(e.docId, e.chunkId), e.tf, e.positions)
+                                                 for e in index_map[term]), key=lambda p: p[0]))
+            positions = [p[2] for p in postings] if all(p[2] is not None for p in postings) else None
+            builder.add_term(term, [p[0] for p in postings], [p[1] for p in postings], positions)
+
+        if chunk_lengths is None:
+            chunk_lengths = chunk_lengths_from_postings(index_map)
+        lengths = [_length_of(chunk_lengths, doc_id, chunk_id) for doc_id, chunk_id in chunk_keys]
+        index = builder.finish(chunk_keys, lengths, meta)
+        if doc_classes is not None:
+            index.set_doc_classes(doc_classes)
+        return index
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index as: magic, header length, JSON header, then 8-byte aligned raw arrays.
+        """
+        sections = [
+            (name, arr.dtype, int(arr.size), lambda f, a=arr: f.write(np.ascontiguousarray(a).tobytes()))
+            for name, arr in self.arrays.items()
+        ]
+        _write_index_file(path, self.meta, sections)
+
+    @staticmethod
+    def load(path: str) -> "CompactIndex":
+        """Memory-maps an index written by save(); arrays are read-only views into the file."""
+        with open(path, "rb") as f:
+            if f.read(len(CompactIndex.MAGIC)) != CompactIndex.MAGIC:
+                raise ValueError(f"{path} is not a compact keyword index")
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        if header.get("version") != CompactIndex.VERSION:
+            raise ValueError(f"Unsupported index version {header.get('version')} in {path}")
+
+        data_start = CompactIndex._padded(len(CompactIndex.MAGIC) + 8 + header_len)
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays: Dict[str, np.ndarray] = {}
+        for name, sec in header["sections"].items():
+            dtype = np.dtype(sec["dtype"])
+            start = data_start + sec["offset"]
+            # Plain ndarray views of the map: same zero-copy pages without np.memmap's per-slice overhead
+            arrays[name] = np.asarray(buf[start:start + sec["count"] * dtype.itemsize]).view(dtype)
+        return CompactIndex(arrays, header.get("meta"))
+
+    @staticmethod
+    def _padded(n: int) -> int:
+        return (n + CompactIndex.ALIGN - 1) // CompactIndex.ALIGN * CompactIndex.ALIGN
+
+
+def _write_index_file(path: str, meta: Dict[str, Any], sections: List[Tuple[str, Any, int, Callable]]) -> None:
+    """
+    Shared writer for CompactIndex files.
+    Each section is (name, dtype, element count, write(f)) and is padded to CompactIndex.ALIGN.
+    """
+    table: Dict[str, Dict[str, Any]] = {}
+    offset = 0
+    for name, dtype, count, _ in sections:
+        dtype = np.dtype(dtype)
+        table[name] = {"offset": offset, "dtype": dtype.str, "count": count}
+        offset += CompactIndex._padded(count * dtype.itemsize)
+
+    header = json.dumps({"version": CompactIndex.VERSION, "meta": meta, "sections": table},
+                        ensure_ascii=False).encode("utf-8")
+    data_start = CompactIndex._padded(len(CompactIndex.MAGIC) + 8 + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CompactIndex.MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, dtype, count, write in sections:
+            start = f.tell()
+            write(f)
+            written = f.tell() - start
+            if written != count * np.dtype(dtype).itemsize:
+                raise ValueError(f"Section '{name}' wrote {written} bytes, expected {count * np.dtype(dtype).itemsize}")
+            f.write(b"\0" * (CompactIndex._padded(written) - written))
+    os.replace(tmp_path, path)
+
+
+class CompactIndexWriter:
+    """
+    Streams a CompactIndex to disk without holding the postings in memory.
+
+    Chunks are registered in ordinal order with add_chunk(); terms must be added
+    in UTF-8 byte order (e.g. from a k-way merge of sorted runs). Postings go to
+    temporary files and are copied into the final file by close().
+    """
+
+    def __init__(self, tmp_dir: Optional[str] = None, positional: bool = False):
+        self._tmp = tempfile.TemporaryDirectory(prefix="index-writer-", dir=tmp_dir)
+        self._deltas = open(os.path.join(self._tmp.name, "deltas.u4"), "w+b")
+        self._tfs = open(os.path.join(self._tmp.name, "tfs.u4"), "w+b")
+        self.positional = positional
+        self._positions = open(os.path.join(self._tmp.name, "positions.u4"), "w+b") if positional else None
+        self._position_offsets = array("q", [0])
+        self._term_bytes: List[bytes] = []
+        self._posting_offsets = array("q", [0])
+        self._doc_index: Dict[str, int] = {}
+        self._chunk_docs = array("I")
+        self._chunk_ids = array("I")
+        self._chunk_lengths = array("I")
+        self._term_max_tfs = array("I")
+        self._term_min_lengths = array("I")
+        self._last_term: Optional[bytes] = None
+
+    def add_chunk(self, doc_id: str, chunk_id: int, length: int = 0) -> int:
+        """Registers the next chunk (with its token count) and returns its ordinal."""
+        self._chunk_docs.append(self._doc_index.setdefault(doc_id, len(self._doc_index)))
+        self._chunk_ids.append(chunk_id)
+        self._chunk_lengths.append(length)
+        return len(self._chunk_ids) - 1
+
+    def add_term(self, term: str, ordinals: List[int], tfs: List[int],
+                 positions: Optional[List[List[int]]] = None) -> None:
+        key = term.encode("utf-8")
+        if self._last_term is not None and key <= self._last_term:
+            raise ValueError(f"Terms must be added in sorted order ('{term}')")
+        self._last_term = key
+
+        ords = np.asarray(ordinals, dtype=np.int64)
+        tf_arr = np.asarray(tfs, dtype=np.uint32)
+        self._term_bytes.append(key)
+        self._deltas.write(np.diff(ords, prepend=0).astype(np.uint32).tobytes())
+        self._tfs.write(tf_arr.tobytes())
+        self._posting_offsets.append(self._posting_offsets[-1] + len(ords))
+        # Chunks are all registered before the first term, so their lengths are known here
+        lengths = np.frombuffer(self._chunk_lengths, dtype=np.uint32)[ords] if len(ords) else ords
+        self._term_max_tfs.append(int(tf_arr.max()) if len(ords) else 0)
+        self._term_min_lengths.append(int(lengths.min()) if len(ords) else 0)
+        if self._positions is not None:
+            if positions is None or len(positions) != len(ords):
+                raise ValueError(f"Positional index needs positions for every posting of '{term}'")
+            for pos in positions:
+                self._positions.write(np.asarray(pos, dtype=np.uint32).tobytes())
+                self._position_offsets.append(self._position_offsets[-1] + len(pos))
+
+    def close(self, path: str, meta: Optional[Dict[str, Any]] = None,
+              doc_classes: Optional[Mapping[str, str]] = None) -> None:
+        """Writes the index file; doc_classes (docId -> class) adds the document-class bitmaps."""
+        try:
+            n_postings = self._posting_offsets[-1]
+            doc_bytes = [d.encode("utf-8") for d in self._doc_index]
+            arrays = {
+                "term_blob": _blob(self._term_bytes),
+                "term_offsets": _offsets(self._term_bytes),
+                "posting_offsets": np.frombuffer(self._posting_offsets, dtype=np.int64),
+            }
+            sections = [(name, arr.dtype, int(arr.size), lambda f, a=arr: f.write(a.tobytes()))
+                        for name, arr in arrays.items()]
+            sections.append(("posting_deltas", np.uint32, n_postings, lambda f: _copy_from_start(self._deltas, f)))
+            sections.append(("posting_tfs", np.uint32, n_postings, lambda f: _copy_from_start(self._tfs, f)))
+            tail = {
+                "doc_blob": _blob(doc_bytes),
+                "doc_offsets": _offsets(doc_bytes),
+                "chunk_docs": np.frombuffer(self._chunk_docs, dtype=np.uint32),
+                "chunk_ids": np.frombuffer(self._chunk_ids, dtype=np.uint32),
+                "chunk_lengths": np.frombuffer(self._chunk_lengths, dtype=np.uint32),
+                "term_max_tfs": np.frombuffer(self._term_max_tfs, dtype=np.uint32),
+                "term_min_lengths": np.frombuffer(self._term_min_lengths, dtype=np.uint32),
+            }
+            sections.extend((name, arr.dtype, int(arr.size), lambda f, a=arr: f.write(a.tobytes()))
+                            for name, arr in tail.items())
+            if self._positions is not None:
+                offsets = np.frombuffer(self._position_offsets, dtype=np.int64)
+                sections.append(("position_offsets", np.int64, int(offsets.size), lambda f: f.write(offsets.tobytes())))
+                sections.append(("positions", np.uint32, int(offsets[-1]),
+                                 lambda f: _copy_from_start(self._positions, f)))
+            meta = _with_stats(meta, tail["chunk_lengths"])
+            if doc_classes is not None:
+                meta["docClasses"], bitmaps = _class_bitmaps(tail["chunk_docs"], list(self._doc_index), doc_classes)
+                sections.append(("class_bitmaps", np.uint8, int(bitmaps.size), lambda f: f.write(bitmaps.tobytes())))
+            _write_index_file(path, meta, sections)
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        """Discards the scratch files without writing an index."""
+        self._deltas.close()
+        self._tfs.close()
+        if self._positions is not None:
+            self._positions.close()
+        self._tmp.cleanup()
+
+
+def _copy_from_start(src, dst) -> None:
+    src.flush()
+    src.seek(0)
+    shutil.copyfileobj(src, dst, 1 << 20)
+
+
+class _ArrayBuilder:
+    """Accumulates sorted terms and their postings into CompactIndex arrays."""
+
+    def __init__(self):
+        self.term_bytes: List[bytes] = []
+        self.posting_offsets: List[int] = [0]
+        self.deltas: List[np.ndarray] = []
+        self.tfs: List[np.ndarray] = []
+        # Stays positional only while every added term carries positions
+        self.positions: Optional[List[List[int]]] = []
+
+    def add_term(self, term: str, ordinals: List[int], tfs: List[int],
+                 positions: Optional[List[List[int]]] = None) -> None:
+        """Adds one term; terms must arrive in UTF-8 byte order and ordinals ascending."""
+        ords = np.asarray(ordinals, dtype=np.int64)
+        self.term_bytes.append(term.encode("utf-8"))
+        self.deltas.append(np.diff(ords, prepend=0).astype(np.uint32))
+        self.tfs.append(np.asarray(tfs, dtype=np.uint32))
+        self.posting_offsets.append(self.posting_offsets[-1] + len(ords))
+        if positions is None:
+            self.positions = None
+        elif self.positions is not None:
+            self.positions.extend(positions)
+
+    def finish(self, chunk_keys: List[Tuple[str, int]], lengths: List[int],
+               meta: Optional[Dict[str, Any]] = None) -> CompactIndex:
+        doc_index: Dict[str, int] = {}
+        for doc_id, _ in chunk_keys:
+            doc_index.setdefault(doc_id, len(doc_index))
+        doc_bytes = [d.encode("utf-8") for d in doc_index]
+
+        arrays = {
+            "term_blob": _blob(self.term_bytes),
+            "term_offsets": _offsets(self.term_bytes),
+            "posting_offsets": np.asarray(self.posting_offsets, dtype=np.int64),
+            "posting_deltas": np.concatenate(self.deltas) if self.deltas else np.zeros(0, dtype=np.uint32),
+            "posting_tfs": np.concatenate(self.tfs) if self.tfs else np.zeros(0, dtype=np.uint32),
+            "doc_blob": _blob(doc_bytes),
+            "doc_offsets": _offsets(doc_bytes),
+            "chunk_docs": np.asarray([doc_index[d] for d, _ in chunk_keys], dtype=np.uint32),
+            "chunk_ids": np.asarray([c for _, c in chunk_keys], dtype=np.uint32),
+            "chunk_lengths": np.asarray(lengths, dtype=np.uint32),
+        }
+        arrays["term_max_tfs"], arrays["term_min_lengths"] = _term_bound_arrays(
+            arrays["posting_offsets"], arrays["posting_deltas"], arrays["posting_tfs"], arrays["chunk_lengths"])
+        if self.positions and len(self.positions) == self.posting_offsets[-1]:
+            arrays["position_offsets"] = np.concatenate(
+                ([0], np.cumsum([len(p) for p in self.positions], dtype=np.int64))).astype(np.int64)
+            arrays["positions"] = np.asarray([x for p in self.positions for x in p], dtype=np.uint32)
+        return CompactIndex(arrays, _with_stats(meta, arrays["chunk_lengths"]))
+
+
+def _term_bound_arrays(posting_offsets: np.ndarray, posting_deltas: np.ndarray, posting_tfs: np.ndarray,
+                       chunk_lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-term max tf and min chunk length, computed over all postings at once."""
+    n_terms = len(posting_offsets) - 1
+    counts = np.diff(posting_offsets)
+    max_tfs = np.zeros(n_terms, dtype=np.uint32)
+    min_lengths = np.zeros(n_terms, dtype=np.uint32)
+    present = np.flatnonzero(counts)
+    if len(present) == 0:
+        return max_tfs, min_lengths
+
+    # Deltas restart at every term, so subtract each term's running total at its start
+    running = np.cumsum(posting_deltas, dtype=np.int64)
+    starts = np.asarray(posting_offsets[:-1], dtype=np.int64)
+    base = np.where(starts > 0, running[np.maximum(starts - 1, 0)], 0)
+    ordinals = running - np.repeat(base, counts)
+
+    seg_starts = starts[present]
+    max_tfs[present] = np.maximum.reduceat(np.asarray(posting_tfs, dtype=np.uint32), seg_starts)
+    min_lengths[present] = np.minimum.reduceat(np.asarray(chunk_lengths, dtype=np.uint32)[ordinals], seg_starts)
+    return max_tfs, min_lengths
+
+
+def _class_bitmaps(chunk_docs: np.ndarray, doc_table: List[str],
+                   doc_classes: Mapping[str, str]) -> Tuple[List[str], np.ndarray]:
+    """Class names (sorted) and their chunk bitmaps, one np.packbits row per class, flattened."""
+    names = sorted(set(doc_classes.get(d, "") for d in doc_table) - {""})
+    class_of_doc = np.asarray([names.index(doc_classes[d]) if doc_classes.get(d) else -1 for d in doc_table],
+                              dtype=np.int64)
+    chunk_classes = class_of_doc[np.asarray(chunk_docs, dtype=np.int64)] if len(doc_table) else np.zeros(0, np.int64)
+    rows = [np.packbits(chunk_classes == c) for c in range(len(names))]
+    return names, (np.concatenate(rows) if rows else np.zeros(0, dtype=np.uint8))
+
+
+def _with_stats(meta: Optional[Dict[str, Any]], lengths: np.ndarray) -> Dict[str, Any]:
+    stats = dict(meta or {})
+    stats["numChunks"] = int(lengths.size)
+    stats["avgChunkLength"] = float(lengths.mean()) if lengths.size else 0.0
+    return stats
+
+
+def _merge_duplicates(postings: List[Tuple[int, int, Optional[List[int]]]]) -> List[Tuple[int, int, Optional[List[int]]]]:
+    """Merges (ordinal, tf, positions) postings sorted by ordinal that repeat an ordinal (seen in old JSON indexes)."""
+    merged: List[Tuple[int, int, Optional[List[int]]]] = []
+    for ordinal, tf, positions in postings:
+        if merged and merged[-1][0] == ordinal:
+            _, prev_tf, prev_positions = merged[-1]
+            both = sorted(prev_positions + positions) if prev_positions is not None and positions is not None else None
+            merged[-1] = (ordinal, prev_tf + tf, both)
+        else:
+            merged.append((ordinal, tf, positions))
+    return merged
+
+
+def _length_of(chunk_lengths: Dict[str, List[int]], doc_id: str, chunk_id: int) -> int:
+    doc_lengths = chunk_lengths.get(doc_id, [])
+    return doc_lengths[chunk_id] if 0 <= chunk_id < len(doc_lengths) else 0
+
+
+def chunk_lengths_from_postings(index_map: Mapping) -> Dict[str, List[int]]:
+    """
+    Derives chunkLengths[docId][chunkId] by summing term frequencies.
+    Exact for indexes that store true tf; a distinct-term count for legacy tf=1 indexes.
+    """
+    lengths: Dict[str, List[int]] = {}
+    for entries in index_map.values():
+        for e in entries:
+            doc_lengths = lengths.setdefault(e.docId, [])
+            if e.chunkId >= len(doc_lengths):
+                doc_lengths.extend([0] * (e.chunkId + 1 - len(doc_lengths)))
+            doc_lengths[e.chunkId] += e.tf
+    return lengths
+
+
+def average_chunk_length(chunk_lengths: Dict[str, List[int]]) -> float:
+    all_lengths = [n for doc_lengths in chunk_lengths.values() for n in doc_lengths]
+    return sum(all_lengths) / len(all_lengths) if all_lengths else 0.0
+
+
+def _blob(items: List[bytes]) -> np.ndarray:
+    return np.frombuffer(b"".join(items), dtype=np.uint8).copy()
+
+
+def _offsets(items: List[bytes]) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum([len(b) for b in items], dtype=np.int64))).astype(np.int64)
+
+
+def load_json_index(path: str) -> KeywordIndex:
+    """
+    Loads the JSON index ({"indexMap": {term: [IndexEntry, ...]}, "chunkLengths": {...}}).
+    Older files without chunkLengths get lengths derived from their postings,
+    and files without an "analyzer" key hold surface forms.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data: Any = json.load(f)
+    source_data: Any = data.get("indexMap", data)
+
+    if not isinstance(source_data, dict):
+        return KeywordIndex({})
+
+    index_map: Dict[str, List[IndexEntry]] = {}
+    for term, entries in source_data.items():
+        if not isinstance(entries, list):
+            continue
+        index_map[term] = [IndexEntry(**e) for e in entries if isinstance(e, dict)]
+
+    chunk_lengths: Any = data.get("chunkLengths")
+    if not isinstance(chunk_lengths, dict):
+        chunk_lengths = chunk_lengths_from_postings(index_map)
+    analyzer: Any = data.get("analyzer")
+    return KeywordIndex(index_map, chunk_lengths, analyzer if isinstance(analyzer, dict) else None)
+
+
+def save_json_index(index_map: Mapping, path: str, chunk_lengths: Optional[Dict[str, List[int]]] = None,
+                    analyzer: Optional[Dict[str, Any]] = None) -> None:
+    """Exports postings plus chunk length statistics in the JSON format."""
+    if chunk_lengths is None:
+        chunk_lengths = chunk_lengths_from_postings(index_map)
+    # positions are only written for positional indexes, so regular exports keep their old layout
+    index_export = {k: [{f: x for f, x in e.__dict__.items() if f != "positions" or x is not None} for e in v]
+                    for k, v in index_map.items()}
+    data: Dict[str, Any] = {
+        "indexMap": index_export,
+        "chunkLengths": chunk_lengths,
+        "avgChunkLength": average_chunk_length(chunk_lengths),
+    }
+    if analyzer is not None:
+        data["analyzer"] = analyzer
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
@@ -1,18 +1,54 @@
 import os
 import json
 import re
-from typing import List, Dict, Set, Any
+import argparse
+import hashlib
+import uuid
+from collections import Counter
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from typing import List, Dict, Any, Optional, Tuple, Iterator, FrozenSet
 from src.models import Chunk, IndexEntry
-from src.utils import get_embedding
+from src.utils import get_embeddings, embedding_cache, EMBEDDING_DIM
+from src.index_store import CompactIndex, CompactIndexWriter, load_json_index, save_json_index, average_chunk_length
+from src.streaming import JsonArrayWriter, JsonIndexWriter, EmbeddingMatrixWriter, SpillingPostingsBuffer
+from src.ann import IvfIndex
+from src.analysis import get_analyzer
+from src.facts import FactTables
+
+# Corpus lexicon of a pool worker, sent once by IndexerMain.init_worker instead of with every job
+_worker_lexicon: Optional[FrozenSet[str]] = None
 
 class IndexerMain:
     """
     Handles document processing, semantic chunking, and index generation.
-    Now includes an auto-purge feature for the query cache.
+    Every build is stamped with a generation ID and per-document versions in the manifest,
+    which the query cache uses to drop only the answers whose cited documents changed.
     """
     MAX_CHUNK_CHARS: int = 1000
     OVERLAP_CHARS: int = 150
-    CACHE_FILE: str = "data/query_cache.json" # Path to the cache file 
+    EMBED_BATCH_SIZE: int = 64
+    MEMORY_BUDGET_MB: float = 256.0 # Postings buffer size before spilling runs in --stream mode
+    CACHE_FILE: str = "data/query_cache.jsonl" # Path to the cache log
+    LEGACY_CACHE_FILE: str = "data/query_cache.json" # Cache file of the old single-JSON format
+    SQLITE_CACHE_FILE: str = "data/query_cache.sqlite" # Cache database shared by workers (cache.backend "sqlite")
+    CHUNKS_FILE: str = "data/chunks.json"
+    INDEX_FILE: str = "data/index.json"
+    BINARY_INDEX_FILE: str = "data/index.bin"
+    EMBEDDINGS_FILE: str = "data/embeddings.npy" # Row i holds the embedding of chunk i in CHUNKS_FILE
+    MANIFEST_FILE: str = "data/manifest.json" # Per-file content hashes for incremental builds
+    ANN_FILE: str = "data/ann_ivf.npz" # IVF-flat index over EMBEDDINGS_FILE for the dense retriever
+    LINE_EMBEDDINGS_FILE: str = "data/line_embeddings.npy" # Embeddings of every chunk's lineSpans, in chunk order
+    FACTS_FILE: str = "data/facts.json" # Course code and staff name lookup tables for the pipeline's fast path
+
+    STRATEGY_LABELS: Dict[str, str] = {
+        "DISIPLIN": "Special Semantic Chunking (DISIPLIN)",
+        "STAFF": "Semantic Chunking (STAFF)",
+        "COURSE": "Semantic Chunking (COURSE)",
+        "REGULATION": "Semantic Chunking (REGULATION)",
+        "PARAGRAPH": "Standard Paragraph Chunking",
+    }
 
     @staticmethod
     def tokenize(text: str) -> List[str]:
@@ -84,8 +120,81 @@ class IndexerMain:
         return IndexerMain.enforce_max_length(clean_chunks)
 
     @staticmethod
-    def process_file(path: str, filename: str, all_chunks: List[Chunk], raw_index_map: Dict[str, List[IndexEntry]]) -> None:
-        """Reads a file and applies the appropriate semantic chunking strategy."""
+    def select_strategy(filename: str) -> str:
+        """Picks the chunking strategy for a corpus file based on its name."""
+        fname = filename.lower()
+        if "disiplin" in fname:
+            return "DISIPLIN"
+        if "akademik" in fname or "kadro" in fname:
+            return "STAFF"
+        if "ders" in fname or "plan" in fname or "course" in fname:
+            return "COURSE"
+        if any(kw in fname for kw in ["yönetmelik", "yönerge", "mevzuat", "sınav"]):
+            return "REGULATION"
+        return "PARAGRAPH"
+
+    @staticmethod
+    def doc_classes(doc_ids: List[str]) -> Dict[str, str]:
+        """
+        Maps each docId to its document class (the chunking strategy of its file).
+        The keyword index stores one chunk bitmap per class for intent-scoped retrieval.
+        """
+        return {doc_id: IndexerMain.select_strategy(doc_id) for doc_id in doc_ids}
+
+    @staticmethod
+    def split_by_strategy(strategy: str, content: str) -> List[str]:
+        """Applies the chunking strategy returned by select_strategy."""
+        if strategy == "DISIPLIN":
+            return IndexerMain.split_regulations_special(content)
+        if strategy == "STAFF":
+            return IndexerMain.split_academic_staff(content)
+        if strategy == "COURSE":
+            return IndexerMain.split_courses(content)
+        if strategy == "REGULATION":
+            return IndexerMain.split_regulations(content)
+        paragraphs = content.split("\n\n")
+        raw_segments = [p.strip() for p in paragraphs if len(p.strip()) > 10]
+        return IndexerMain.enforce_max_length(raw_segments)
+
+    @staticmethod
+    def build_fact_tables(all_chunks: List[Chunk]) -> FactTables:
+        """Extracts the course and staff tables from the chunks of COURSE and STAFF documents."""
+        facts = FactTables()
+        for chunk in all_chunks:
+            facts.add_chunk(chunk, IndexerMain.select_strategy(chunk.docId))
+        return facts
+
+    @staticmethod
+    def line_spans(text: str) -> List[List[int]]:
+        """
+        [start, end) offsets of the stripped lines longer than 2 characters, the same
+        lines VectorAnswerAgent picks its answer from.
+        """
+        spans: List[List[int]] = []
+        pos = 0
+        for line in text.split("\n"):
+            stripped = line.strip()
+            if len(stripped) > 2:
+                start = pos + len(line) - len(line.lstrip())
+                spans.append([start, start + len(stripped)])
+            pos += len(line) + 1
+        return spans
+
+    @staticmethod
+    def chunk_record(chunk: Chunk) -> Dict[str, Any]:
+        """A chunk as stored in chunks.json (vectors live in the .npy matrices, not in JSON)."""
+        return {k: v for k, v in chunk.__dict__.items() if k not in ("embedding", "lineEmbeddings")}
+
+    @staticmethod
+    def process_file(path: str, filename: str, all_chunks: List[Chunk], raw_index_map: Dict[str, List[IndexEntry]],
+                     batch_size: int = EMBED_BATCH_SIZE, positional: bool = False,
+                     analyzer: Optional[Dict[str, Any]] = None, lexicon: Optional[FrozenSet[str]] = None) -> None:
+        """
+        Reads a file and applies the appropriate semantic chunking strategy.
+        With positional=True every posting also records the term's token offsets in the chunk.
+        analyzer selects how chunk text becomes index terms (None = legacy surface tokens);
+        lexicon is the corpus's surface words for analyzers that only stem to known words.
+        """
         try:
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
@@ -93,102 +202,664 @@ class IndexerMain:
             print(f"ERROR: Could not read file {path}. Reason: {e}")
             return
 
-        fname = filename.lower()
-        text_segments: List[str] = []
-        
-        # Strategy Selection
-        if "disiplin" in fname:
-            print(f"   -> Special Semantic Chunking (DISIPLIN) for {filename}")
-            text_segments = IndexerMain.split_regulations_special(content)
-        elif "akademik" in fname or "kadro" in fname:
-            print(f"   -> Semantic Chunking (STAFF) for {filename}")
-            text_segments = IndexerMain.split_academic_staff(content)
-        elif "ders" in fname or "plan" in fname or "course" in fname:
-            print(f"   -> Semantic Chunking (COURSE) for {filename}")
-            text_segments = IndexerMain.split_courses(content)
-        elif any(kw in fname for kw in ["yönetmelik", "yönerge", "mevzuat", "sınav"]):
-            print(f"   -> Semantic Chunking (REGULATION) for {filename}")
-            text_segments = IndexerMain.split_regulations(content)
-        else:
-            print(f"   -> Standard Paragraph Chunking for {filename}")
-            paragraphs = content.split("\n\n")
-            raw_segments = [p.strip() for p in paragraphs if len(p.strip()) > 10]
-            text_segments = IndexerMain.enforce_max_length(raw_segments)
+        strategy = IndexerMain.select_strategy(filename)
+        print(f"   -> {IndexerMain.STRATEGY_LABELS[strategy]} for {filename}")
+        text_segments: List[str] = IndexerMain.split_by_strategy(strategy, content)
 
         doc_id = filename.replace(".txt", "")
         local_chunk_id = 0
-        
-        for segment in text_segments:
-            # Generate embedding for vector search
-            emb = get_embedding(segment)
-            
+        text_analyzer = get_analyzer(analyzer).with_lexicon(lexicon)
+
+        # Answer lines are encoded here, in the same batch as the chunks, instead of once per query
+        segment_lines = [IndexerMain.line_spans(segment) for segment in text_segments]
+        line_texts = [segment[start:end] for segment, spans in zip(text_segments, segment_lines) for start, end in spans]
+
+        # Generate embeddings for vector search in batches instead of one forward pass per chunk
+        vectors = get_embeddings(text_segments + line_texts, batch_size)
+        embeddings, line_vectors = vectors[:len(text_segments)], vectors[len(text_segments):]
+        line_start = 0
+
+        for segment, emb, spans in zip(text_segments, embeddings, segment_lines):
             chunk = Chunk(
                 docId=doc_id,
                 chunkId=local_chunk_id,
                 rawText=segment,
                 startOffset=0,
                 endOffset=len(segment),
-                embedding=emb
+                embedding=emb,
+                lineSpans=spans,
+                lineEmbeddings=line_vectors[line_start:line_start + len(spans)]
             )
+            line_start += len(spans)
             all_chunks.append(chunk)
 
-            # Update Keyword Index
-            tokens = IndexerMain.tokenize(segment)
-            seen_tokens: Set[str] = set()
-            for t in tokens:
-                if t in seen_tokens: continue
-                seen_tokens.add(t)
-                
+            # Update Keyword Index with the true per-chunk term frequencies
+            tokens = text_analyzer.analyze(segment)
+            term_counts: Dict[str, int] = Counter(tokens)
+            term_positions: Dict[str, List[int]] = {}
+            if positional:
+                for pos, t in enumerate(tokens):
+                    term_positions.setdefault(t, []).append(pos)
+
+            for t, tf in term_counts.items():
                 if t not in raw_index_map:
                     raw_index_map[t] = []
                 
-                raw_index_map[t].append(IndexEntry(docId=doc_id, chunkId=local_chunk_id, tf=1))
+                raw_index_map[t].append(IndexEntry(docId=doc_id, chunkId=local_chunk_id, tf=tf,
+                                                   positions=term_positions.get(t)))
             
             local_chunk_id += 1
 
     @staticmethod
-    def main() -> None:
+    def init_worker(lexicon: Optional[FrozenSet[str]]) -> None:
+        """Process pool initializer: keeps the corpus lexicon for every job the worker runs."""
+        global _worker_lexicon
+        _worker_lexicon = lexicon
+
+    @staticmethod
+    def index_file(job: Tuple) -> Tuple[List[Chunk], Dict[str, List[IndexEntry]]]:
+        """
+        Worker entry point: indexes a single file into its own chunk list and postings map.
+        job is (path, filename, batch_size[, positional[, analyzer[, lexicon]]]); without a
+        lexicon the one the pool initializer installed is used.
+        Kept as a static method so it can be pickled into a process pool.
+        """
+        path, filename, batch_size = job[:3]
+        positional = len(job) > 3 and bool(job[3])
+        analyzer = job[4] if len(job) > 4 else None
+        lexicon = job[5] if len(job) > 5 else _worker_lexicon
+        chunks: List[Chunk] = []
+        postings: Dict[str, List[IndexEntry]] = {}
+        IndexerMain.process_file(path, filename, chunks, postings, batch_size, positional, analyzer, lexicon)
+        return chunks, postings
+
+    @staticmethod
+    def merge_file_result(result: Tuple[List[Chunk], Dict[str, List[IndexEntry]]],
+                          all_chunks: List[Chunk], raw_index_map: Dict[str, List[IndexEntry]]) -> None:
+        """
+        Appends one file's chunks and postings to the global structures.
+        Merging results in file order reproduces the serial insertion order exactly.
+        """
+        chunks, postings = result
+        all_chunks.extend(chunks)
+        for term, entries in postings.items():
+            if term not in raw_index_map:
+                raw_index_map[term] = []
+            raw_index_map[term].extend(entries)
+
+    @staticmethod
+    def index_corpus(corpus_dir: str, files: List[str], all_chunks: List[Chunk],
+                     raw_index_map: Dict[str, List[IndexEntry]], workers: int = 1,
+                     batch_size: int = EMBED_BATCH_SIZE, positional: bool = False,
+                     analyzer: Optional[Dict[str, Any]] = None, lexicon: Optional[FrozenSet[str]] = None) -> None:
+        """
+        Indexes every file serially or across a process pool.
+        chunkIds are local to each document, so the parallel output is identical to the serial one.
+        """
+        # The lexicon reaches pool workers once, through the initializer, not with every job
+        jobs = [(os.path.join(corpus_dir, filename), filename, batch_size, positional, analyzer)
+                for filename in files]
+
+        if workers <= 1 or len(jobs) <= 1:
+            for path, filename, *_ in jobs:
+                print(f"Processing: {filename}")
+                IndexerMain.process_file(path, filename, all_chunks, raw_index_map, batch_size, positional,
+                                         analyzer, lexicon)
+            return
+
+        print(f"Processing {len(jobs)} files with {workers} worker processes...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=IndexerMain.init_worker,
+                                 initargs=(lexicon,)) as pool:
+            # map() yields results in submission order, which keeps the merge deterministic
+            for (path, filename, *_), result in zip(jobs, pool.map(IndexerMain.index_file, jobs)):
+                print(f"Processed: {filename}")
+                IndexerMain.merge_file_result(result, all_chunks, raw_index_map)
+
+    @staticmethod
+    def save_embeddings(all_chunks: List[Chunk], path: str) -> None:
+        """
+        Writes chunk embeddings as one contiguous float32 matrix, row-aligned with chunks.json.
+        The pipeline memory-maps this file instead of parsing float lists out of JSON.
+        """
+        matrix = np.zeros((len(all_chunks), EMBEDDING_DIM), dtype=np.float32)
+        for row, chunk in enumerate(all_chunks):
+            if chunk.embedding is not None and len(chunk.embedding) == EMBEDDING_DIM:
+                matrix[row] = chunk.embedding
+        # Write next to the target and swap it in, so readers that still map the old file are unaffected
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def line_rows(chunk: Chunk) -> np.ndarray:
+        """The chunk's line embeddings as float32 rows (zero rows where a vector is missing)."""
+        rows = np.zeros((len(chunk.lineSpans or []), EMBEDDING_DIM), dtype=np.float32)
+        for i, vec in enumerate(chunk.lineEmbeddings if chunk.lineEmbeddings is not None else []):
+            if i < len(rows) and len(vec) == EMBEDDING_DIM:
+                rows[i] = vec
+        return rows
+
+    @staticmethod
+    def save_line_embeddings(all_chunks: List[Chunk], path: str) -> None:
+        """
+        Writes the line embeddings of all chunks as one float32 matrix: chunk i's lines
+        follow those of chunk i-1, so row offsets are the running sum of len(lineSpans).
+        """
+        matrix = np.concatenate([np.zeros((0, EMBEDDING_DIM), dtype=np.float32)]
+                                + [IndexerMain.line_rows(chunk) for chunk in all_chunks])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def build_ann_index(embeddings_path: str, path: str, n_lists: Optional[int] = None) -> None:
+        """Clusters the saved embedding matrix into an IVF index for DenseRetriever."""
+        matrix = np.load(embeddings_path, mmap_mode="r")
+        ann_index = IvfIndex.build(matrix, n_lists=n_lists or None)
+        ann_index.save(path)
+        print(f"Built ANN index: {ann_index.n_lists} lists over {len(matrix)} embeddings")
+
+    @staticmethod
+    def save_outputs(all_chunks: List[Chunk], raw_index_map: Dict[str, List[IndexEntry]],
+                     manifest: Dict[str, Any], index_format: str = "binary", ann_lists: int = 0,
+                     analyzer: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Writes chunks, embeddings, keyword index and the build manifest.
+        index_format is "binary" (compact index.bin), "json" (legacy index.json) or "both".
+        The analyzer settings are stored with the index so queries are analyzed the same way.
+        """
+        try:
+            os.makedirs("data", exist_ok=True)
+            # Save chunks (embeddings live in the .npy matrix, not in JSON)
+            with open(IndexerMain.CHUNKS_FILE, "w", encoding="utf-8") as f:
+                json.dump([IndexerMain.chunk_record(c) for c in all_chunks],
+                          f, ensure_ascii=False, indent=2)
+
+            # Save embedding matrices
+            IndexerMain.save_embeddings(all_chunks, IndexerMain.EMBEDDINGS_FILE)
+            IndexerMain.save_line_embeddings(all_chunks, IndexerMain.LINE_EMBEDDINGS_FILE)
+
+            saved = [IndexerMain.CHUNKS_FILE, IndexerMain.EMBEDDINGS_FILE, IndexerMain.LINE_EMBEDDINGS_FILE]
+            IndexerMain.build_fact_tables(all_chunks).save(IndexerMain.FACTS_FILE)
+            saved.append(IndexerMain.FACTS_FILE)
+            IndexerMain.build_ann_index(IndexerMain.EMBEDDINGS_FILE, IndexerMain.ANN_FILE, ann_lists)
+            saved.append(IndexerMain.ANN_FILE)
+
+            if index_format in ("binary", "both"):
+                meta = {"analyzer": analyzer} if analyzer else None
+                doc_classes = IndexerMain.doc_classes(list(dict.fromkeys(c.docId for c in all_chunks)))
+                compact = CompactIndex.from_map(raw_index_map, all_chunks, meta, doc_classes=doc_classes)
+                compact.save(IndexerMain.BINARY_INDEX_FILE)
+                saved.append(IndexerMain.BINARY_INDEX_FILE)
+            elif os.path.exists(IndexerMain.BINARY_INDEX_FILE):
+                # The pipeline prefers index.bin, so never leave a stale one behind a JSON-only export
+                os.remove(IndexerMain.BINARY_INDEX_FILE)
+
+            if index_format in ("json", "both"):
+                save_json_index(raw_index_map, IndexerMain.INDEX_FILE, analyzer=analyzer)
+                saved.append(IndexerMain.INDEX_FILE)
+
+            # Save manifest last: it is only valid once the files above are complete
+            IndexerMain.save_manifest(manifest)
+            
+            print(f"Successfully saved {', '.join(saved)}")
+            
+        except (IOError, OSError, TypeError, ValueError) as e:
+            print(f"CRITICAL ERROR: Could not write output files. {e}")
+
+    @staticmethod
+    def save_manifest(manifest: Dict[str, Any]) -> None:
+        # Replaced atomically: a running pipeline re-reads it to detect a new index generation
+        tmp_path = IndexerMain.MANIFEST_FILE + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, IndexerMain.MANIFEST_FILE)
+
+    # --- STREAMING BUILD ---
+
+    @staticmethod
+    def iter_corpus(corpus_dir: str, files: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                    positional: bool = False, analyzer: Optional[Dict[str, Any]] = None,
+                    lexicon: Optional[FrozenSet[str]] = None
+                    ) -> Iterator[Tuple[List[Chunk], Dict[str, List[IndexEntry]]]]:
+        """Yields one file's chunks and postings at a time, so only a single file is held in memory."""
+        for filename in files:
+            print(f"Processing: {filename}")
+            yield IndexerMain.index_file((os.path.join(corpus_dir, filename), filename, batch_size, positional,
+                                          analyzer, lexicon))
+
+    @staticmethod
+    def index_corpus_streaming(corpus_dir: str, files: List[str], batch_size: int = EMBED_BATCH_SIZE,
+                               memory_budget_mb: float = MEMORY_BUDGET_MB,
+                               index_format: str = "binary", ann_lists: int = 0,
+                               positional: bool = False,
+                               analyzer: Optional[Dict[str, Any]] = None,
+                               lexicon: Optional[FrozenSet[str]] = None) -> Dict[str, List[int]]:
+        """
+        Bounded-memory build: chunks and embedding rows are written as each file is processed,
+        postings are buffered up to memory_budget_mb and spilled as sorted runs, and the runs
+        are k-way merged straight into the final index. Returns the per-document chunk ranges.
+        """
+        os.makedirs("data", exist_ok=True)
+        chunk_writer = JsonArrayWriter(IndexerMain.CHUNKS_FILE)
+        emb_writer = EmbeddingMatrixWriter(IndexerMain.EMBEDDINGS_FILE, EMBEDDING_DIM)
+        line_writer = EmbeddingMatrixWriter(IndexerMain.LINE_EMBEDDINGS_FILE, EMBEDDING_DIM)
+        facts = FactTables()
+        postings = SpillingPostingsBuffer(int(memory_budget_mb * 1024 * 1024), tmp_dir="data", positional=positional)
+        index_writer = (CompactIndexWriter(tmp_dir="data", positional=positional)
+                        if index_format in ("binary", "both") else None)
+
+        doc_table: List[str] = []
+        chunk_docs = array("I")
+        chunk_ids = array("I")
+        chunk_lengths: Dict[str, List[int]] = {}
+        ranges: Dict[str, List[int]] = {}
+
+        try:
+            for chunks, file_postings in IndexerMain.iter_corpus(corpus_dir, files, batch_size, positional, analyzer,
+                                                                       lexicon):
+                # Chunk token counts (BM25 lengths) are the sums of each chunk's term frequencies
+                token_counts: Dict[Tuple[str, int], int] = {}
+                for entries in file_postings.values():
+                    for e in entries:
+                        token_counts[(e.docId, e.chunkId)] = token_counts.get((e.docId, e.chunkId), 0) + e.tf
+
+                local_ordinals: Dict[Tuple[str, int], int] = {}
+                rows = np.zeros((len(chunks), EMBEDDING_DIM), dtype=np.float32)
+                for i, chunk in enumerate(chunks):
+                    ordinal = len(chunk_ids)
+                    local_ordinals[(chunk.docId, chunk.chunkId)] = ordinal
+                    if not doc_table or doc_table[-1] != chunk.docId:
+                        doc_table.append(chunk.docId)
+                        ranges[chunk.docId] = [ordinal, ordinal]
+                    ranges[chunk.docId][1] = ordinal + 1
+                    chunk_docs.append(len(doc_table) - 1)
+                    chunk_ids.append(chunk.chunkId)
+                    length = token_counts.get((chunk.docId, chunk.chunkId), 0)
+                    chunk_lengths.setdefault(chunk.docId, []).append(length)
+                    if index_writer is not None:
+                        index_writer.add_chunk(chunk.docId, chunk.chunkId, length)
+
+                    if chunk.embedding is not None and len(chunk.embedding) == EMBEDDING_DIM:
+                        rows[i] = chunk.embedding
+                    line_writer.append(IndexerMain.line_rows(chunk))
+                    facts.add_chunk(chunk, IndexerMain.select_strategy(chunk.docId))
+                    chunk_writer.write(IndexerMain.chunk_record(chunk))
+                emb_writer.append(rows)
+
+                for term, entries in file_postings.items():
+                    for e in entries:
+                        postings.add(term, local_ordinals[(e.docId, e.chunkId)], e.tf, e.positions)
+
+            chunk_writer.close()
+            emb_writer.close()
+            line_writer.close()
+            facts.save(IndexerMain.FACTS_FILE)
+            IndexerMain.build_ann_index(IndexerMain.EMBEDDINGS_FILE, IndexerMain.ANN_FILE, ann_lists)
+            print(f"=== DONE. Total Chunks: {len(chunk_ids)} ({len(postings.runs)} spilled postings run(s)) ===")
+
+            json_writer = JsonIndexWriter(IndexerMain.INDEX_FILE) if index_format in ("json", "both") else None
+            for term, ordinals, tfs, *positions in postings.merged():
+                term_positions = positions[0] if positions else None
+                if index_writer is not None:
+                    index_writer.add_term(term, ordinals, tfs, term_positions)
+                if json_writer is not None:
+                    entries = [{"docId": doc_table[chunk_docs[o]], "chunkId": chunk_ids[o], "tf": tf}
+                               for o, tf in zip(ordinals, tfs)]
+                    if term_positions is not None:
+                        for entry, pos in zip(entries, term_positions):
+                            entry["positions"] = pos
+                    json_writer.write(term, entries)
+            if json_writer is not None:
+                stats = {"chunkLengths": chunk_lengths, "avgChunkLength": average_chunk_length(chunk_lengths)}
+                if analyzer:
+                    stats["analyzer"] = analyzer
+                json_writer.close(stats)
+            if index_writer is not None:
+                index_writer.close(IndexerMain.BINARY_INDEX_FILE, {"analyzer": analyzer} if analyzer else None,
+                                   IndexerMain.doc_classes(doc_table))
+                index_writer = None
+            elif os.path.exists(IndexerMain.BINARY_INDEX_FILE):
+                os.remove(IndexerMain.BINARY_INDEX_FILE)
+        finally:
+            postings.close()
+            if index_writer is not None:
+                index_writer.abort()
+
+        return ranges
+
+    # --- INCREMENTAL BUILD SUPPORT ---
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """Returns the SHA-256 of a corpus file's bytes."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunking_params() -> Dict[str, int]:
+        """Settings that change chunk boundaries; a mismatch forces a full rebuild."""
+        return {"maxChunkChars": IndexerMain.MAX_CHUNK_CHARS, "overlapChars": IndexerMain.OVERLAP_CHARS}
+
+    @staticmethod
+    def chunk_ranges(all_chunks: List[Chunk]) -> Dict[str, List[int]]:
+        """Maps each docId to its [start, end) row range in chunks.json."""
+        ranges: Dict[str, List[int]] = {}
+        for row, chunk in enumerate(all_chunks):
+            if chunk.docId not in ranges:
+                ranges[chunk.docId] = [row, row]
+            ranges[chunk.docId][1] = row + 1
+        return ranges
+
+    @staticmethod
+    def doc_version(file_hash: str, strategy: str, positional: bool, analyzer: Optional[Dict[str, Any]]) -> str:
+        """
+        Version of one document in a build: changes when its content or any setting that shapes
+        its chunks and postings changes, so cached answers citing it can be invalidated.
+        """
+        settings = json.dumps([file_hash, strategy, IndexerMain.chunking_params(), positional, analyzer],
+                              sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def build_manifest(files: List[str], hashes: Dict[str, str], ranges: Dict[str, List[int]],
+                       positional: bool = False, analyzer: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Records each file's hash, chunking strategy and [chunkStart, chunkEnd) row range in chunks.json,
+        plus whether the postings carry token positions and which analyzer produced the terms.
+        Each build gets a new generation ID and a docId -> version map for cache invalidation.
+        """
+        entries: Dict[str, Any] = {}
+        documents: Dict[str, str] = {}
+        for filename in files:
+            doc_id = filename.replace(".txt", "")
+            start, end = ranges.get(doc_id, [0, 0])
+            strategy = IndexerMain.select_strategy(filename)
+            entries[filename] = {
+                "sha256": hashes[filename],
+                "strategy": strategy,
+                "docId": doc_id,
+                "chunkStart": start,
+                "chunkEnd": end,
+            }
+            documents[doc_id] = IndexerMain.doc_version(hashes[filename], strategy, positional, analyzer)
+        return {"generation": uuid.uuid4().hex, "chunking": IndexerMain.chunking_params(), "positional": positional,
+                "analyzer": analyzer, "files": entries, "documents": documents}
+
+    @staticmethod
+    def load_previous_build() -> Optional[Tuple[Dict[str, Any], List[Chunk], Dict[str, List[IndexEntry]]]]:
+        """
+        Loads the manifest, chunks (with their stored chunk and line embeddings) and postings
+        of the last build. Returns None when any piece is missing or unreadable.
+        """
+        paths = [IndexerMain.MANIFEST_FILE, IndexerMain.CHUNKS_FILE, IndexerMain.EMBEDDINGS_FILE,
+                 IndexerMain.LINE_EMBEDDINGS_FILE]
+        if not all(os.path.exists(p) for p in paths):
+            return None
+        if not (os.path.exists(IndexerMain.BINARY_INDEX_FILE) or os.path.exists(IndexerMain.INDEX_FILE)):
+            return None
+
+        try:
+            with open(IndexerMain.MANIFEST_FILE, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            with open(IndexerMain.CHUNKS_FILE, "r", encoding="utf-8") as f:
+                chunks = [Chunk(**c) for c in json.load(f)]
+            if os.path.exists(IndexerMain.BINARY_INDEX_FILE):
+                previous_index = CompactIndex.load(IndexerMain.BINARY_INDEX_FILE)
+            else:
+                previous_index = load_json_index(IndexerMain.INDEX_FILE)
+            index_map = {term: list(entries) for term, entries in previous_index.indexMap.items()}
+            matrix = np.load(IndexerMain.EMBEDDINGS_FILE, mmap_mode="r")
+            line_matrix = np.load(IndexerMain.LINE_EMBEDDINGS_FILE, mmap_mode="r")
+        except (json.JSONDecodeError, IOError, TypeError, ValueError, AttributeError) as e:
+            print(f"⚠️ WARNING: Could not load previous build. {e}")
+            return None
+
+        if matrix.shape[0] != len(chunks):
+            print("⚠️ WARNING: Stored embeddings do not match chunks.json.")
+            return None
+        if any(chunk.lineSpans is None for chunk in chunks) \
+                or line_matrix.shape[0] != sum(len(chunk.lineSpans) for chunk in chunks):
+            print("⚠️ WARNING: Stored line embeddings do not match chunks.json.")
+            return None
+        line_start = 0
+        for row, chunk in enumerate(chunks):
+            chunk.embedding = matrix[row]
+            chunk.lineEmbeddings = line_matrix[line_start:line_start + len(chunk.lineSpans)]
+            line_start += len(chunk.lineSpans)
+        return manifest, chunks, index_map
+
+    @staticmethod
+    def corpus_lexicon(corpus_dir: str, files: List[str], analyzer: Optional[Dict[str, Any]]) -> Optional[FrozenSet[str]]:
+        """Every surface word of the corpus, for analyzers that only stem to known words (else None)."""
+        if not (analyzer or {}).get("lexicon"):
+            return None
+        text_analyzer = get_analyzer(analyzer)
+        words: set = set()
+        for filename in files:
+            try:
+                with open(os.path.join(corpus_dir, filename), "r", encoding="utf-8") as f:
+                    words.update(text_analyzer.tokenize(f.read()))
+            except IOError as e:
+                print(f"ERROR: Could not read file {filename}. Reason: {e}")
+        return frozenset(words)
+
+    @staticmethod
+    def restemmed_files(corpus_dir: str, files: List[str], analyzer: Optional[Dict[str, Any]],
+                        lexicon: Optional[FrozenSet[str]], prev_index: Dict[str, List[IndexEntry]]) -> List[str]:
+        """
+        Unchanged files whose words stem differently now that the corpus lexicon changed.
+        The previous index's terms give the same stems as the previous lexicon did.
+        """
+        if lexicon is None:
+            return []
+        before = get_analyzer(analyzer).with_lexicon(prev_index)
+        after = get_analyzer(analyzer).with_lexicon(lexicon)
+        changed: List[str] = []
+        for filename in files:
+            try:
+                with open(os.path.join(corpus_dir, filename), "r", encoding="utf-8") as f:
+                    tokens = set(after.tokenize(f.read()))
+            except IOError:
+                continue
+            if any(before.stem(t) != after.stem(t) for t in tokens):
+                changed.append(filename)
+        return changed
+
+    @staticmethod
+    def diff_corpus(files: List[str], hashes: Dict[str, str], manifest: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """
+        Compares the corpus with the manifest.
+        Returns (files to re-process, docIds whose old chunks and postings must be dropped).
+        """
+        previous: Dict[str, Any] = manifest.get("files", {})
+        dirty: List[str] = []
+        stale_docs: List[str] = []
+
+        for filename in files:
+            entry = previous.get(filename)
+            if (entry is None or entry.get("sha256") != hashes[filename]
+                    or entry.get("strategy") != IndexerMain.select_strategy(filename)):
+                dirty.append(filename)
+                if entry is not None:
+                    stale_docs.append(entry["docId"])
+
+        current = set(files)
+        for filename, entry in previous.items():
+            if filename not in current:
+                stale_docs.append(entry["docId"])
+
+        return dirty, stale_docs
+
+    @staticmethod
+    def index_incremental(corpus_dir: str, files: List[str], dirty: List[str], stale_docs: List[str],
+                          manifest: Dict[str, Any], prev_chunks: List[Chunk], prev_index: Dict[str, List[IndexEntry]],
+                          all_chunks: List[Chunk], raw_index_map: Dict[str, List[IndexEntry]],
+                          workers: int = 1, batch_size: int = EMBED_BATCH_SIZE, positional: bool = False,
+                          analyzer: Optional[Dict[str, Any]] = None, lexicon: Optional[FrozenSet[str]] = None) -> None:
+        """
+        Re-processes only dirty files, reuses the stored chunks and embeddings of the others,
+        and splices postings of stale documents out of (and new ones into) the previous index.
+        """
+        fresh_chunks: List[Chunk] = []
+        fresh_index: Dict[str, List[IndexEntry]] = {}
+        IndexerMain.index_corpus(corpus_dir, dirty, fresh_chunks, fresh_index, workers=workers, batch_size=batch_size,
+                                 positional=positional, analyzer=analyzer, lexicon=lexicon)
+
+        fresh_by_doc: Dict[str, List[Chunk]] = {}
+        for chunk in fresh_chunks:
+            fresh_by_doc.setdefault(chunk.docId, []).append(chunk)
+
+        dirty_set = set(dirty)
+        previous: Dict[str, Any] = manifest.get("files", {})
+        for filename in files:
+            if filename in dirty_set:
+                all_chunks.extend(fresh_by_doc.get(filename.replace(".txt", ""), []))
+            else:
+                entry = previous[filename]
+                all_chunks.extend(prev_chunks[entry["chunkStart"]:entry["chunkEnd"]])
+
+        stale = set(stale_docs)
+        for term, entries in prev_index.items():
+            kept = [e for e in entries if e.docId not in stale]
+            if kept:
+                raw_index_map[term] = kept
+        for term, entries in fresh_index.items():
+            if term not in raw_index_map:
+                raw_index_map[term] = []
+            raw_index_map[term].extend(entries)
+
+    @staticmethod
+    def purge_query_cache() -> None:
+        """
+        Removes the whole query cache (--purge-cache). Rebuilds no longer need this: cached
+        answers are invalidated per cited document against the manifest's versions.
+        """
+        sqlite_files = [IndexerMain.SQLITE_CACHE_FILE + suffix for suffix in ("", "-wal", "-shm")]
+        for path in [IndexerMain.CACHE_FILE, IndexerMain.LEGACY_CACHE_FILE] + sqlite_files:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                    print(f"✅ STALE CACHE PURGED: '{path}' removed for freshness.")
+                except OSError as e:
+                    print(f"⚠️ WARNING: Could not purge cache file. {e}")
+
+    @staticmethod
+    def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+        """Parses indexer command line options."""
+        parser = argparse.ArgumentParser(description="RAG Corpus Indexer")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Number of worker processes used to index corpus files (default: 1)")
+        parser.add_argument("--batch-size", type=int, default=IndexerMain.EMBED_BATCH_SIZE,
+                            help=f"Number of chunks encoded per embedding batch (default: {IndexerMain.EMBED_BATCH_SIZE})")
+        parser.add_argument("--incremental", action="store_true",
+                            help="Only re-index files that were added, changed or deleted since the last build")
+        parser.add_argument("--index-format", choices=["binary", "json", "both"], default="binary",
+                            help="Keyword index output: compact index.bin, legacy index.json, or both (default: binary)")
+        parser.add_argument("--stream", action="store_true",
+                            help="Bounded-memory build that writes chunks incrementally and spills postings to disk")
+        parser.add_argument("--memory-budget-mb", type=float, default=IndexerMain.MEMORY_BUDGET_MB,
+                            help=f"Postings memory budget for --stream before spilling (default: {IndexerMain.MEMORY_BUDGET_MB})")
+        parser.add_argument("--positions", action="store_true",
+                            help="Store token positions in the postings (positional index for proximity/phrase scoring)")
+        parser.add_argument("--ann-lists", type=int, default=0,
+                            help="Number of IVF lists in the dense retriever's ANN index (default: 0 = about sqrt(chunks))")
+        parser.add_argument("--analyzer", choices=["turkish", "surface"], default="turkish",
+                            help="Index terms: Turkish casefolding + suffix stripping, or legacy surface tokens (default: turkish)")
+        parser.add_argument("--purge-cache", action="store_true",
+                            help="Also delete the whole query cache instead of relying on per-document invalidation")
+        return parser.parse_args(argv)
+
+    @staticmethod
+    def main(argv: Optional[List[str]] = None) -> None:
         """Main entry point for the indexing process."""
+        args = IndexerMain.parse_args(argv)
         corpus_dir: str = "data/corpus"
         all_chunks: List[Chunk] = []
         raw_index_map: Dict[str, List[IndexEntry]] = {}
 
         print("\n=== PYTHON INDEXER STARTING (Iteration 2 - Semantic Chunks & Embeddings) ===")
 
-        # --- STEP 1: AUTO-PURGE CACHE (NFR Requirement) --- 
-        if os.path.exists(IndexerMain.CACHE_FILE):
-            try:
-                os.remove(IndexerMain.CACHE_FILE)
-                print(f"✅ STALE CACHE PURGED: '{IndexerMain.CACHE_FILE}' removed for freshness.")
-            except OSError as e:
-                print(f"⚠️ WARNING: Could not purge cache file. {e}")
-        
         if not os.path.exists(corpus_dir):
             print(f"CRITICAL ERROR: Corpus directory '{corpus_dir}' not found.")
             return
 
-        files = [f for f in os.listdir(corpus_dir) if f.endswith(".txt")]
-        for filename in files:
-            print(f"Processing: {filename}")
-            IndexerMain.process_file(os.path.join(corpus_dir, filename), filename, all_chunks, raw_index_map)
+        # Sorted so that serial and parallel runs see the same file order on every platform
+        files = sorted(f for f in os.listdir(corpus_dir) if f.endswith(".txt"))
+        hashes = {f: IndexerMain.file_hash(os.path.join(corpus_dir, f)) for f in files}
+        analyzer = get_analyzer({"name": args.analyzer, "lexicon": True}).config()
+        lexicon = IndexerMain.corpus_lexicon(corpus_dir, files, analyzer)
+        if args.purge_cache:
+            IndexerMain.purge_query_cache()
+
+        if args.stream:
+            if args.incremental or args.workers > 1:
+                print("Note: --stream runs serially as a full rebuild; --incremental and --workers are ignored.")
+            ranges = IndexerMain.index_corpus_streaming(corpus_dir, files, batch_size=args.batch_size,
+                                                        memory_budget_mb=args.memory_budget_mb,
+                                                        index_format=args.index_format,
+                                                        ann_lists=args.ann_lists, positional=args.positions,
+                                                        analyzer=analyzer, lexicon=lexicon)
+            IndexerMain.save_manifest(IndexerMain.build_manifest(files, hashes, ranges, args.positions, analyzer))
+            print("Successfully saved streamed build outputs.")
+            IndexerMain.report_embedding_cache()
+            return
+
+        previous = IndexerMain.load_previous_build() if args.incremental else None
+        if previous is not None and previous[0].get("chunking") != IndexerMain.chunking_params():
+            print("Chunking settings changed since the last build. Falling back to a full rebuild.")
+            previous = None
+        elif previous is not None and previous[0].get("positional", False) != args.positions:
+            print("Positional setting changed since the last build. Falling back to a full rebuild.")
+            previous = None
+        elif previous is not None and previous[0].get("analyzer") != analyzer:
+            print("Analyzer changed since the last build. Falling back to a full rebuild.")
+            previous = None
+        elif args.incremental and previous is None:
+            print("No usable previous build found. Falling back to a full rebuild.")
+
+        if previous is not None:
+            manifest, prev_chunks, prev_index = previous
+            dirty, stale_docs = IndexerMain.diff_corpus(files, hashes, manifest)
+            if dirty or stale_docs:
+                # A changed corpus lexicon can change the stems of unchanged files too
+                dirty_set = set(dirty)
+                restemmed = IndexerMain.restemmed_files(corpus_dir, [f for f in files if f not in dirty_set],
+                                                        analyzer, lexicon, prev_index)
+                dirty += restemmed
+                stale_docs += [manifest["files"][f]["docId"] for f in restemmed]
+            if not dirty and not stale_docs:
+                print("=== INDEX UP TO DATE. Nothing to re-index; query cache kept. ===")
+                return
+            print(f"Incremental build: {len(dirty)} file(s) to re-index, {len(stale_docs)} stale document(s).")
+            IndexerMain.index_incremental(corpus_dir, files, dirty, stale_docs, manifest, prev_chunks, prev_index,
+                                          all_chunks, raw_index_map, workers=args.workers, batch_size=args.batch_size,
+                                          positional=args.positions, analyzer=analyzer, lexicon=lexicon)
+        else:
+            IndexerMain.index_corpus(corpus_dir, files, all_chunks, raw_index_map, workers=args.workers,
+                                     batch_size=args.batch_size, positional=args.positions, analyzer=analyzer,
+                                     lexicon=lexicon)
 
         print(f"=== DONE. Total Chunks: {len(all_chunks)} ===")
 
-        try:
-            os.makedirs("data", exist_ok=True)
-            # Save chunks
-            with open("data/chunks.json", "w", encoding="utf-8") as f:
-                json.dump([c.__dict__ for c in all_chunks], f, ensure_ascii=False, indent=2)
-            
-            # Export keyword index
-            index_export = {k: [e.__dict__ for e in v] for k, v in raw_index_map.items()}
-            with open("data/index.json", "w", encoding="utf-8") as f:
-                json.dump({"indexMap": index_export}, f, ensure_ascii=False, indent=2)
-            
-            print("Successfully saved data/chunks.json and data/index.json")
-            
-        except (IOError, TypeError) as e:
-            print(f"CRITICAL ERROR: Could not write output files. {e}")
+        IndexerMain.save_outputs(all_chunks, raw_index_map,
+                                 IndexerMain.build_manifest(files, hashes, IndexerMain.chunk_ranges(all_chunks),
+                                                            args.positions, analyzer),
+                                 index_format=args.index_format, ann_lists=args.ann_lists, analyzer=analyzer)
+        IndexerMain.report_embedding_cache()
+
+    @staticmethod
+    def report_embedding_cache() -> None:
+        """Prints how many chunk texts were served from the embedding cache instead of the model."""
+        stats = embedding_cache.stats()
+        if stats["misses"] or stats["memoryHits"] or stats["diskHits"]:
+            print(f"Embedding cache: {stats['memoryHits'] + stats['diskHits']} hit(s), {stats['misses']} miss(es), "
+                  f"{stats['evictions']} eviction(s)")
 
 if __name__ == "__main__":
     IndexerMain.main()
\ No newline at end of file
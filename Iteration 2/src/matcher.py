@@ -0,0 +1,133 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class TermMatcher:
+    """
+    Matches a fixed set of terms against many texts: built once per query (or once per
+    class for fixed marker lists) and shared by the rerankers and answer agents.
+
+    The terms are compiled into an Aho-Corasick automaton whose failure links are folded
+    into the transitions, so a text is read once, one character at a time, however many
+    terms there are. scan() lowercases a text once and returns, for every term that occurs,
+    the same (count, first position) pair str.count / str.find would give: non-overlapping
+    occurrences, character offsets into the lowercased text.
+
+    Terms are lowercased and de-duplicated; callers keep their own term lists (with
+    repeats) and look the results up by term.lower().
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = list(dict.fromkeys(t.lower() for t in terms))
+        # An empty term occurs everywhere, as with str.find; it needs no automaton state
+        self._empty: bool = "" in self.terms
+        self._delta: List[Dict[str, int]] = []  # state -> character -> next state
+        self._outputs: List[Tuple[int, ...]] = []  # state -> indexes of the terms ending there
+        self._build()
+
+    # --- Automaton ---
+
+    def _build(self) -> None:
+        """Builds the trie, then resolves failure links breadth-first into full transitions."""
+        goto: List[Dict[str, int]] = [{}]
+        ends: List[List[int]] = [[]]
+        for index, term in enumerate(self.terms):
+            if not term:
+                continue
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    ends.append([])
+                state = nxt
+            ends[state].append(index)
+
+        delta: List[Dict[str, int]] = [dict() for _ in goto]
+        outputs: List[Tuple[int, ...]] = [()] * len(goto)
+        fail: List[int] = [0] * len(goto)
+        delta[0] = dict(goto[0])
+        queue: List[int] = list(goto[0].values())
+        for state in queue:
+            outputs[state] = tuple(ends[state])
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            # Characters the state cannot extend continue from its longest proper suffix
+            delta[state] = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                delta[state][ch] = nxt
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                outputs[nxt] = tuple(ends[nxt]) + outputs[fail[nxt]]
+                queue.append(nxt)
+        self._delta = delta
+        self._outputs = outputs
+
+    # --- Matching ---
+
+    def scan(self, text: str, lowered: bool = False) -> Dict[str, Tuple[int, int]]:
+        """term -> (occurrence count, first offset) for the terms found in text."""
+        if not lowered:
+            text = text.lower()
+        terms, delta, outputs = self.terms, self._delta, self._outputs
+        counts: Dict[int, int] = {}
+        firsts: Dict[int, int] = {}
+        # End of the last counted occurrence per term; an overlapping one is not counted
+        free: Dict[int, int] = {}
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            out = outputs[state]
+            if out:
+                end = i + 1
+                for index in out:
+                    start = end - len(terms[index])
+                    if start >= free.get(index, 0):
+                        if index not in counts:
+                            counts[index] = 0
+                            firsts[index] = start
+                        counts[index] += 1
+                        free[index] = end
+
+        found: Dict[str, Tuple[int, int]] = {}
+        for index, term in enumerate(terms):
+            if index in counts:
+                found[term] = (counts[index], firsts[index])
+            elif not term:
+                found[term] = (len(text) + 1, 0)
+        return found
+
+    def any_in(self, text: str, lowered: bool = False) -> bool:
+        """True when at least one term occurs in text (stops at the first hit)."""
+        if self._empty:
+            return True
+        if not lowered:
+            text = text.lower()
+        delta, outputs = self._delta, self._outputs
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                return True
+        return False
+
+    def present(self, text: str, lowered: bool = False) -> Set[str]:
+        """The terms that occur in text, without counting them (stops once all are found)."""
+        if not lowered:
+            text = text.lower()
+        terms, delta, outputs = self.terms, self._delta, self._outputs
+        seen: Set[int] = set()
+        wanted = len(terms) - self._empty
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                seen.update(outputs[state])
+                if len(seen) == wanted:
+                    break
+        found = {terms[index] for index in seen}
+        if self._empty:
+            found.add("")
+        return found
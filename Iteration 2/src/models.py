@@ -1,6 +1,6 @@
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 
 class Intent(Enum):
     REGISTRATION = "REGISTRATION"
@@ -18,17 +18,24 @@ class Chunk:
     endOffset: int
     sectionId: Optional[str] = None
     embedding: Optional[List[float]] = None  # adding for iteration 2
+    lineSpans: Optional[List[List[int]]] = None  # [start, end) of each answer line in rawText
+    lineEmbeddings: Optional[List[List[float]]] = None  # one row per lineSpans entry, stored in line_embeddings.npy
 
 @dataclass
 class IndexEntry:
     docId: str
     chunkId: int
     tf: int
+    positions: Optional[List[int]] = None  # token offsets in the chunk, only in positional indexes
 
 @dataclass
 class KeywordIndex:
     # Token -> List of IndexEntry
     indexMap: Dict[str, List[IndexEntry]] = field(default_factory=dict)
+    # DocID -> token count of each chunk (list position = chunkId), for BM25 length normalization
+    chunkLengths: Dict[str, List[int]] = field(default_factory=dict)
+    # Analyzer settings the terms were produced with (None = legacy surface forms)
+    analyzer: Optional[Dict[str, Any]] = None
 
 @dataclass(order=True)
 class Hit:
@@ -65,4 +72,54 @@ class Answer:
 
     def __str__(self):
         cit_str = " ".join([f"[{str(c)}]" for c in self.citations])
-        return f"{self.finalText}\nSources: {cit_str}"
\ No newline at end of file
+        return f"{self.finalText}\nSources: {cit_str}"
+
+@dataclass
+class CourseFact:
+    # One course line of a COURSE document; offsets locate the line in the chunk text
+    code: str
+    line: str
+    ects: Optional[int]
+    prerequisite: Optional[str]
+    docId: str
+    chunkId: int
+    startOffset: int
+    endOffset: int
+
+@dataclass
+class StaffFact:
+    # One person of a STAFF document; offsets span the name, office and e-mail lines in the chunk text
+    name: str
+    line: str
+    office: Optional[str]
+    email: Optional[str]
+    docId: str
+    chunkId: int
+    startOffset: int
+    endOffset: int
+
+@dataclass
+class SelectionLimits:
+    # How many candidates the retriever hands to the reranker (top_k)
+    # and how many reranked hits reach the answer agent (top_n); None = unlimited
+    top_k: Optional[int] = None
+    top_n: Optional[int] = None
+    top_k_by_intent: Dict[str, int] = field(default_factory=dict)
+    top_n_by_intent: Dict[str, int] = field(default_factory=dict)
+
+    def for_intent(self, intent: Intent) -> Tuple[Optional[int], Optional[int]]:
+        return (self.top_k_by_intent.get(intent.value, self.top_k),
+                self.top_n_by_intent.get(intent.value, self.top_n))
+
+@dataclass
+class RetrievalScopes:
+    # Document classes (the indexer's chunking strategies) each intent's retrieval is restricted to;
+    # intents not listed search the whole corpus. Fewer than min_hits scoped hits falls back to all chunks.
+    classes_by_intent: Dict[str, List[str]] = field(default_factory=lambda: {
+        "STAFF_LOOKUP": ["STAFF"],
+        "COURSE_INFO": ["COURSE"],
+    })
+    min_hits: int = 3
+
+    def classes_for(self, intent: Intent) -> Optional[List[str]]:
+        return self.classes_by_intent.get(intent.value)
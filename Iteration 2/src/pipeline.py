@@ -1,80 +1,114 @@
 import time
-import json
-import os
-from dataclasses import dataclass
-from typing import List, Callable
-
-# Equivalent of Java's TraceEvent class
-@dataclass
-class TraceEvent:
-    stage: str
-    inputs: str
-    outputsSummary: str
-    timingMs: float
-    errors: str = None
-    timestamp: int = 0
-
-    def __post_init__(self):
-        # Add timestamp (in ms) when the event is created
-        self.timestamp = int(time.time() * 1000)
-
-
-# Equivalent of Java's JsonlTraceSink class
-class JsonlTraceSink:
-    def __init__(self, log_file_path: str):
-        self.log_file_path = log_file_path
-        
-        # Auto-create directory if it does not exist
-        log_dir = os.path.dirname(log_file_path)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-    def accept(self, event: TraceEvent):
-        # Create JSON structure identical to Java implementation
-        data = {
-            "stage": event.stage,
-            # Clean newline characters to keep log entries single-line (JSONL)
-            "inputs": event.inputs.replace('"', "'").replace("\n", " ") if event.inputs else "",
-            "outputsSummary": event.outputsSummary.replace('"', "'").replace("\n", " ") if event.outputsSummary else "",
-            "timingMs": event.timingMs
-        }
-        
-        if event.errors:
-            data["errors"] = event.errors.replace('"', "'")
-
-        # Append JSON object to file (JSONL format)
-        try:
-            with open(self.log_file_path, "a", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False)
-                f.write("\n")  # new line for JSONL
-        except Exception as e:
-            print(f"Logging error: {e}")
-
-
-# Equivalent of Java's TraceBus class (Observer Pattern)
-class TraceBus:
-    _listeners: List[Callable[[TraceEvent], None]] = []
-
-    @staticmethod
-    def register(listener):
-        """Register a new listener (sink)."""
-        # If listener is an object with an 'accept' method, register that method
-        if hasattr(listener, 'accept'):
-            TraceBus._listeners.append(listener.accept)
-        else:
-            # Otherwise, listener itself is a callable
-            TraceBus._listeners.append(listener)
-
-    @staticmethod
-    def push(stage: str, message: str):
-        """Simple logging method for backward compatibility."""
-        TraceBus.push_full(stage, "", message, 0, None)
-
-    @staticmethod
-    def push_full(stage: str, inputs: str, outputs_summary: str, timing_ms: int, errors: str = None):
-        """Push a detailed log event to all listeners."""
-        event = TraceEvent(stage, inputs, outputs_summary, timing_ms, errors)
-        
-        # Notify all registered listeners
-        for listener in TraceBus._listeners:
-            listener(event)
+from typing import List, Optional
+
+from src.models import Answer, Hit, Intent, SelectionLimits, RetrievalScopes
+from src.tracing import TraceBus
+
+
+class RagOrchestrator:
+    """
+    Controller that runs a question through every pipeline stage
+    and publishes a trace event per stage.
+    """
+
+    def __init__(self, intent_detector, query_writer, retriever, reranker, answer_agent, global_index, query_cache=None,
+                 limits: Optional[SelectionLimits] = None, scopes: Optional[RetrievalScopes] = None, facts=None):
+        self.intent_detector = intent_detector
+        self.query_writer = query_writer
+        self.retriever = retriever
+        self.reranker = reranker
+        self.answer_agent = answer_agent
+        self.global_index = global_index
+        self.query_cache = query_cache
+        self.limits = limits or SelectionLimits()
+        self.scopes = scopes
+        self.facts = facts
+
+    def run(self, user_question: str) -> Answer:
+
+        # START
+        t0 = time.time()
+        TraceBus.push_full("START", user_question, "Received question", 0)
+
+        # CACHE
+        if self.query_cache is not None:
+            cached: Optional[Answer] = self.query_cache.get(user_question)
+            if cached is not None:
+                total = int((time.time() - t0) * 1000)
+                TraceBus.push_full("CACHE", user_question, f"hit {self.query_cache.summary()}", total)
+                return cached
+            similar = self.query_cache.get_similar(user_question)
+            if similar is not None:
+                cached, matched, score = similar
+                total = int((time.time() - t0) * 1000)
+                TraceBus.push_full("CACHE", user_question,
+                                   f"semantic hit score={score:.3f} match='{matched}' {self.query_cache.summary()}", total)
+                return cached
+            TraceBus.push_full("CACHE", user_question, f"miss {self.query_cache.summary()}",
+                               int((time.time() - t0) * 1000))
+
+        # INTENT
+        t1 = time.time()
+        intent = self.intent_detector.detect(user_question)
+        TraceBus.push_full("INTENT", user_question, intent.value, int((time.time() - t1) * 1000))
+
+        # FACT (exact course code / staff name: answered without retrieval or reranking)
+        if self.facts is not None:
+            tf = time.time()
+            fact_answer = self.facts.answer(user_question, intent)
+            if fact_answer is not None:
+                TraceBus.push_full("FACT", user_question, fact_answer.finalText[:80], int((time.time() - tf) * 1000))
+                total = int((time.time() - t0) * 1000)
+                TraceBus.push_full("END", "Pipeline completed", f"Total={total}ms", total)
+                return fact_answer
+
+        # QUERY
+        t2 = time.time()
+        terms = self.query_writer.write(user_question, intent)
+        TraceBus.push_full("QUERY", user_question, str(terms), int((time.time() - t2) * 1000))
+
+        # RETRIEVE (only top_k candidates reach the reranker)
+        top_k, top_n = self.limits.for_intent(intent)
+        t3 = time.time()
+        hits = self._retrieve(terms, intent, top_k)
+        TraceBus.push_full("RETRIEVE", str(terms), f"{len(hits)} hits", int((time.time() - t3) * 1000))
+
+        # RERANK
+        t4 = time.time()
+        reranked = self.reranker.rerank(terms, hits)
+        if top_n is not None:
+            reranked = reranked[:top_n]
+        best = reranked[0].score if reranked else 0
+        TraceBus.push_full("RERANK", str(terms), f"best={best}", int((time.time() - t4) * 1000))
+
+        # ANSWER
+        t5 = time.time()
+        answer = self.answer_agent.answer(user_question, reranked)
+        TraceBus.push_full("ANSWER", user_question, answer.finalText[:80], int((time.time() - t5) * 1000))
+
+        if self.query_cache is not None:
+            self.query_cache.put(user_question, answer)
+
+        # END
+        total = int((time.time() - t0) * 1000)
+        TraceBus.push_full("END", "Pipeline completed", f"Total={total}ms", total)
+
+        return answer
+
+    def _retrieve(self, terms: List[str], intent: Intent, top_k: Optional[int]) -> List[Hit]:
+        """
+        Searches only the chunks of the intent's document classes when the index has class
+        bitmaps, and falls back to the whole corpus when that yields fewer than min_hits hits.
+        """
+        classes = self.scopes.classes_for(intent) if self.scopes is not None else None
+        class_mask = getattr(self.global_index, "class_mask", None)
+        mask = class_mask(classes) if classes and class_mask is not None else None
+        if mask is None:
+            return self.retriever.retrieve(terms, self.global_index, top_k=top_k)
+
+        hits = self.retriever.retrieve(terms, self.global_index, top_k=top_k, chunk_mask=mask)
+        TraceBus.push_full("SCOPE", intent.value, f"{'+'.join(classes)}: {len(hits)} hits", 0)
+        if len(hits) < self.scopes.min_hits:
+            TraceBus.push_full("SCOPE", intent.value, "too few scoped hits, searching all chunks", 0)
+            hits = self.retriever.retrieve(terms, self.global_index, top_k=top_k)
+        return hits
@@ -0,0 +1,124 @@
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# Contribution of one term to the score of the given postings: f(ordinals, tfs) -> scores
+TermScoreFn = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+class PrunableTerm:
+    """
+    One query term for max_score_search: its postings, a scoring function
+    and an upper bound on the score it can add to any chunk.
+    """
+
+    def __init__(self, ordinals: np.ndarray, tfs: np.ndarray, upper_bound: float, score_fn: TermScoreFn):
+        self.ordinals = ordinals
+        self.tfs = tfs
+        self.upper_bound = upper_bound
+        self.score_fn = score_fn
+
+    def contributions(self, candidates: np.ndarray, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        Score added to each sorted candidate ordinal (0.0 where the term does not occur).
+        start/end restrict the lookup to a slice of the postings known to cover the candidates.
+        """
+        ordinals = self.ordinals[start:end]
+        out = np.zeros(len(candidates), dtype=np.float64)
+        if len(ordinals) == 0 or len(candidates) == 0:
+            return out
+        pos = np.minimum(np.searchsorted(ordinals, candidates), len(ordinals) - 1)
+        found = ordinals[pos] == candidates
+        if found.any():
+            p = pos[found] + start
+            out[found] = self.score_fn(self.ordinals[p], self.tfs[p])
+        return out
+
+
+def max_score_search(terms: List[PrunableTerm], top_k: int,
+                     block_size: int = 1024, max_block_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Document-at-a-time MaxScore over chunk ordinals, one block of ordinals at a time.
+    Blocks start small so theta is established early, then double up to max_block_size.
+
+    Terms are ordered by upper bound; once the k-th best score (theta) is known, the
+    low-bound terms whose bounds sum to less than theta become non-essential: chunks
+    containing only those terms are never visited, and candidates from the essential
+    terms are dropped when their partial score plus the non-essential bounds stays below theta.
+
+    Returns (ordinals, scores) of every chunk scoring at least the final k-th best score,
+    ties included, so select_top_hits() yields exactly the exhaustive top-k.
+    Scores are summed in the order of `terms`, matching exhaustive accumulation bit for bit.
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64))
+    terms = [t for t in terms if len(t.ordinals)]
+    if not terms or top_k <= 0:
+        return empty
+
+    by_bound = sorted(range(len(terms)), key=lambda i: terms[i].upper_bound)
+    prefix_bounds = np.cumsum([terms[i].upper_bound for i in by_bound])
+    cursors = [0] * len(terms)
+
+    pool_ords: List[np.ndarray] = []
+    pool_scores: List[np.ndarray] = []
+    pool_size = 0
+    theta = -np.inf
+
+    while True:
+        # Floating-point slack so rounding never prunes a chunk that ties theta
+        cutoff = theta - 1e-9 * max(1.0, abs(theta))
+        n_optional = int(np.searchsorted(prefix_bounds, cutoff, side="left")) if theta > -np.inf else 0
+        essential = by_bound[n_optional:]
+        optional_bound = float(prefix_bounds[n_optional - 1]) if n_optional else 0.0
+
+        # Jump straight to the next chunk any essential term contains
+        heads = [int(terms[i].ordinals[cursors[i]]) for i in essential if cursors[i] < len(terms[i].ordinals)]
+        if not heads:
+            break
+        lo = min(heads)
+        hi = lo + block_size
+        block_size = min(block_size * 2, max_block_size)
+
+        block_ends = [int(np.searchsorted(t.ordinals, hi, side="left")) for t in terms]
+        block_starts, cursors = cursors, block_ends
+
+        # Essential terms are scored densely over the block; they alone decide the candidates
+        dense = {}
+        partial = np.zeros(hi - lo, dtype=np.float64)
+        present = np.zeros(hi - lo, dtype=bool)
+        for i in essential:
+            t = terms[i]
+            ords = t.ordinals[block_starts[i]:block_ends[i]]
+            contrib = np.zeros(hi - lo, dtype=np.float64)
+            contrib[ords - lo] = t.score_fn(ords, t.tfs[block_starts[i]:block_ends[i]])
+            partial += contrib
+            present[ords - lo] = True
+            dense[i] = contrib
+
+        keep = present & (partial + optional_bound >= cutoff) if n_optional else present
+        rows = np.flatnonzero(keep)
+        if len(rows) == 0:
+            continue
+        candidates = rows + lo
+
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        for i, t in enumerate(terms):
+            if i in dense:
+                scores += dense[i][rows]
+            else:
+                scores += t.contributions(candidates, block_starts[i], block_ends[i])
+
+        pool_ords.append(candidates)
+        pool_scores.append(scores)
+        pool_size += len(candidates)
+        if pool_size >= top_k:
+            all_ords = np.concatenate(pool_ords)
+            all_scores = np.concatenate(pool_scores)
+            theta = float(np.partition(all_scores, len(all_scores) - top_k)[len(all_scores) - top_k])
+            keep = all_scores >= theta
+            pool_ords, pool_scores = [all_ords[keep]], [all_scores[keep]]
+            pool_size = int(keep.sum())
+
+    if not pool_ords:
+        return empty
+    return np.concatenate(pool_ords), np.concatenate(pool_scores)
@@ -0,0 +1,128 @@
+import re
+import threading
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from src.facts import FactTables
+from src.utils import EMBEDDING_DIM, get_embeddings
+
+
+class SemanticCache:
+    """
+    Near-duplicate tier of QueryCache for paraphrased questions.
+
+    Cached questions are kept as L2-normalized float32 rows of one matrix (grown by
+    doubling, freed rows reused). lookup() embeds the question once, scores every row
+    with a single matrix-vector product and returns the most similar cached question
+    whose cosine is at least threshold and whose entities (course codes, known staff
+    names, other numbers) are exactly the same. Added questions are embedded lazily,
+    in one batch, at the next lookup; their vectors usually come from the embedding cache.
+
+    The cache is safe for threads. Embedding runs outside its lock, which only guards the
+    row updates and the scoring; a question removed while it was being embedded is dropped.
+    """
+
+    NUMBER_RE = re.compile(r"\d+")
+
+    def __init__(self, threshold: float = 0.9, facts: Optional[FactTables] = None,
+                 embed_many: Optional[Callable[[List[str]], List[List[float]]]] = None, dim: int = EMBEDDING_DIM):
+        self.threshold = threshold
+        self.facts = facts
+        self.embed_many = embed_many or get_embeddings
+        self.dim = dim
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._rows) + len(self._pending) + len(self._embedding)
+
+    def entities(self, question: str) -> FrozenSet[str]:
+        """Course codes, staff names and remaining numbers that a paraphrase must repeat exactly."""
+        codes = FactTables.course_codes(question)
+        names = self.facts.staff_names(question) if self.facts is not None else set()
+        numbers = self.NUMBER_RE.findall(FactTables.QUESTION_CODE_RE.sub(" ", question.upper()))
+        return frozenset(codes | {f"name:{n}" for n in names} | {f"#{n}" for n in numbers})
+
+    # --- Rows ---
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            if key not in self._rows and key not in self._embedding:
+                self._pending[key] = None
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            self._embedding.pop(key, None)
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._keys[row] = None
+                self._vectors[row] = 0.0
+                self._free.append(row)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self._keys: List[Optional[str]] = []  # row -> cached key, None for a free row
+            self._entities: List[FrozenSet[str]] = []
+            self._rows: Dict[str, int] = {}
+            self._free: List[int] = []
+            self._pending: Dict[str, None] = {}
+            self._embedding: Dict[str, None] = {}  # taken from _pending, being embedded outside the lock
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        rows = np.asarray(self.embed_many(texts), dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return rows / norms
+
+    def _store(self, keys: List[str], vectors: np.ndarray) -> None:
+        """Writes embedded questions into rows; the caller holds the lock."""
+        for key, vec in zip(keys, vectors):
+            if key not in self._embedding:
+                continue  # removed (or cleared) while it was being embedded
+            del self._embedding[key]
+            row = self._free.pop() if self._free else self._new_row()
+            self._vectors[row] = vec
+            self._keys[row] = key
+            self._entities[row] = self.entities(key)
+            self._rows[key] = row
+
+    def _new_row(self) -> int:
+        row = len(self._keys)
+        if row == len(self._vectors):
+            grown = np.zeros((max(16, 2 * row), self.dim), dtype=np.float32)
+            grown[:row] = self._vectors
+            self._vectors = grown
+        self._keys.append(None)
+        self._entities.append(frozenset())
+        return row
+
+    # --- Lookup ---
+
+    def lookup(self, key: str) -> Optional[Tuple[str, float]]:
+        """(cached key, cosine) of the best paraphrase of key, or None."""
+        with self._lock:
+            if not self._rows and not self._pending:
+                return None
+            keys = list(self._pending)
+            self._pending.clear()
+            self._embedding.update(dict.fromkeys(keys))
+        # One batch for the pending questions and the query, without holding the lock
+        vectors = self._embed(keys + [key])
+        query = vectors[-1]
+        entities = self.entities(key)
+
+        with self._lock:
+            self._store(keys, vectors[:-1])
+            if not self._rows or not query.any():
+                return None
+            # Free rows are zero and score 0, so only live rows can pass a positive threshold
+            scores = self._vectors[:len(self._keys)] @ query
+            candidates = np.flatnonzero(scores >= self.threshold)
+            for row in candidates[np.argsort(-scores[candidates], kind="stable")]:
+                if self._keys[row] is not None and self._entities[row] == entities:
+                    return self._keys[row], float(scores[row])
+        return None
@@ -0,0 +1,182 @@
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class JsonArrayWriter:
+    """
+    Writes a JSON array one element at a time.
+    Output matches json.dump(items, f, ensure_ascii=False, indent=2).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._f = open(self._tmp_path, "w", encoding="utf-8")
+        self._count = 0
+        self._f.write("[")
+
+    def write(self, item: Any) -> None:
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._f.write(("," if self._count else "") + "\n  " + body)
+        self._count += 1
+
+    def close(self) -> None:
+        self._f.write("\n]" if self._count else "]")
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class JsonIndexWriter:
+    """
+    Writes {"indexMap": {term: [entries]}, ...} one term at a time, in json.dump(indent=2) layout.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._f = open(self._tmp_path, "w", encoding="utf-8")
+        self._count = 0
+        self._f.write('{\n  "indexMap": {')
+
+    def write(self, term: str, entries: List[Dict[str, Any]]) -> None:
+        key = json.dumps(term, ensure_ascii=False)
+        body = json.dumps(entries, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        self._f.write(("," if self._count else "") + f"\n    {key}: {body}")
+        self._count += 1
+
+    def close(self, extra: Optional[Dict[str, Any]] = None) -> None:
+        """Closes indexMap and appends any extra top-level keys (e.g. chunk statistics)."""
+        self._f.write("\n  }" if self._count else "}")
+        for key, value in (extra or {}).items():
+            body = json.dumps(value, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._f.write(f",\n  {json.dumps(key, ensure_ascii=False)}: {body}")
+        self._f.write("\n}")
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class EmbeddingMatrixWriter:
+    """
+    Appends float32 embedding rows to a raw scratch file and turns it into a
+    .npy matrix on close(), so the full matrix never has to sit in memory.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.rows = 0
+        self._raw_path = path + ".raw"
+        self._raw = open(self._raw_path, "w+b")
+
+    def append(self, rows: np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype=np.float32).reshape(-1, self.dim)
+        self._raw.write(rows.tobytes())
+        self.rows += rows.shape[0]
+
+    def close(self) -> None:
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                header = {"descr": np.dtype(np.float32).str, "fortran_order": False, "shape": (self.rows, self.dim)}
+                np.lib.format.write_array_header_1_0(f, header)
+                self._raw.flush()
+                self._raw.seek(0)
+                shutil.copyfileobj(self._raw, f, 1 << 20)
+            os.replace(tmp_path, self.path)
+        finally:
+            self._raw.close()
+            os.remove(self._raw_path)
+
+
+class SpillingPostingsBuffer:
+    """
+    In-memory inverted index that spills sorted runs to disk once an
+    estimated memory budget is exceeded. merged() k-way merges all runs
+    back into a single term-sorted stream of postings.
+
+    Chunk ordinals must be added in ascending order, so concatenating a
+    term's postings run by run keeps them sorted.
+
+    A positional buffer also carries each posting's token positions and
+    merged() then yields (term, ordinals, tfs, positions).
+    """
+
+    # Rough CPython cost of one (ordinal, tf) posting and of one new term entry
+    POSTING_BYTES: int = 72
+    TERM_BYTES: int = 200
+
+    # Rough CPython cost of one stored token position
+    POSITION_BYTES: int = 36
+
+    def __init__(self, budget_bytes: int, tmp_dir: Optional[str] = None, positional: bool = False):
+        self.budget_bytes = max(1, budget_bytes)
+        self.positional = positional
+        self._tmp = tempfile.TemporaryDirectory(prefix="index-spill-", dir=tmp_dir)
+        self._postings: Dict[str, Tuple[List, ...]] = {}
+        self._estimated = 0
+        self.runs: List[str] = []
+
+    def add(self, term: str, ordinal: int, tf: int, positions: Optional[List[int]] = None) -> None:
+        entry = self._postings.get(term)
+        if entry is None:
+            entry = self._postings[term] = ([], [], []) if self.positional else ([], [])
+            self._estimated += self.TERM_BYTES
+        entry[0].append(ordinal)
+        entry[1].append(tf)
+        self._estimated += self.POSTING_BYTES
+        if self.positional:
+            entry[2].append(positions or [])
+            self._estimated += self.POSITION_BYTES * len(positions or [])
+        if self._estimated >= self.budget_bytes:
+            self.spill()
+
+    def spill(self) -> None:
+        """Writes the buffered postings as one term-sorted run file and clears memory."""
+        if not self._postings:
+            return
+        path = os.path.join(self._tmp.name, f"run-{len(self.runs):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for term, lists in self._sorted_items():
+                f.write(json.dumps([term, *lists], ensure_ascii=False) + "\n")
+        self.runs.append(path)
+        self._postings = {}
+        self._estimated = 0
+
+    def _sorted_items(self) -> List[Tuple[str, Tuple[List, ...]]]:
+        return sorted(self._postings.items(), key=lambda kv: kv[0].encode("utf-8"))
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[List]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def merged(self) -> Iterator[Tuple]:
+        """
+        Yields (term, ordinals, tfs[, positions]) in UTF-8 term order across all runs plus the in-memory tail.
+        heapq.merge is stable, so equal terms come out in run order and ordinals stay ascending.
+        """
+        sources = [self._read_run(path) for path in self.runs]
+        sources.append([term, *lists] for term, lists in self._sorted_items())
+
+        current: Optional[str] = None
+        lists: List[List] = []
+        for term, *parts in heapq.merge(*sources, key=lambda rec: rec[0].encode("utf-8")):
+            if term != current:
+                if current is not None:
+                    yield (current, *lists)
+                current, lists = term, [[] for _ in parts]
+            for merged_part, part in zip(lists, parts):
+                merged_part.extend(part)
+        if current is not None:
+            yield (current, *lists)
+
+    def close(self) -> None:
+        self._postings = {}
+        self._tmp.cleanup()
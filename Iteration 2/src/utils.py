@@ -1,35 +1,77 @@
 import numpy as np
 import os
 from typing import List
+from src.embedding_cache import EmbeddingCache
+
+# Output size of the sentence embedding model
+EMBEDDING_DIM: int = 384
+MODEL_NAME: str = "all-MiniLM-L6-v2"
 
 # Load model globally once to avoid redundant reloads
 try:
     from sentence_transformers import SentenceTransformer
     print("⏳ Loading AI Model (this may take a moment)...")
     # 'all-MiniLM-L6-v2' is chosen for being lightweight and fast
-    _model = SentenceTransformer('all-MiniLM-L6-v2')
+    _model = SentenceTransformer(MODEL_NAME)
     print("✅ Model loaded successfully.")
 except ImportError:
     _model = None
     print("WARNING: 'sentence-transformers' not installed. Please run 'pip install sentence-transformers'.")
 
+# Shared by the indexer, rerankers and answer agents; RAG_EMBEDDING_CACHE overrides the path ("" disables the disk tier)
+embedding_cache = EmbeddingCache(os.environ.get("RAG_EMBEDDING_CACHE", EmbeddingCache.DEFAULT_PATH), MODEL_NAME)
+
 def get_embedding(text: str) -> List[float]:
     """
     Converts text into a semantic vector (384-dimensional).
     Returns a zero-vector if the model is not loaded or text is empty.
     """
     if _model is None:
-        return [0.0] * 384
+        return [0.0] * EMBEDDING_DIM
     
     # Pre-processing: Remove newlines and trim whitespace
     clean_text = text.replace("\n", " ").strip()
     if not clean_text:
-        return [0.0] * 384
+        return [0.0] * EMBEDDING_DIM
         
+    cached = embedding_cache.get(clean_text)
+    if cached is not None:
+        return cached.tolist()
+
     # Generate embedding and convert numpy array to list
     embedding = _model.encode(clean_text, convert_to_numpy=True)
+    embedding_cache.put(clean_text, embedding)
     return embedding.tolist()
 
+def get_embeddings(texts: List[str], batch_size: int = 32) -> List[List[float]]:
+    """
+    Batched variant of get_embedding for bulk encoding (e.g. indexing).
+    Texts are sorted by length and encoded in buckets so each forward pass
+    pads to similar lengths; results are returned in the original order.
+    Texts found in the embedding cache are not encoded again.
+    """
+    zero = [0.0] * EMBEDDING_DIM
+    results: List[List[float]] = [zero] * len(texts)
+    if _model is None or not texts:
+        return results
+
+    clean_texts = [t.replace("\n", " ").strip() for t in texts]
+    # Empty texts keep the zero-vector, exactly like get_embedding
+    pending = [i for i, t in enumerate(clean_texts) if t]
+    cached = embedding_cache.get_many([clean_texts[i] for i in pending])
+    for n, vec in cached.items():
+        results[pending[n]] = vec.tolist()
+    order = sorted((i for n, i in enumerate(pending) if n not in cached), key=lambda i: len(clean_texts[i]))
+    batch_size = max(1, batch_size)
+
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        vectors = _model.encode([clean_texts[i] for i in bucket], batch_size=len(bucket), convert_to_numpy=True)
+        embedding_cache.put_many([clean_texts[i] for i in bucket], list(vectors))
+        for i, vec in zip(bucket, vectors):
+            results[i] = vec.tolist()
+    return results
+
 def get_stub_embedding(text: str) -> List[float]:
     """
     Maintained for backward compatibility. 
@@ -42,7 +84,8 @@ def cosine_similarity(v1: List[float], v2: List[float]) -> float:
     Calculates the cosine similarity between two vectors using NumPy.
     Used for reranking hits in the RAG pipeline.
     """
-    if not v1 or not v2: 
+    # len() checks keep this working for both Python lists and NumPy rows
+    if v1 is None or v2 is None or len(v1) == 0 or len(v2) == 0:
         return 0.0
     
     # Convert lists to NumPy arrays for faster computation
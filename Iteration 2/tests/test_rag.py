@@ -1,6 +1,9 @@
+import os
+import tempfile
 import unittest
+import numpy as np
 from unittest.mock import MagicMock, patch, Mock
-from src.models import Intent, KeywordIndex, IndexEntry, Chunk, Hit, Answer, Citation
+from src.models import Intent, KeywordIndex, IndexEntry, Chunk, Hit, Answer, Citation, SelectionLimits, RetrievalScopes
 from src.impl import (
     ConfigurableIntentDetector,
     HeuristicQueryWriter,
@@ -8,8 +11,23 @@ from src.impl import (
     SimpleReranker,
     CosineReranker,
     VectorAnswerAgent,
-    KeywordAnswerAgent
+    KeywordAnswerAgent,
+    BM25Retriever,
+    DenseRetriever,
+    HybridRetriever
 )
+from src.indexer import IndexerMain
+from src.factory import PipelineFactory
+from src.pipeline import RagOrchestrator
+from src.index_store import CompactIndex
+from src.streaming import SpillingPostingsBuffer, JsonArrayWriter
+from src.ann import IvfIndex
+from src.analysis import TurkishAnalyzer, turkish_lower
+from src.embedding_cache import EmbeddingCache
+from src.matcher import TermMatcher
+from src.facts import FactTables
+from src.cache import QueryCache, AppendLogStore, SqliteStore, IndexGeneration
+from src.semantic_cache import SemanticCache
 
 # ============================================================================
 # 1. TEST BASE CLASS - OOPS Prensipleri: Inheritance & Encapsulation
@@ -202,6 +220,113 @@ class RagSystemTest(BaseRagTestCase):
         # 3 matching terms olduğu için yüksek score olmalı
         self.assertGreater(hits[0].score, 1000)
 
+    def test_retriever_repeated_term_counts_once_as_distinct_match(self):
+        """Tekrarlanan terim tf'yi tekrar eklemeli ama tek eşleşme sayılmalı"""
+        retriever = KeywordRetriever()
+
+        hits = retriever.retrieve(["madde", "madde", "sınav"], self.index)
+
+        self.assertEqual(len(hits), 1)
+        self.assertEqual((hits[0].docId, hits[0].chunkId), ("yonetmelik.txt", 1))
+        self.assertEqual(hits[0].score, 2 * 1000.0 + 3 + 3 + 1)
+
+    def test_bm25_prefers_higher_tf_and_rarer_terms(self):
+        """BM25, indeksteki tf/df/uzunluk istatistikleriyle sıralamalı"""
+        index = KeywordIndex()
+        index.indexMap["staj"] = [IndexEntry("staj", 0, 3), IndexEntry("staj", 1, 1), IndexEntry("yaz_okulu", 0, 1)]
+        index.indexMap["defteri"] = [IndexEntry("staj", 1, 1)]
+        index.indexMap["ders"] = [IndexEntry("yaz_okulu", 0, 2)]
+        index.chunkLengths = {"staj": [10, 10], "yaz_okulu": [10]}
+
+        hits = BM25Retriever().retrieve(["staj"], index)
+        self.assertEqual((hits[0].docId, hits[0].chunkId), ("staj", 0))
+
+        hits = BM25Retriever().retrieve(["staj", "defteri"], index)
+        self.assertEqual((hits[0].docId, hits[0].chunkId), ("staj", 1))
+        self.assertEqual(len(hits), 3)
+
+    def test_bm25_length_normalization(self):
+        """Aynı tf için kısa chunk daha yüksek puan almalı"""
+        index = KeywordIndex()
+        index.indexMap["madde"] = [IndexEntry("a", 0, 2), IndexEntry("b", 0, 2)]
+        index.chunkLengths = {"a": [100], "b": [10]}
+
+        hits = BM25Retriever().retrieve(["madde"], index)
+        self.assertEqual(hits[0].docId, "b")
+        self.assertGreater(hits[0].score, hits[1].score)
+
+    def test_indexer_records_true_term_frequencies(self):
+        """Indexer tekrar eden kelimeler için gerçek tf değerini kaydetmeli"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "staj.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Staj staj staj zorunludur ve staj defteri teslim edilir.")
+            chunks, index_map = [], {}
+            with patch('src.indexer.get_embeddings', side_effect=lambda t, b: [[0.0] * 384 for _ in t]):
+                IndexerMain.process_file(path, "staj.txt", chunks, index_map)
+
+        self.assertEqual(index_map["staj"][0].tf, 4)
+        self.assertEqual(index_map["defteri"][0].tf, 1)
+        compact = CompactIndex.from_map(index_map, chunks)
+        self.assertEqual(compact.chunkLengths, {"staj": [9]})
+        self.assertEqual(compact.doc_freq(compact.term_id("staj")), 1)
+
+    def test_retriever_top_k_matches_sorted_prefix(self):
+        """top_k verildiğinde sonuç, tam sıralı listenin ilk k elemanı olmalı (eşitlikler dahil)"""
+        index = KeywordIndex()
+        index.indexMap["staj"] = [IndexEntry(f"doc{i % 4}.txt", i, 1 + i % 3) for i in range(20)]
+        index.indexMap["defter"] = [IndexEntry(f"doc{i % 4}.txt", i, 1) for i in range(0, 20, 5)]
+
+        for retriever in (KeywordRetriever(), BM25Retriever()):
+            full = retriever.retrieve(["staj", "defter"], index)
+            for k in (1, 3, 7, 20, 50):
+                top = retriever.retrieve(["staj", "defter"], index, top_k=k)
+                self.assertEqual([(h.docId, h.chunkId, h.score) for h in top],
+                                 [(h.docId, h.chunkId, h.score) for h in full[:k]])
+
+    def test_orchestrator_applies_per_intent_limits(self):
+        """Orchestrator intent'e göre top_k'yı retriever'a, top_n'i answer agent'a uygulamalı"""
+        hits = [Hit("a.txt", i, 10.0 - i, None) for i in range(6)]
+        retriever = MagicMock()
+        retriever.retrieve.return_value = hits
+        reranker = MagicMock()
+        reranker.rerank.side_effect = lambda terms, h: h
+        agent = MagicMock()
+        agent.answer.return_value = Answer("ok", [])
+        limits = SelectionLimits(top_k=10, top_n=5, top_k_by_intent={"STAFF_LOOKUP": 3},
+                                 top_n_by_intent={"STAFF_LOOKUP": 2})
+
+        orchestrator = RagOrchestrator(ConfigurableIntentDetector(self.rules), HeuristicQueryWriter(),
+                                       retriever, reranker, agent, self.index, None, limits)
+        orchestrator.run("Murat hoca nerede?")
+        self.assertEqual(retriever.retrieve.call_args.kwargs["top_k"], 3)
+        self.assertEqual(len(agent.answer.call_args.args[1]), 2)
+
+        orchestrator.run("Bu dersin kredisi kaç?")
+        self.assertEqual(retriever.retrieve.call_args.kwargs["top_k"], 10)
+        self.assertEqual(len(agent.answer.call_args.args[1]), 5)
+
+    def test_intent_scope_masks_retrieval_and_falls_back(self):
+        """Intent'in belge sınıfı dışındaki chunk'lar aranmamalı; az sonuçta tüm korpusa dönülmeli"""
+        index = KeywordIndex()
+        index.indexMap["ofis"] = [IndexEntry("akademik kadro", 0, 1), IndexEntry("staj", 0, 3)]
+        index.indexMap["staj"] = [IndexEntry("staj", 0, 2), IndexEntry("staj", 1, 1)]
+        compact = CompactIndex.from_map(index.indexMap, doc_classes={"akademik kadro": "STAFF", "staj": "PARAGRAPH"})
+        mask = compact.class_mask(["STAFF"])
+        self.assertEqual(mask.tolist(), [True, False, False])
+
+        for retriever in (KeywordRetriever(), BM25Retriever()):
+            hits = retriever.retrieve(["ofis"], compact, top_k=5, chunk_mask=mask)
+            self.assertEqual([h.docId for h in hits], ["akademik kadro"])
+
+        orchestrator = RagOrchestrator(ConfigurableIntentDetector(self.rules), HeuristicQueryWriter(),
+                                       KeywordRetriever(), SimpleReranker([]), KeywordAnswerAgent(), compact,
+                                       scopes=RetrievalScopes(min_hits=1))
+        self.assertEqual([h.docId for h in orchestrator._retrieve(["ofis"], Intent.STAFF_LOOKUP, 5)],
+                         ["akademik kadro"])
+        self.assertEqual(len(orchestrator._retrieve(["staj"], Intent.STAFF_LOOKUP, 5)), 2)
+        self.assertEqual(len(orchestrator._retrieve(["ofis"], Intent.POLICY_FAQ, 5)), 2)
+
     # ========================================================================
     # TEST 4: Simple Reranker - Encapsulation & Abstraction
     # ========================================================================
@@ -256,6 +381,45 @@ class RagSystemTest(BaseRagTestCase):
         # "java" ve "oop" 8 char aralıkta, proximity bonus almalı
         self.assertGreater(reranked[0].score, 20)
 
+    def test_positional_reranker_uses_postings(self):
+        """Pozisyonlu indeksle tf, yakınlık ve ifade (phrase) eşleşmesi postinglerden hesaplanmalı"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "staj.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Staj süresi 20 iş günü; staj defteri teslim edilir.\n\n"
+                        "Staj komisyonu süresi dolan defteri inceler ve staj notu verir.")
+            chunks, index_map = [], {}
+            with patch('src.indexer.get_embeddings', side_effect=lambda t, b: [[0.0] * 384 for _ in t]):
+                IndexerMain.process_file(path, "staj.txt", chunks, index_map, positional=True)
+
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(index_map["staj"][0].positions, [0, 5])
+        compact = CompactIndex.from_map(index_map, chunks)
+        self.assertTrue(compact.has_positions)
+
+        reranker = SimpleReranker(chunks, compact)
+        hits = reranker.rerank(["staj", "süresi", "20"], [Hit("staj", 1, 0.0), Hit("staj", 0, 0.0)])
+        scores = {h.chunkId: h.score for h in hits}
+        # chunk 0: tf 4 -> 40, "staj süresi" bitişik (yakınlık 5 + phrase 5), sayısal terim 200, başlık 3
+        self.assertEqual(scores[0], 40 + 10 + 200 + 3)
+        # chunk 1: tf 3 -> 30, "staj ... süresi" 2 token aralıkta (yakınlık 5), phrase yok
+        self.assertEqual(scores[1], 30 + 5 + 3)
+        self.assertEqual(hits[0].chunkId, 0)
+
+    def test_positional_proximity_window_matches_text_window(self):
+        """Pozisyonlu yakınlık penceresi karakter penceresinden türetilmeli; iki yol aynı bonusu vermeli"""
+        text = "staj ve bu süresi ab cd"
+        chunk = Chunk("yonetmelik", 0, text, 0, len(text))
+        index_map = {t: [IndexEntry("yonetmelik", 0, 1, positions=[p])] for p, t in enumerate(text.split())}
+        reranker = SimpleReranker([chunk], CompactIndex.from_map(index_map, [chunk]))
+
+        # 6 token / 23 karakter: 15 karakterlik pencere 3 token eder
+        self.assertEqual(reranker._token_window("yonetmelik_0", chunk), 3)
+        positional = reranker.rerank(["staj", "süresi"], [Hit("yonetmelik", 0, 0.0)])[0].score
+        text_only = SimpleReranker([chunk]).rerank(["staj", "süresi"], [Hit("yonetmelik", 0, 0.0)])[0].score
+        self.assertEqual(positional, text_only)
+        self.assertEqual(positional, 20 + 5)
+
     # ========================================================================
     # TEST 5: Cosine Reranker - Polymorphism
     # ========================================================================
@@ -413,6 +577,28 @@ class RagSystemTest(BaseRagTestCase):
         # d) Kopya çekmek seçilmeli, context'te satırlar bulunmalı
         self.assertIn("Kopya çekmek", answer.finalText)
 
+    @patch('src.impl.get_embedding')
+    @patch('src.impl.cosine_similarity')
+    def test_vector_agent_uses_precomputed_line_embeddings(self, mock_sim, mock_emb):
+        """İndekste satır embedding'i olan parçada satırlar sorgu anında kodlanmamalı"""
+        mock_emb.return_value = [1.0] + [0.0] * 383
+        text = "Uzaklaştırma Cezası:\n  a) Kavga etmek\nd) Kopya çekmek\n\ne) Tehdit etmek"
+        spans = IndexerMain.line_spans(text)
+        self.assertEqual([text[s:e] for s, e in spans],
+                         [l.strip() for l in text.split("\n") if len(l.strip()) > 2])
+
+        rows = np.zeros((len(spans), 384), dtype=np.float32)
+        rows[:, 1] = 1.0
+        rows[2, 0] = 5.0  # "d) Kopya çekmek" soruya en yakın satır
+        chunk = Chunk("yonetmelik", 1, text, 0, len(text), lineSpans=spans, lineEmbeddings=rows)
+        agent = VectorAnswerAgent([chunk])
+
+        answer = agent.answer("kopya çekmek", [Hit("yonetmelik", 1, 100.0, text)])
+
+        self.assertIn("Kopya çekmek", answer.finalText)
+        self.assertEqual(mock_emb.call_count, 1)  # only the question
+        mock_sim.assert_not_called()
+
     @patch('src.impl.get_embedding')
     @patch('src.impl.cosine_similarity')
     def test_vector_agent_academic_filtering(self, mock_sim, mock_emb):
@@ -640,5 +826,1065 @@ class RagSystemTest(BaseRagTestCase):
         self.assertEqual(result1, Intent.COURSE_INFO)
 
 
+
+# ============================================================================
+# 13. INDEXER TESTS
+# ============================================================================
+class IndexerTest(unittest.TestCase):
+    """Indexer çıktısının deterministik olduğunu test eder"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.corpus_dir = self.tmp.name
+        self.files = {
+            "akademik kadro.txt": "Prof. Dr. Mustafa AĞAOĞLU\nOfis: M2-221\n\nDoç. Dr. Ali VELİ\nOfis: M2-100",
+            "ders_planı.txt": "CSE3063 Object Oriented Design (ECTS=5)\nCSE1242 Computer Programming II (ECTS=6)",
+            "staj.txt": "Staj en az yirmi iş günü sürer ve zorunludur.\n\nStaj defteri bölüme teslim edilir.",
+        }
+        for name, text in self.files.items():
+            with open(os.path.join(self.corpus_dir, name), "w", encoding="utf-8") as f:
+                f.write(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch('src.indexer.get_embeddings')
+    def test_worker_merge_matches_serial_run(self, mock_emb):
+        """Dosya bazlı worker sonuçlarının birleşimi seri çalıştırmayla aynı olmalı"""
+        mock_emb.side_effect = lambda texts, batch_size: [[0.0] * 384 for _ in texts]
+        files = sorted(self.files)
+
+        serial_chunks, serial_index = [], {}
+        IndexerMain.index_corpus(self.corpus_dir, files, serial_chunks, serial_index, workers=1)
+
+        merged_chunks, merged_index = [], {}
+        for name in files:
+            result = IndexerMain.index_file((os.path.join(self.corpus_dir, name), name, 8))
+            IndexerMain.merge_file_result(result, merged_chunks, merged_index)
+
+        self.assertEqual(serial_chunks, merged_chunks)
+        self.assertEqual(list(serial_index.keys()), list(merged_index.keys()))
+        self.assertEqual(serial_index, merged_index)
+
+    @patch('src.indexer.get_embeddings')
+    def test_worker_lexicon_comes_from_pool_initializer(self, mock_emb):
+        """Sözlük işlere eklenmeden, havuz başlatıcısıyla bir kez kurulup her dosyada kullanılmalı"""
+        import src.indexer as indexer
+        mock_emb.side_effect = lambda texts, batch_size: [[0.0] * 384 for _ in texts]
+        name = sorted(self.files)[0]
+        path = os.path.join(self.corpus_dir, name)
+        analyzer = {"name": "turkish", "lexicon": True}
+        lexicon = IndexerMain.corpus_lexicon(self.corpus_dir, [name], analyzer)
+
+        explicit = IndexerMain.index_file((path, name, 8, False, analyzer, lexicon))
+        IndexerMain.init_worker(lexicon)
+        try:
+            shared = IndexerMain.index_file((path, name, 8, False, analyzer))
+        finally:
+            IndexerMain.init_worker(None)
+        self.assertIsNone(indexer._worker_lexicon)
+        self.assertEqual(shared, explicit)
+        self.assertNotEqual(IndexerMain.index_file((path, name, 8, False, analyzer)), explicit)
+
+
+    @patch('src.indexer.get_embeddings')
+    def test_process_file_embeds_segments_in_one_batch(self, mock_emb):
+        """Bir dosyanın tüm parçaları tek bir toplu embedding çağrısıyla kodlanmalı"""
+        mock_emb.side_effect = lambda texts, batch_size: [[float(i)] * 384 for i in range(len(texts))]
+        chunks, index_map = [], {}
+        name = "akademik kadro.txt"
+        IndexerMain.process_file(os.path.join(self.corpus_dir, name), name, chunks, index_map, batch_size=16)
+
+        self.assertEqual(mock_emb.call_count, 1)
+        self.assertEqual(mock_emb.call_args[0][1], 16)
+        self.assertEqual([c.embedding[0] for c in chunks], [float(i) for i in range(len(chunks))])
+
+
+    @patch('src.indexer.get_embeddings')
+    def test_incremental_build_only_reprocesses_changed_files(self, mock_emb):
+        """Artımlı modda yalnızca değişen dosyalar yeniden işlenmeli, diğerlerinin embedding'i korunmalı"""
+        mock_emb.side_effect = lambda texts, batch_size: [[1.0] * 384 for _ in texts]
+        files = sorted(self.files)
+        hashes = {f: IndexerMain.file_hash(os.path.join(self.corpus_dir, f)) for f in files}
+        prev_chunks, prev_index = [], {}
+        IndexerMain.index_corpus(self.corpus_dir, files, prev_chunks, prev_index)
+        manifest = IndexerMain.build_manifest(files, hashes, IndexerMain.chunk_ranges(prev_chunks))
+
+        # staj.txt değişir, ders_planı.txt silinir
+        with open(os.path.join(self.corpus_dir, "staj.txt"), "a", encoding="utf-8") as f:
+            f.write("\n\nStaj sonunda rapor hazırlanır ve sunulur.")
+        files = ["akademik kadro.txt", "staj.txt"]
+        hashes = {f: IndexerMain.file_hash(os.path.join(self.corpus_dir, f)) for f in files}
+
+        dirty, stale = IndexerMain.diff_corpus(files, hashes, manifest)
+        self.assertEqual(dirty, ["staj.txt"])
+        self.assertEqual(sorted(stale), ["ders_planı", "staj"])
+
+        mock_emb.reset_mock()
+        mock_emb.side_effect = lambda texts, batch_size: [[2.0] * 384 for _ in texts]
+        chunks, index_map = [], {}
+        IndexerMain.index_incremental(self.corpus_dir, files, dirty, stale, manifest,
+                                      prev_chunks, prev_index, chunks, index_map)
+
+        self.assertEqual(mock_emb.call_count, 1)
+        staff = [c for c in chunks if c.docId == "akademik kadro"]
+        self.assertTrue(all(c.embedding[0] == 1.0 for c in staff))
+        self.assertTrue(all(c.embedding[0] == 2.0 for c in chunks if c.docId == "staj"))
+        self.assertNotIn("cse3063", index_map)
+        self.assertIn("rapor", index_map)
+        self.assertEqual(len(index_map["staj"]), 3)
+
+    @patch('src.indexer.get_embeddings')
+    def test_turkish_analyzer_indexes_stems(self, mock_emb):
+        """Türkçe analizörle indeks kökleri tutmalı; çekimli sorgu terimleri aynı parçaları bulmalı"""
+        mock_emb.side_effect = lambda texts, batch_size: [[0.0] * 384 for _ in texts]
+        chunks, index_map = [], {}
+        name = "staj.txt"
+        analyzer = TurkishAnalyzer().config()
+        IndexerMain.process_file(os.path.join(self.corpus_dir, name), name, chunks, index_map, analyzer=analyzer)
+        self.assertIn("staj", index_map)
+        self.assertIn("defter", index_map)
+        self.assertNotIn("defteri", index_map)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            CompactIndex.from_map(index_map, chunks, {"analyzer": analyzer}).save(path)
+            index = CompactIndex.load(path)
+        hits = BM25Retriever().retrieve(["defterleri", "STAJIN"], index)
+        self.assertEqual([(h.docId, h.chunkId) for h in hits], [("staj", 1), ("staj", 0)])
+
+
+class EmbeddingBatchTest(unittest.TestCase):
+    """Toplu embedding yolunun sırayı koruduğunu test eder"""
+
+    def test_get_embeddings_preserves_input_order(self):
+        """Uzunluğa göre gruplansa da sonuçlar girdi sırasıyla dönmeli"""
+        import numpy as np
+        from src import utils
+
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, batch_size, convert_to_numpy: np.array([[float(len(t))] * 384 for t in texts])
+        with patch.object(utils, "_model", model), patch.object(utils, "embedding_cache", EmbeddingCache("")):
+            texts = ["uzun bir metin parçası", "kısa", "", "orta metin"]
+            vectors = utils.get_embeddings(texts, batch_size=2)
+
+        self.assertEqual([v[0] for v in vectors], [22.0, 4.0, 0.0, 10.0])
+        self.assertEqual(model.encode.call_count, 2)
+
+    def test_embedding_cache_skips_the_model_for_seen_texts(self):
+        """Daha önce kodlanan metinler (diskteki önbellek dahil) modele tekrar gönderilmemeli"""
+        from src import utils
+
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kw: (np.array([[float(len(t))] * 384 for t in texts])
+                                                        if isinstance(texts, list) else np.full(384, float(len(texts))))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "embeddings.sqlite")
+            with patch.object(utils, "_model", model), patch.object(utils, "embedding_cache", EmbeddingCache(path, "m")):
+                utils.get_embeddings(["staj süresi", "kısa"], batch_size=8)
+                self.assertEqual(utils.get_embedding("staj süresi\n")[0], 11.0)
+                self.assertEqual(model.encode.call_count, 1)
+                self.assertEqual(utils.embedding_cache.stats()["memoryHits"], 1)
+                utils.embedding_cache.close()
+
+            # Yeni süreç: bellek boş, disk katmanı dolu; başka model adıyla eşleşme olmamalı
+            cache = EmbeddingCache(path, "m", max_entries=2)
+            self.assertEqual(cache.get("kısa")[0], 4.0)
+            self.assertEqual(cache.stats()["diskHits"], 1)
+            self.assertIsNone(EmbeddingCache(path, "baska-model").get("kısa"))
+            cache.put_many(["a", "b", "c"], [np.ones(384)] * 3)
+            self.assertGreater(cache.stats()["evictions"], 0)
+            cache.close()
+
+    def test_embedding_cache_counts_only_rows_it_added_and_deleted(self):
+        """Var olan satırı yeniden yazmak satır sayısını artırmamalı; tahliye sayısı silinen satır kadar olmalı"""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"), "m", max_entries=10)
+            for _ in range(3):
+                cache.put_many(["a", "b", "a"], [np.ones(4)] * 3)
+            self.assertEqual((cache._rows, cache.stats()["evictions"]), (2, 0))
+
+            cache.put_many([str(i) for i in range(10)], [np.ones(4)] * 10)
+            (rows,) = cache._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            self.assertEqual(cache._rows, rows)
+            self.assertEqual(cache.stats()["evictions"], 12 - rows)
+            cache.close()
+
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+    """Embedding matrisinin diske yazılıp memory-map ile okunmasını test eder"""
+
+    def test_embeddings_round_trip_as_memory_mapped_rows(self):
+        """Her chunk kendi satırını (liste değil) görmeli"""
+        import json
+        import numpy as np
+
+        chunks = [
+            Chunk("doc", 0, "birinci parça", 0, 13, embedding=[0.5] * 384),
+            Chunk("doc", 1, "ikinci parça", 0, 12, embedding=[0.25] * 384),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            chunks_path = os.path.join(tmp, "chunks.json")
+            emb_path = os.path.join(tmp, "embeddings.npy")
+            with open(chunks_path, "w", encoding="utf-8") as f:
+                json.dump([{k: v for k, v in c.__dict__.items() if k != "embedding"} for c in chunks], f)
+            IndexerMain.save_embeddings(chunks, emb_path)
+
+            loaded = PipelineFactory._load_chunks(chunks_path, emb_path)
+
+            self.assertEqual(len(loaded), 2)
+            self.assertIsInstance(loaded[0].embedding, np.memmap)
+            self.assertEqual(loaded[0].embedding.dtype, np.float32)
+            self.assertAlmostEqual(float(loaded[1].embedding[0]), 0.25)
+
+    @patch('src.indexer.get_embeddings')
+    def test_line_embeddings_round_trip(self, mock_emb):
+        """Satır embedding'leri parçalarla aynı toplu çağrıda üretilip satır sırasıyla geri yüklenmeli"""
+        import json
+        mock_emb.side_effect = lambda texts, batch_size: [[float(i)] * 384 for i in range(len(texts))]
+        with tempfile.TemporaryDirectory() as tmp:
+            name = "staj.txt"
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write("Staj Yönergesi\nStaj 20 iş günüdür.\n\nDefter teslim edilir.\nOnay alınır.")
+            chunks = []
+            IndexerMain.process_file(os.path.join(tmp, name), name, chunks, {})
+            self.assertEqual(mock_emb.call_count, 1)
+
+            chunks_path = os.path.join(tmp, "chunks.json")
+            emb_path = os.path.join(tmp, "embeddings.npy")
+            with open(chunks_path, "w", encoding="utf-8") as f:
+                json.dump([IndexerMain.chunk_record(c) for c in chunks], f)
+            IndexerMain.save_embeddings(chunks, emb_path)
+            IndexerMain.save_line_embeddings(chunks, os.path.join(tmp, "line_embeddings.npy"))
+
+            loaded = PipelineFactory._load_chunks(chunks_path, emb_path)
+
+        self.assertEqual([len(c.lineSpans) for c in loaded], [2, 2])
+        # Parçalar 0-1, satırlar 2-5 numaralı vektörleri almıştı
+        self.assertEqual([float(r[0]) for c in loaded for r in c.lineEmbeddings], [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(loaded[1].rawText[slice(*loaded[1].lineSpans[0])], "Defter teslim edilir.")
+
+    @patch('src.impl.get_embedding')
+    def test_cosine_reranker_uses_numpy_rows_without_reencoding(self, mock_emb):
+        """NumPy satırları olan chunk'lar için metin tekrar kodlanmamalı"""
+        import numpy as np
+
+        mock_emb.return_value = [1.0] * 384
+        chunk = Chunk("ders_planı", 0, "CSE3063 Object Oriented Design", 0, 30,
+                      embedding=np.ones(384, dtype=np.float32))
+        reranker = CosineReranker([chunk])
+
+        reranked = reranker.rerank(["cse3063"], [Hit("ders_planı", 0, 1.0, None)])
+
+        self.assertEqual(mock_emb.call_count, 1)  # only the query
+        self.assertGreater(reranked[0].score, 99.0)
+
+
+    @patch('src.impl.get_embedding')
+    def test_cosine_reranker_matrix_scores_match_pairwise_cosine(self, mock_emb):
+        """Tek matris çarpımıyla hesaplanan skorlar çift bazlı cosine ile aynı olmalı; embedding matris görünümü olmalı"""
+        from src.utils import cosine_similarity
+        rng = np.random.default_rng(3)
+        vectors = rng.normal(size=(6, 384)).astype(np.float32)
+        chunks = [Chunk("yonetmelik", i, f"metin {i}", 0, 0, embedding=vectors[i]) for i in range(6)]
+        query = rng.normal(size=384).tolist()
+        mock_emb.return_value = query
+
+        reranker = CosineReranker(chunks, vectors)
+        reranked = reranker.rerank(["xyz"], [Hit("yonetmelik", i, 1.0, None) for i in (4, 1, 5)])
+
+        for hit in reranked:
+            self.assertAlmostEqual(hit.score, cosine_similarity(query, vectors[hit.chunkId]) * 100.0, places=3)
+            self.assertIs(hit.embedding.base, reranker.matrix)
+        self.assertEqual(mock_emb.call_count, 1)
+
+
+class CompactIndexTest(BaseRagTestCase):
+    """İkili (binary) indeks formatının JSON indeksle eşdeğer olduğunu test eder"""
+
+    def test_binary_round_trip_preserves_postings(self):
+        """Kaydedilip memory-map ile açılan indeks aynı postingleri vermeli"""
+        self.index.indexMap["öğrenci"] = [IndexEntry("yonetmelik.txt", 1, 2), IndexEntry("ders_planı.txt", 0, 1)]
+        compact = CompactIndex.from_map(self.index.indexMap, self.chunks)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            compact.save(path)
+            loaded = CompactIndex.load(path)
+
+            self.assertEqual(sorted(loaded.indexMap), sorted(self.index.indexMap))
+            for term, entries in self.index.indexMap.items():
+                key = lambda e: (e.docId, e.chunkId)
+                self.assertEqual(sorted(loaded.indexMap[term], key=key), sorted(entries, key=key))
+            self.assertNotIn("yok", loaded.indexMap)
+
+            ordinals, tfs = loaded.postings("öğrenci")
+            self.assertEqual(ordinals.tolist(), [0, 1])  # ordinals follow chunk order
+            self.assertEqual(tfs.tolist(), [1, 2])
+            self.assertEqual(loaded.doc_id(1), "yonetmelik.txt")
+
+            hits = KeywordRetriever().retrieve(["cse3063", "design"], loaded)
+            self.assertEqual(hits[0].docId, "ders_planı.txt")
+            self.assertGreater(hits[0].score, 2000)
+
+    def test_empty_index_round_trip(self):
+        """Boş indeks de kaydedilip açılabilmeli"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            CompactIndex.from_map({}).save(path)
+            loaded = CompactIndex.load(path)
+            self.assertEqual(len(loaded.indexMap), 0)
+            self.assertEqual(KeywordRetriever().retrieve(["madde"], loaded), [])
+
+    def test_positions_round_trip(self):
+        """Pozisyonlar binary ve JSON indekste korunmalı; pozisyonsuz indeks JSON formatını değiştirmemeli"""
+        import json
+        from src.index_store import save_json_index, load_json_index
+        index_map = {"staj": [IndexEntry("staj", 0, 2, [0, 6]), IndexEntry("staj", 1, 1, [3])],
+                     "defter": [IndexEntry("staj", 0, 1, [7])]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            CompactIndex.from_map(index_map).save(path)
+            loaded = CompactIndex.load(path)
+            self.assertTrue(loaded.has_positions)
+            self.assertEqual(loaded.indexMap["staj"], index_map["staj"])
+
+            json_path = os.path.join(tmp, "index.json")
+            save_json_index(index_map, json_path)
+            self.assertEqual(load_json_index(json_path).indexMap["defter"], index_map["defter"])
+
+            save_json_index(self.index.indexMap, json_path)
+            with open(json_path, encoding="utf-8") as f:
+                self.assertNotIn("positions", json.load(f)["indexMap"]["madde"][0])
+        self.assertFalse(CompactIndex.from_map(self.index.indexMap).has_positions)
+
+    def test_term_bounds_saved_and_derived(self):
+        """Terim üst sınırları (max tf, min uzunluk) kaydedilmeli; eski dosyalarda hesaplanmalı"""
+        self.index.indexMap["madde"].append(IndexEntry("ders_planı.txt", 0, 5))
+        compact = CompactIndex.from_map(self.index.indexMap, self.chunks)
+        expected = compact.term_bounds(compact.term_id("madde"))
+        self.assertEqual(expected[0], 5)
+
+        legacy = CompactIndex({k: v for k, v in compact.arrays.items() if not k.startswith("term_m")}, compact.meta)
+        self.assertEqual(legacy.term_bounds(legacy.term_id("madde")), expected)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.bin")
+            compact.save(path)
+            loaded = CompactIndex.load(path)
+            self.assertIn("term_max_tfs", loaded.arrays)
+            self.assertEqual(loaded.term_bounds(loaded.term_id("madde")), expected)
+
+    def test_max_score_pruning_matches_exhaustive(self):
+        """MaxScore budaması, tüm postingleri gezen skorlama ile aynı top-k'yı vermeli"""
+        index = KeywordIndex()
+        for term, step in (("staj", 1), ("defter", 2), ("sınav", 7), ("madde", 13), ("kopya", 29)):
+            index.indexMap[term] = [IndexEntry(f"doc{i % 9}.txt", i, 1 + (i * step) % 4)
+                                    for i in range(0, 3000, step)]
+        compact = CompactIndex.from_index(index)
+
+        queries = [["staj", "defter"], ["kopya", "staj", "madde"], ["sınav", "sınav", "defter", "kopya"], ["yok"]]
+        for retriever_type in (KeywordRetriever, BM25Retriever):
+            for query in queries:
+                for k in (1, 5, 40):
+                    pruned = retriever_type(pruning=True).retrieve(query, compact, top_k=k)
+                    full = retriever_type(pruning=False).retrieve(query, compact, top_k=k)
+                    self.assertEqual([(h.docId, h.chunkId, h.score) for h in pruned],
+                                     [(h.docId, h.chunkId, h.score) for h in full])
+
+    def test_duplicated_posting_counts_as_one_match(self):
+        """Aynı terimde iki kez geçen (docId, chunkId) postingi tek eşleşme sayılmalı, tf'leri toplanmalı"""
+        index = KeywordIndex()
+        index.indexMap["staj"] = [IndexEntry("staj", 0, 1), IndexEntry("staj", 0, 1), IndexEntry("staj", 1, 3)]
+        index.indexMap["defter"] = [IndexEntry("staj", 1, 1)]
+        compact = CompactIndex.from_index(index)
+        self.assertEqual(compact.doc_freq(compact.term_id("staj")), 2)
+        for pruning in (True, False):
+            hits = KeywordRetriever(pruning=pruning).retrieve(["staj", "defter"], compact, top_k=5)
+            self.assertEqual([(h.chunkId, h.score) for h in hits], [(1, 2004.0), (0, 1002.0)])
+
+    def test_json_index_ordinals_follow_chunk_rows_for_class_masks(self):
+        """JSON indeks chunks.json satır sırasıyla numaralanmalı; sınıf maskesi yoğun aramadaki satırlarla örtüşmeli"""
+        from src.index_store import save_json_index
+        chunks = [Chunk("akademik kadro", 0, "Ofis", 0, 4), Chunk("staj", 0, "Staj", 0, 4), Chunk("staj", 1, "Ofis", 4, 8)]
+        index_map = {"ofis": [IndexEntry("staj", 1, 1), IndexEntry("akademik kadro", 0, 1)],
+                     "staj": [IndexEntry("staj", 0, 2)]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.json")
+            save_json_index(index_map, path)
+            index = PipelineFactory._load_index(chunks, path, os.path.join(tmp, "index.bin"))
+
+        self.assertEqual([(index.doc_id(o), index.chunk_id(o)) for o in range(3)],
+                         [(c.docId, c.chunkId) for c in chunks])
+        index.set_doc_classes(IndexerMain.doc_classes(index.doc_table))
+        mask = index.class_mask(["STAFF"])
+        self.assertEqual(mask.tolist(), [True, False, False])
+
+        vectors = np.eye(3, dtype=np.float32)
+        ann = IvfIndex.build(vectors, n_lists=1)
+        ordinals, _ = ann.search(np.ones(3, dtype=np.float32), vectors, 3, 1, mask)
+        self.assertEqual([chunks[o].docId for o in ordinals], ["akademik kadro"])
+
+
+
+class TurkishAnalyzerTest(unittest.TestCase):
+    """Türkçe küçük harf dönüşümü ve ek ayıklama testleri"""
+
+    def setUp(self):
+        self.analyzer = TurkishAnalyzer()
+
+    def test_dotted_and_dotless_i(self):
+        """I -> ı ve İ -> i olmalı; birleşik nokta karakteri kalmamalı"""
+        self.assertEqual(turkish_lower("IŞIK İLETİŞİM"), "ışık iletişim")
+        self.assertEqual(self.analyzer.tokenize("İSTANBUL'da"), ["istanbul", "da"])
+
+    def test_inflected_forms_share_a_stem(self):
+        """Çekimli biçimler aynı köke inmeli; ders kodları kökleştirilmemeli"""
+        for stem, forms in {"sınav": ["sınav", "sınavına", "sınavlarından"],
+                            "ders": ["ders", "dersten", "dersinin"],
+                            "yönetmelik": ["yönetmelik", "yönetmeliğinden"],
+                            "danışman": ["danışman", "danışmanı"]}.items():
+            for form in forms:
+                self.assertEqual(self.analyzer.stem(form), stem, form)
+        self.assertEqual(self.analyzer.analyze("CSE3063 dersinde"), ["cse3063", "ders"])
+        self.assertEqual(self.analyzer.query_terms(["çift anadal"]), ["çift", "anadal"])
+
+    def test_lexicon_keeps_words_that_only_look_inflected(self):
+        """Sözlükle kökleştirme ofis/ofisi, madde/maddesi, kayıt/kaydı çiftlerini aynı köke indirmeli"""
+        text = "Ofis: M2-201. Ofisi kapalı. Madde 5 ve maddesi. Kayıt yenileme, kaydı silinen hoca, hocası"
+        lexicon = frozenset(self.analyzer.tokenize(text))
+        analyzer = TurkishAnalyzer(use_lexicon=True).with_lexicon(lexicon)
+        for stem, forms in {"ofis": ["ofis", "ofisi"], "madde": ["madde", "maddesi"],
+                            "kayıt": ["kayıt", "kaydı"], "hoca": ["hoca", "hocası"]}.items():
+            for form in forms:
+                self.assertEqual(analyzer.stem(form), stem, form)
+
+        # Queries are stemmed against the index terms and must meet the indexed stems
+        index_map = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "akademik kadro.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            with patch('src.indexer.get_embeddings', side_effect=lambda texts, *a: [[0.0] * 4 for _ in texts]):
+                IndexerMain.process_file(path, "akademik kadro.txt", [], index_map,
+                                         analyzer=analyzer.config(), lexicon=lexicon)
+        self.assertNotIn("ofi", index_map)
+        compact = CompactIndex.from_map(index_map, meta={"analyzer": analyzer.config()})
+        self.assertEqual(compact.query_analyzer().query_terms(["ofisi", "maddesi", "kaydı"]), ["ofis", "madde", "kayıt"])
+        hits = KeywordRetriever().retrieve(["ofisi"], compact, top_k=1)
+        self.assertEqual([h.docId for h in hits], ["akademik kadro"])
+
+
+class TermMatcherTest(unittest.TestCase):
+    """Çoklu terim eşleştiricinin str.count / str.find ile aynı sonucu verdiğini test eder"""
+
+    def test_scan_matches_count_and_find(self):
+        """Sayılar örtüşmeyen eşleşmeler, konumlar ilk geçiş olmalı; terimler küçük harfe indirgenmeli"""
+        text = "Staj defteri: staj bitince staj defteri teslim edilir. aaaa"
+        matcher = TermMatcher(["STAJ", "staj", "defteri", "aa", "yok"])
+        found = matcher.scan(text)
+        lowered = text.lower()
+        for term in ["staj", "defteri", "aa"]:
+            self.assertEqual(found[term], (lowered.count(term), lowered.find(term)))
+        self.assertNotIn("yok", found)
+        self.assertEqual(matcher.terms, ["staj", "defteri", "aa", "yok"])
+        self.assertTrue(matcher.any_in("STAJ.txt"))
+        self.assertEqual(matcher.present("Staj Defteri"), {"staj", "defteri"})
+
+    def test_overlapping_terms_share_one_pass(self):
+        """Birbirinin içinde ya da sonunda geçen terimler tek geçişte doğru sayılmalı"""
+        terms = ["staj", "taj", "aj", "j", "stajyer", "yeri", "erin", "bab", "ab"]
+        matcher = TermMatcher(terms)
+        for text in ["Stajyerin staj yeri", "babababa", "ajaj stajstaj", "xyz", ""]:
+            lowered = text.lower()
+            expected = {t: (lowered.count(t), lowered.find(t)) for t in terms if t in lowered}
+            self.assertEqual(matcher.scan(text), expected)
+            self.assertEqual(matcher.present(text), set(expected))
+            self.assertEqual(matcher.any_in(text), bool(expected))
+
+
+class FactTablesTest(unittest.TestCase):
+    """Ders kodu ve personel adı tablolarının çıkarılmasını ve hızlı yolu test eder"""
+
+    def setUp(self):
+        self.facts = FactTables()
+        course_text = "CSE3063 Object-Oriented Software Desg. (ECTS=5) - Önkoşul: CSE1242\nDönem (Junior - Bahar)"
+        staff_text = ("Öğr. Üyesi Betül Demiröz BOZ (Bölüm Başkan Yard.)\nPhD: Bilgisayar Müh.\n"
+                      "E-posta: betul.demiroz\nTelefon: 3534\nOfis: M2-234")
+        self.facts.add_chunk(Chunk("ders_planı", 7, course_text, 0, len(course_text)), "COURSE")
+        self.facts.add_chunk(Chunk("akademik kadro", 3, staff_text, 0, len(staff_text)), "STAFF")
+        self.facts.add_chunk(Chunk("staj", 0, "CSE3063 staj yerine sayılmaz", 0, 28), "PARAGRAPH")
+
+    def test_tables_hold_parsed_facts(self):
+        """Ders satırından AKTS/önkoşul, personel kaydından ofis/e-posta çıkarılmalı"""
+        course = self.facts.courses["CSE3063"]
+        self.assertEqual((course.ects, course.prerequisite, course.chunkId), (5, "CSE1242", 7))
+        person = self.facts.staff["betül demiröz boz"]
+        self.assertEqual((person.office, person.email), ("M2-234", "betul.demiroz"))
+        self.assertEqual(len(self.facts), 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "facts.json")
+            self.facts.save(path)
+            loaded = FactTables.load(path)
+        self.assertEqual(loaded.staff, self.facts.staff)
+        self.assertIsNotNone(loaded.find_staff("BETÜL DEMİRÖZ BOZ hocanın ofisi"))
+
+    def test_exact_questions_answered_from_tables(self):
+        """Tam kod/ad geçen sorular tablodan alıntıyla cevaplanmalı; belirsiz sorular boş dönmeli"""
+        answer = self.facts.answer("cse 3063 önkoşulu nedir?", Intent.COURSE_INFO)
+        self.assertTrue(answer.finalText.startswith("CSE3063"))
+        self.assertEqual(str(answer.citations[0]), "ders_planı:Chunk7:0-66")
+
+        answer = self.facts.answer("Betül Demiröz Boz'un ofisi nerede?", Intent.STAFF_LOOKUP)
+        self.assertEqual(answer.finalText, "Öğr. Üyesi Betül Demiröz BOZ (Bölüm Başkan Yard.)\nOfis: M2-234")
+
+        self.assertIsNone(self.facts.answer("CSE3063 ile CSE1242 farkı", Intent.COURSE_INFO))
+        self.assertIsNone(self.facts.answer("CSE3063 önkoşulu", Intent.POLICY_FAQ))
+        self.assertIsNone(self.facts.answer("Betül hocanın ofisi", Intent.STAFF_LOOKUP))
+
+    def test_orchestrator_fast_path_skips_retrieval(self):
+        """Tablodan cevaplanan soruda retriever ve reranker hiç çağrılmamalı"""
+        retriever, reranker, agent = MagicMock(), MagicMock(), MagicMock()
+        agent.answer.return_value = Answer("ok", [])
+        detector = ConfigurableIntentDetector({"COURSE_INFO": ["ders", "önkoşul"]})
+        orchestrator = RagOrchestrator(detector, HeuristicQueryWriter(), retriever, reranker, agent,
+                                       KeywordIndex(), facts=self.facts)
+
+        answer = orchestrator.run("CSE3063 dersinin önkoşulu nedir?")
+        self.assertIn("Önkoşul: CSE1242", answer.finalText)
+        retriever.retrieve.assert_not_called()
+        reranker.rerank.assert_not_called()
+
+        retriever.retrieve.return_value = []
+        reranker.rerank.return_value = []
+        self.assertEqual(orchestrator.run("CSE4999 dersi var mı?").finalText, "ok")
+        retriever.retrieve.assert_called_once()
+
+
+class QueryCacheTest(unittest.TestCase):
+    """Eklemeli (append-only) log tabanlı sorgu önbelleğini test eder"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "query_cache.jsonl")
+        self.legacy_path = os.path.join(self.tmp.name, "query_cache.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _cache(self, **store_args) -> QueryCache:
+        return QueryCache(self.log_path, self.legacy_path, AppendLogStore(self.log_path, **store_args))
+
+    def test_puts_are_appended_in_batches_and_reloaded(self):
+        """Her put dosyayı baştan yazmamalı; kuyruk toplu yazılmalı ve yeni süreç aynı girdileri görmeli"""
+        cache = self._cache(flush_interval=60)
+        for i in range(5):
+            cache.put(f"Soru {i}", Answer(f"cevap {i}", [Citation("staj", "Chunk1", 0, 0)]))
+        self.assertFalse(os.path.exists(self.log_path))
+        cache.save()
+        with open(self.log_path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 5)
+
+        reopened = self._cache()
+        self.assertEqual(reopened.get("  soru 3 ").finalText, "cevap 3")
+        self.assertEqual(str(reopened.get("soru 3").citations[0]), "staj:Chunk1:0-0")
+        cache.close()
+
+    def test_log_is_compacted_and_survives_torn_tail(self):
+        """Eskimiş kayıtlar sıkıştırılmalı; yarım kalmış son satır atlanıp sonraki kayıt korunmalı"""
+        cache = self._cache(flush_interval=60, min_compact_records=4)
+        for i in range(6):
+            cache.put("aynı soru", Answer(f"cevap {i}", []))
+            cache.save()
+        with open(self.log_path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), cache.store.records)
+        self.assertLess(cache.store.records, 4)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write('{"key":"yarım')
+
+        reopened = self._cache(flush_interval=60)
+        self.assertEqual(reopened.get("aynı soru").finalText, "cevap 5")
+        reopened.put("yeni soru", Answer("yeni", []))
+        reopened.save()
+        self.assertEqual(self._cache().get("yeni soru").finalText, "yeni")
+
+    def test_cache_opens_without_decoding_entries(self):
+        """Açılışta yalnızca anahtar dizini kurulmalı; girdiler sorgulandıkça tek tek çözülmeli"""
+        import json as json_module
+        writer = self._cache(flush_interval=60)
+        for i in range(20):
+            writer.put(f"soru {i}", Answer(f"cevap {i}", [Citation("d", "Chunk0", 0, 0)]))
+        writer.close()
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            # Cited bayrağı olmadan yazılmış eski kayıt tam çözülerek dizine girer
+            f.write(json_module.dumps({"key": "eski", "entry": {"finalText": "e", "citations": []}}) + "\n")
+
+        decoded = []
+        real_loads = json_module.loads
+        with patch('src.cache.json.loads', side_effect=lambda s, *a, **k: decoded.append(s) or real_loads(s, *a, **k)):
+            cache = self._cache()
+            cache.load()
+            self.assertEqual(len(decoded), 1)
+            self.assertEqual(cache.get("soru 3").finalText, "cevap 3")
+            self.assertEqual(len(decoded), 2)
+        self.assertEqual(len(cache.cache), 1)
+
+        # SQLite deposu açılışta hiç satır okumamalı
+        db_path = os.path.join(self.tmp.name, "query_cache.sqlite")
+        sqlite_cache = QueryCache(db_path, None, SqliteStore(db_path))
+        sqlite_cache.put("staj", Answer("20 iş günü", [Citation("staj", "Chunk1", 0, 0)]))
+        reopened = QueryCache(db_path, None, SqliteStore(db_path))
+        with patch.object(SqliteStore, "load", side_effect=AssertionError("bulk load")):
+            self.assertEqual(reopened.get("staj").finalText, "20 iş günü")
+        sqlite_cache.close()
+        reopened.close()
+
+    def test_log_bound_and_compaction_keep_entries_not_yet_read(self):
+        """Sıkıştırma bellekte olmayan girdileri korumalı; depo kendi sınırıyla en eski yazılanları atmalı"""
+        first = self._cache(flush_interval=60)
+        for i in range(5):
+            first.put(f"eski {i}", Answer("e", [Citation("d", "Chunk0", 0, 0)]))
+        first.close()
+
+        cache = QueryCache(self.log_path, None, AppendLogStore(self.log_path, flush_interval=60, max_entries=100),
+                           max_entries=4)
+        for i in range(300):
+            cache.put(f"yeni {i % 50}", Answer(f"y{i}", [Citation("d", "Chunk0", 0, 0)]))
+        cache.save()
+        self.assertLess(cache.store.records, 100)  # sıkıştırıldı
+        self.assertEqual(cache.get("eski 2").finalText, "e")
+        self.assertEqual(cache.get("yeni 49").finalText, "y299")
+
+        for i in range(200):
+            cache.put(f"sonra {i}", Answer("s", [Citation("d", "Chunk0", 0, 0)]))
+        cache.save()
+        stored = cache.store.load()
+        self.assertLessEqual(len(stored), 110)
+        self.assertIn("sonra 199", stored)
+        self.assertNotIn("eski 0", stored)
+        cache.close()
+
+    def test_bounds_evict_by_lru_or_lfu(self):
+        """Girdi sınırı aşılınca LRU en eski kullanılanı, LFU en az kullanılanı bellekten atmalı; depo korumalı"""
+        for policy, survivor, evicted in (("lru", "a", "b"), ("lfu", "a", "c")):
+            cache = QueryCache(os.path.join(self.tmp.name, f"{policy}.jsonl"), None, max_entries=2, policy=policy)
+            cache.put("a", Answer("A", [Citation("d", "Chunk0", 0, 0)]))
+            cache.put("b", Answer("B", [Citation("d", "Chunk1", 0, 0)]))
+            cache.get("a")
+            cache.get("b")
+            cache.get("a")
+            cache.put("c", Answer("C", [Citation("d", "Chunk2", 0, 0)]))
+            if policy == "lfu":
+                cache.put("d", Answer("D", [Citation("d", "Chunk3", 0, 0)]))
+            self.assertIn(survivor, cache.cache, policy)
+            self.assertNotIn(evicted, cache.cache, policy)
+            self.assertEqual(cache.evictions, 1 if policy == "lru" else 2)
+            # Bellekten atılan girdi depoda kalır ve ilk sorguda oradan okunur
+            self.assertIsNotNone(cache.get(evicted), policy)
+            self.assertIn(evicted, cache.cache, policy)
+            cache.close()
+
+        cache = QueryCache(self.log_path, None, max_bytes=400)
+        for i in range(10):
+            cache.put(f"soru {i}", Answer("x" * 50, [Citation("d", "Chunk0", 0, 0)]))
+        self.assertLessEqual(cache.bytes, 400)
+        self.assertIsNotNone(cache.get("soru 9"))
+        cache.save()
+        reopened = self._cache()
+        reopened.load()
+        self.assertEqual(len(reopened.cache), 0)
+        self.assertEqual(len(reopened.store.load()), 10)
+
+    def test_ttl_and_short_negative_ttl(self):
+        """Olumsuz cevaplar kısa TTL ile, diğerleri kendi TTL'leriyle düşmeli; sayaçlar iz olayına yazılmalı"""
+        cache = QueryCache(self.log_path, None, ttl_seconds=3600, negative_ttl_seconds=60)
+        with patch('src.cache.time.time', return_value=1000.0):
+            cache.put("bilinmeyen", Answer("Bilgi bulunamadı.", []))
+            cache.put("staj", Answer("20 iş günü", [Citation("staj", "Chunk1", 0, 0)]))
+        with patch('src.cache.time.time', return_value=1100.0):
+            self.assertIsNone(cache.get("bilinmeyen"))
+            self.assertIsNotNone(cache.get("staj"))
+        with patch('src.cache.time.time', return_value=5000.0):
+            self.assertIsNone(cache.get("staj"))
+        self.assertEqual((cache.hits, cache.misses, cache.expirations), (1, 2, 2))
+
+        events = []
+        orchestrator = RagOrchestrator(MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock(),
+                                       KeywordIndex(), cache)
+        cache.put("tekrar", Answer("cevap", [Citation("staj", "Chunk1", 0, 0)]))
+        with patch('src.pipeline.TraceBus.push_full', side_effect=lambda *a: events.append(a)):
+            orchestrator.run("Tekrar")
+        cache_events = [e[2] for e in events if e[0] == "CACHE"]
+        self.assertEqual(cache_events, ["hit hits=2 misses=2 semanticHits=0 evictions=0 expirations=2 invalidations=0 entries=1 bytes=%d" % cache.bytes])
+
+    def test_semantic_tier_serves_paraphrases_with_same_entities(self):
+        """Benzer soru aynı ders koduyla önbellekten dönmeli; farklı kod, olumsuz cevap veya atılan girdi dönmemeli"""
+        embedded = []
+
+        def embed(texts):
+            embedded.extend(texts)
+            return [[1.0 if "koşul" in t else 0.0, 1.0 if "ofis" in t else 0.0, 0.2 if "ders" in t else 0.0, 0.0]
+                    for t in texts]
+
+        semantic = SemanticCache(0.9, embed_many=embed, dim=4)
+        cache = QueryCache(self.log_path, None, AppendLogStore(self.log_path, flush_interval=60, max_entries=2),
+                           max_entries=2, semantic=semantic)
+        cache.put("CSE3063 ön koşulu nedir", Answer("CSE1242", [Citation("ders_planı", "Chunk29", 0, 66)]))
+        cache.put("Staj ofisi nerede", Answer("Bilgi bulunamadı.", []))
+
+        answer, matched, score = cache.get_similar("cse3063 dersinin önkoşulu ne?")
+        self.assertEqual((answer.finalText, matched), ("CSE1242", "cse3063 ön koşulu nedir"))
+        self.assertGreater(score, 0.9)
+        self.assertEqual(cache.semantic_hits, 1)
+        self.assertIsNone(cache.get_similar("CSE3044 dersinin önkoşulu ne?"))
+        self.assertIsNone(cache.get_similar("staj ofisi nerededir"))
+        self.assertEqual(embedded.count("cse3063 ön koşulu nedir"), 1)  # satır bir kez kodlanır
+
+        # Depo sınırıyla silinen girdi anlamsal katmandan da düşmeli
+        cache.put("a", Answer("A", [Citation("d", "Chunk0", 0, 0)]))
+        cache.put("b", Answer("B", [Citation("d", "Chunk1", 0, 0)]))
+        cache.save()
+        self.assertIsNone(cache.get_similar("cse3063 dersinin önkoşulu ne?"))
+        self.assertEqual(len(semantic), 2)
+
+        # Yeniden açılışta anlamsal katman yalnızca atıflı cevapların anahtarlarıyla kurulmalı
+        reopened = QueryCache(self.log_path, None, semantic=SemanticCache(0.9, embed_many=embed, dim=4))
+        reopened.load()
+        self.assertEqual((len(reopened.semantic), len(reopened.cache)), (2, 0))
+        cache.close()
+
+    def test_semantic_embedding_does_not_block_exact_tier(self):
+        """Anlamsal katmanın embedding hesabı sürerken put ve birebir get beklememeli"""
+        import threading
+        started, release = threading.Event(), threading.Event()
+
+        def embed(texts):
+            started.set()
+            release.wait(5)
+            return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+        cache = QueryCache(self.log_path, None, semantic=SemanticCache(0.9, embed_many=embed, dim=4), stripes=2)
+        cache.put("staj kaç gün", Answer("30 iş günü", [Citation("staj", "Chunk1", 0, 5)]))
+        lookup = threading.Thread(target=cache.get_similar, args=("staj kaç gündür",))
+        lookup.start()
+        self.assertTrue(started.wait(5))
+
+        done = threading.Event()
+
+        def exact_tier():
+            for i in range(4):
+                cache.put(f"soru {i}", Answer("cevap", [Citation("d", "Chunk0", 0, 0)]))
+                cache.get(f"soru {i}")
+            done.set()
+
+        writer = threading.Thread(target=exact_tier)
+        writer.start()
+        finished = done.wait(2)
+        release.set()
+        lookup.join()
+        writer.join()
+        self.assertTrue(finished)
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(len(cache.semantic), 5)
+        cache.close()
+
+    def test_legacy_json_cache_is_imported(self):
+        """Eski tek-JSON önbellek dosyası ilk açılışta loga aktarılmalı"""
+        import json
+        with open(self.legacy_path, "w", encoding="utf-8") as f:
+            json.dump({"eski soru": {"finalText": "eski cevap", "citations": []}}, f)
+
+        self.assertEqual(self._cache().get("Eski soru").finalText, "eski cevap")
+        self.assertTrue(os.path.exists(self.log_path))
+
+    def test_rebuild_invalidates_only_entries_citing_changed_documents(self):
+        """Yeniden indekslemede yalnızca değişen dokümana atıf yapan ve atıfsız cevaplar düşmeli"""
+        import json
+        manifest_path = os.path.join(self.tmp.name, "manifest.json")
+        files = ["staj.txt", "yonetmelik.txt"]
+
+        def write_manifest(hashes):
+            manifest = IndexerMain.build_manifest(files, hashes, {})
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            return manifest
+
+        first = write_manifest({"staj.txt": "a", "yonetmelik.txt": "b"})
+        cache = QueryCache(self.log_path, None, AppendLogStore(self.log_path),
+                           versions=IndexGeneration(manifest_path, check_interval=0))
+        cache.put("staj kaç gün", Answer("30 iş günü", [Citation("staj", "Chunk1", 0, 5)]))
+        cache.put("devam zorunlu mu", Answer("Evet", [Citation("yonetmelik", "Chunk2", 0, 5)]))
+        cache.put("bilinmeyen soru", Answer("Bilgi bulunamadı.", []))
+        self.assertEqual(cache.cache["staj kaç gün"]["docs"], {"staj": first["documents"]["staj"]})
+
+        second = write_manifest({"staj.txt": "changed", "yonetmelik.txt": "b"})
+        os.utime(manifest_path, ns=(1, 1))  # a new mtime even on coarse-grained filesystems
+        self.assertNotEqual(first["generation"], second["generation"])
+        self.assertEqual(first["documents"]["yonetmelik"], second["documents"]["yonetmelik"])
+
+        self.assertIsNone(cache.get("staj kaç gün"))
+        self.assertIsNone(cache.get("bilinmeyen soru"))
+        self.assertEqual(cache.get("devam zorunlu mu").finalText, "Evet")
+        self.assertEqual(cache.stats()["invalidations"], 2)
+        self.assertNotIn("staj kaç gün", cache.cache)
+        cache.close()
+
+    def test_sqlite_store_shares_entries_between_workers(self):
+        """İki işçi aynı SQLite önbelleğini paylaşmalı; sonradan yazılan cevap diğerinde okunmalı"""
+        db_path = os.path.join(self.tmp.name, "query_cache.sqlite")
+        first = QueryCache(db_path, None, SqliteStore(db_path))
+        second = QueryCache(db_path, None, SqliteStore(db_path))
+        first.put("staj kaç gün", Answer("30 iş günü", [Citation("staj", "Chunk1", 0, 5)]))
+        second.load()
+        self.assertEqual(len(second.cache), 0)  # satırlar ilk sorguda tek tek okunur
+        self.assertEqual(second.get("staj kaç gün").finalText, "30 iş günü")
+
+        second.put("devam zorunlu mu", Answer("Evet", [Citation("yonetmelik", "Chunk2", 0, 5)]))
+        self.assertEqual(first.get("Devam zorunlu mu").finalText, "Evet")
+        self.assertEqual(first.stats()["hits"], 1)
+        self.assertEqual(set(SqliteStore(db_path).load()), {"staj kaç gün", "devam zorunlu mu"})
+        first.close()
+        second.close()
+
+    def test_worker_bounds_do_not_delete_shared_rows(self):
+        """Bir işçinin bellek sınırı, süresi dolan girdiler ve yüklemesi paylaşılan satırları silmemeli"""
+        db_path = os.path.join(self.tmp.name, "query_cache.sqlite")
+        small = QueryCache(db_path, None, SqliteStore(db_path), max_entries=1)
+        for i in range(3):
+            small.put(f"soru {i}", Answer(f"cevap {i}", [Citation("d", "Chunk0", 0, 0)]))
+        small.put("bilinmeyen", Answer("Bilgi bulunamadı.", []))
+        self.assertEqual(len(small.cache), 1)
+        self.assertEqual(small.stats()["evictions"], 3)
+        small.load()
+        self.assertEqual(len(SqliteStore(db_path).load()), 4)
+
+        other = QueryCache(db_path, None, SqliteStore(db_path))
+        self.assertEqual(other.get("soru 0").finalText, "cevap 0")
+        self.assertEqual(len(SqliteStore(db_path).load()), 4)
+        small.close()
+        other.close()
+
+        # The database is bounded by its own policy: expired rows first, then the oldest writes
+        store = SqliteStore(db_path, max_rows=2, prune_interval=1)
+        expired = QueryCache(db_path, None, store, negative_ttl_seconds=-1)
+        expired.put("süresi dolmuş", Answer("Bilgi bulunamadı.", []))
+        self.assertEqual(list(SqliteStore(db_path).load()), ["soru 2", "bilinmeyen"])
+        expired.close()
+
+    def test_idle_log_store_can_be_garbage_collected(self):
+        """Boşta kalan günlük deposu yazıcı iş parçacığı ve atexit kaydı tutmamalı; çöp toplanabilmeli"""
+        import gc
+        import time
+        import weakref
+        store = AppendLogStore(self.log_path, flush_interval=0.01)
+        store.append("soru", {"finalText": "cevap", "citations": []})
+        deadline = time.time() + 5
+        while store._worker is not None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(store._worker)
+        self.assertEqual(list(AppendLogStore(self.log_path).load()), ["soru"])
+
+        ref = weakref.ref(store)
+        del store
+        gc.collect()
+        self.assertIsNone(ref())
+
+        closed = AppendLogStore(self.log_path, flush_interval=60)
+        closed.append("ikinci", {"finalText": "cevap", "citations": []})
+        self.assertTrue(closed._exit_hook)
+        closed.close()
+        self.assertFalse(closed._exit_hook)
+        self.assertEqual(list(AppendLogStore(self.log_path).load()), ["soru", "ikinci"])
+
+    def test_log_is_not_written_by_a_second_process(self):
+        """Günlük dosyasını başka bir süreç kullanırken ikinci süreç ona yazmamalı"""
+        import subprocess
+        import sys
+        owner = AppendLogStore(self.log_path, flush_interval=60)
+        owner.append("ilk", {"finalText": "bir", "citations": []})
+        owner.flush()
+        script = ("import sys; from src.cache import AppendLogStore; s = AppendLogStore(sys.argv[1]); "
+                  "s.append('ikinci', {'finalText': 'iki', 'citations': []}); s.compact({}); s.close()")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", script, self.log_path], cwd=root,
+                                capture_output=True, text=True, encoding="utf-8")
+        self.assertIn("sqlite", result.stdout)
+        self.assertEqual(list(AppendLogStore(self.log_path).load()), ["ilk"])
+        owner.close()
+
+    def test_striped_cache_is_safe_for_threads(self):
+        """Şeritlere bölünmüş önbellek eşzamanlı iş parçacıklarında girdi ve sayaç kaybetmemeli"""
+        import threading
+        cache = QueryCache(self.log_path, None, AppendLogStore(self.log_path, flush_interval=60), stripes=4)
+
+        def worker(n):
+            for i in range(200):
+                cache.put(f"soru {n}-{i}", Answer(f"cevap {i}", [Citation("d", "Chunk0", 0, 0)]))
+                cache.get(f"soru {n}-{i}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(cache.cache), 1600)
+        self.assertEqual((cache.hits, cache.misses), (1600, 0))
+        cache.save()
+        self.assertEqual(len(self._cache().cache), 0)  # loaded lazily
+        reopened = self._cache()
+        reopened.load()
+        self.assertEqual(len(reopened.store.load()), 1600)
+        self.assertEqual(reopened.get("soru 7-199").finalText, "cevap 199")
+        cache.close()
+
+        bounded = QueryCache(self.log_path, None, max_entries=8, stripes=4)
+        for i in range(50):
+            bounded.put(f"soru {i}", Answer("x", [Citation("d", "Chunk0", 0, 0)]))
+        self.assertLessEqual(len(bounded.cache), 8)
+        bounded.close()
+
+
+class StreamingIndexTest(unittest.TestCase):
+    """Diske taşan (spill) postings birleştirmesini test eder"""
+
+    def test_spilled_runs_merge_in_term_and_ordinal_order(self):
+        """Küçük bütçeyle oluşan run'lar sıralı ve eksiksiz birleşmeli"""
+        with tempfile.TemporaryDirectory() as tmp:
+            buffer = SpillingPostingsBuffer(budget_bytes=500, tmp_dir=tmp)
+            expected = {}
+            for ordinal in range(20):
+                for term in ["staj", "madde", "öğrenci", "ders"][: 1 + ordinal % 4]:
+                    buffer.add(term, ordinal, ordinal % 3 + 1)
+                    expected.setdefault(term, ([], []))
+                    expected[term][0].append(ordinal)
+                    expected[term][1].append(ordinal % 3 + 1)
+
+            merged = list(buffer.merged())
+            buffer.close()
+
+        self.assertGreater(len(buffer.runs), 1)
+        self.assertEqual([t for t, _, _ in merged], sorted(expected, key=lambda t: t.encode("utf-8")))
+        for term, ordinals, tfs in merged:
+            self.assertEqual((ordinals, tfs), expected[term])
+
+    def test_json_array_writer_matches_json_dump(self):
+        """Parça parça yazılan JSON, json.dump çıktısıyla birebir aynı olmalı"""
+        import json
+        items = [{"docId": "staj", "chunkId": 0, "rawText": "Staj\nsüresi"}, {"docId": "çap", "chunkId": 1}]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "chunks.json")
+            for payload in (items, []):
+                writer = JsonArrayWriter(path)
+                for item in payload:
+                    writer.write(item)
+                writer.close()
+                with open(path, encoding="utf-8") as f:
+                    self.assertEqual(f.read(), json.dumps(payload, ensure_ascii=False, indent=2))
+
+
+class DenseRetrieverTest(unittest.TestCase):
+    """IVF tabanlı yaklaşık en yakın komşu aramasını test eder"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.vectors = rng.normal(size=(400, 16)).astype(np.float32)
+        self.vectors[5] = 0.0  # embedding'i olmayan chunk
+        self.chunks = [Chunk(f"doc{i // 10}", i % 10, f"metin {i}", 0, 0) for i in range(400)]
+
+    def test_full_probe_equals_brute_force(self):
+        """n_probe tüm listeleri kapsadığında sonuç kaba kuvvet cosine ile aynı olmalı"""
+        ivf = IvfIndex.build(self.vectors, n_lists=12)
+        self.assertEqual(int(ivf.list_offsets[-1]), 400)
+        norms = np.linalg.norm(self.vectors, axis=1)
+        norms[norms == 0] = 1.0
+
+        for q in self.vectors[[0, 17, 250]]:
+            ordinals, scores = ivf.search(q, self.vectors, 10, n_probe=12)
+            brute = (self.vectors @ q) / (norms * np.linalg.norm(q))
+            self.assertEqual(ordinals.tolist(), np.argsort(-brute, kind="stable")[:10].tolist())
+            self.assertTrue(np.allclose(scores, brute[ordinals], atol=1e-5))
+            self.assertNotIn(5, ordinals.tolist())
+
+    def test_save_load_and_dense_retrieval(self):
+        """Kaydedilen indeks yüklenmeli; DenseRetriever doğru chunk'ı Hit olarak döndürmeli"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ann_ivf.npz")
+            IvfIndex.build(self.vectors, n_lists=8).save(path)
+            ivf = IvfIndex.load(path, n_probe=2)
+
+        retriever = DenseRetriever(self.chunks, self.vectors, ivf)
+        with patch('src.impl.get_embedding', return_value=self.vectors[123].tolist()):
+            hits = retriever.retrieve(["staj", "süresi"], KeywordIndex(), top_k=3)
+
+        self.assertEqual(len(hits), 3)
+        self.assertEqual((hits[0].docId, hits[0].chunkId), ("doc12", 3))
+        self.assertAlmostEqual(hits[0].score, 1.0, places=5)
+        self.assertGreaterEqual(hits[0].score, hits[1].score)
+        self.assertEqual(DenseRetriever(self.chunks, self.vectors, ivf).retrieve([], KeywordIndex()), [])
+
+
+class HybridRetrieverTest(unittest.TestCase):
+    """Keyword ve dense bacaklarının eşzamanlı çalışıp birleştirilmesini test eder"""
+
+    @staticmethod
+    def _leg(hits, delay=0.0):
+        import time
+        leg = MagicMock()
+        leg.retrieve.side_effect = lambda terms, index, k: (time.sleep(delay), [Hit(h.docId, h.chunkId, h.score, embedding=h.embedding) for h in hits])[1]
+        return leg
+
+    def test_reciprocal_rank_fusion(self):
+        """İki bacakta da üst sıralarda olan chunk RRF ile en üste çıkmalı"""
+        keyword = self._leg([Hit("a", 0, 3000.0), Hit("b", 0, 2000.0), Hit("c", 0, 1000.0)])
+        dense = self._leg([Hit("d", 0, 0.9, embedding=[1.0]), Hit("b", 0, 0.8, embedding=[2.0])])
+
+        hits = HybridRetriever(keyword, dense).retrieve(["staj"], KeywordIndex())
+        self.assertEqual([(h.docId, h.chunkId) for h in hits][:1], [("b", 0)])
+        self.assertEqual(len(hits), 4)
+        self.assertEqual(hits[0].embedding, [2.0])  # dense bacağın embedding'i korunmalı
+        self.assertAlmostEqual(hits[0].score, 1 / 62 + 1 / 62)
+
+    def test_weighted_fusion(self):
+        """Ağırlıklı birleştirmede normalize skorlar ağırlıklarla toplanmalı"""
+        keyword = self._leg([Hit("a", 0, 10.0), Hit("b", 0, 0.0)])
+        dense = self._leg([Hit("b", 0, 0.5), Hit("a", 0, 0.1)])
+
+        hits = HybridRetriever(keyword, dense, fusion="weighted", keyword_weight=0.3, dense_weight=0.7).retrieve(
+            ["staj"], KeywordIndex(), top_k=1)
+        self.assertEqual([(h.docId, h.score) for h in hits], [("b", 0.7)])
+
+    def test_slow_leg_returns_partial_results(self):
+        """Süre bütçesini aşan bacak atlanmalı, diğer bacağın sonuçları dönmeli"""
+        keyword = self._leg([Hit("a", 0, 1000.0)])
+        dense = self._leg([Hit("d", 0, 0.9)], delay=0.5)
+        events = []
+        with patch('src.impl.TraceBus.push_full', side_effect=lambda *a: events.append(a)):
+            hits = HybridRetriever(keyword, dense, leg_budget_ms=50).retrieve(["staj"], KeywordIndex())
+
+        self.assertEqual([h.docId for h in hits], ["a"])
+        self.assertTrue(any("dense" in e[2] for e in events))
+
+    def test_factory_wires_legs_from_config(self):
+        """keyword_leg yalnızca hibrit keyword bacağını seçmeli; dense retriever ikinci kez kurulmamalı"""
+        dense = DenseRetriever([], np.zeros((0, 0), dtype=np.float32), None)
+        with patch('src.factory.PipelineFactory._create_dense_retriever', return_value=dense) as create_dense:
+            plain = PipelineFactory._create_retriever([], {"type": "keyword", "keyword_leg": "bm25"}, "simple")
+            self.assertIs(type(plain), KeywordRetriever)
+            self.assertIsInstance(PipelineFactory._create_retriever([], {"type": "bm25"}, "simple"), BM25Retriever)
+            create_dense.assert_not_called()
+
+            hybrid = PipelineFactory._create_retriever([], {"type": "hybrid", "keyword_leg": "bm25"}, "simple")
+            self.assertIsInstance(hybrid.legs[0][1], BM25Retriever)
+            self.assertIs(hybrid.legs[1][1], dense)
+
+            create_dense.reset_mock()
+            reused = PipelineFactory._create_retriever([], {"type": "dense"}, "hybrid")
+            create_dense.assert_called_once()
+            self.assertIs(type(reused.legs[0][1]), KeywordRetriever)
+            self.assertIs(reused.legs[1][1], dense)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file